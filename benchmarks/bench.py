@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Offline benchmarks replaying recorded SERPs and result pages, results are printed as JSON.
+
+    python -m benchmarks.bench micro
+    python -m benchmarks.bench e2e --engine bing --concurrency 1 4 8 --requests 40
+    python -m benchmarks.bench all --output run.json --baseline previous.json
+
+`e2e` drives POST /search with Chrome navigating the local fixture server,
+`micro` times SERP parsing, `_filter_results`, `_collect_results`, Goose extraction and the metric updates of a search.
+With --baseline, medians, p95 latencies and throughputs worse than --tolerance exit with status 1.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+from benchmarks.common import AppServer, drive, run_meta, step_report
+from benchmarks.fixture_server import ENGINES, FixtureServer, load_fixture
+from search_engines.results import SearchResults
+
+QUERY = 'python asyncio'
+
+
+def _engine_class(name):
+    from search_engines.engines import Bing, Google, Duckduckgo
+    return {'bing': Bing, 'google': Google, 'duckduckgo': Duckduckgo}[name]
+
+
+def _time(func, repeat, number):
+    """Returns the per call timings of func, in microseconds."""
+    runs = [t / number * 1e6 for t in timeit.Timer(func).repeat(repeat, number)]
+    return {
+        'min_us': round(min(runs), 3),
+        'median_us': round(statistics.median(runs), 3),
+        'mean_us': round(statistics.mean(runs), 3),
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def request_metrics(results=10):
+    """Makes the metric updates of a search enhancing `results` results, to time the instrumentation."""
+    from search_engines.metrics import FUNCTION_SECONDS, BROWSER_CONTEXTS_IN_USE, BROWSER_NAVIGATION, \
+        SELECTOR_WAIT, SERP_PARSE, ENHANCEMENT_FETCH, EXTRACTION, SERIALIZATION
+
+    BROWSER_CONTEXTS_IN_USE.inc()
+    for stage in (BROWSER_NAVIGATION, SELECTOR_WAIT, SERP_PARSE):
+        with stage.time():
+            pass
+    BROWSER_CONTEXTS_IN_USE.dec()
+    for _ in range(results):
+        for stage in (ENHANCEMENT_FETCH, EXTRACTION):
+            with stage.time():
+                pass
+    with SERIALIZATION.time():
+        pass
+    FUNCTION_SECONDS.labels('asearch').observe(0.5)
+
+
+def bench_micro(repeat=5, number=50):
+    results = {}
+    for name in ENGINES:
+        engine = _engine_class(name)()
+        engine._query = QUERY
+        engine.ignore_duplicate_urls = True
+        html = load_fixture(name + '.html').replace('{base}', 'http://127.0.0.1')
+        soup = BeautifulSoup(html, features='lxml')
+        items = engine._filter_results(soup)
+        # a deep search worth of results, half of them duplicates
+        many_items = [dict(item, link='{}?n={}'.format(item['link'], i // 2))
+                      for i in range(20) for item in items]
+
+        def collect(items):
+            engine.results = SearchResults()
+            engine._collect_results(items)
+
+        results[name + '.parse'] = _time(lambda: BeautifulSoup(html, features='lxml'), repeat, number)
+        results[name + '._filter_results'] = _time(lambda: engine._filter_results(soup), repeat, number)
+        results[name + '._collect_results'] = _time(lambda: collect(items), repeat, number)
+        results[name + '._collect_results[{}]'.format(len(many_items))] = _time(
+            lambda: collect(many_items), repeat, number)
+
+    from goose3 import Goose
+    from goose3.text import StopWordsChinese
+    goose = Goose({"stopwords_class": StopWordsChinese})
+    article = load_fixture('article.html').replace('{title}', 'Recorded article')
+    results['goose.extract'] = _time(lambda: goose.extract(raw_html=article), repeat, max(1, number // 10))
+    # the overhead of the /metrics instrumentation per search, to compare with the e2e latencies
+    results['metrics.request'] = _time(request_metrics, repeat, number)
+    return results
+
+
+async def bench_e2e(engine_name='bing', concurrencies=(1, 4), requests=20, latency=0.0):
+    import web_search
+    from search_engines.cache import PageCache, SerpCache
+
+    steps = []
+    with FixtureServer(latency=latency) as fixtures:
+        engine = _engine_class(engine_name)()
+        engine._base_url = fixtures.base_url(engine_name)
+        engine._delay = (0, 0)
+        web_search.wsaio.engine = engine
+        # the same query is replayed, measure searches rather than cache hits
+        web_search.wsaio.serp_cache = SerpCache(max_size=0)
+        web_search.wsaio.page_cache = PageCache(max_size=0)
+
+        with AppServer(web_search.app) as server:
+            url = server.origin + '/search'
+            # the first request launches Chrome
+            await drive(url, 1, 1, params={'query': QUERY})
+            for concurrency in concurrencies:
+                latencies, errors, wall = await drive(url, concurrency, requests, params={'query': QUERY})
+                steps.append(step_report(concurrency, latencies, errors, wall))
+
+            await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(engine._persistent_browser.stop(), server.loop))
+    return {engine_name: steps}
+
+
+def compare(baseline, current, tolerance):
+    """Returns the regressions of current against baseline, as messages."""
+    regressions = []
+    for name, timing in current.get('micro', {}).items():
+        before = baseline.get('micro', {}).get(name)
+        if before and timing['median_us'] > before['median_us'] * (1 + tolerance):
+            regressions.append('{}: median {}us -> {}us'.format(name, before['median_us'], timing['median_us']))
+
+    for engine, steps in current.get('e2e', {}).items():
+        before_steps = {s['concurrency']: s for s in baseline.get('e2e', {}).get(engine, [])}
+        for step in steps:
+            before = before_steps.get(step['concurrency'])
+            if not before or not step['latency_ms'] or not before['latency_ms']:
+                continue
+            name = '{}@{}'.format(engine, step['concurrency'])
+            if step['latency_ms']['p95'] > before['latency_ms']['p95'] * (1 + tolerance):
+                regressions.append('{}: p95 {}ms -> {}ms'.format(
+                    name, before['latency_ms']['p95'], step['latency_ms']['p95']))
+            if step['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+                regressions.append('{}: throughput {}rps -> {}rps'.format(
+                    name, before['throughput_rps'], step['throughput_rps']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline WebSearchAIO benchmarks')
+    parser.add_argument('suite', choices=['micro', 'e2e', 'all'])
+    parser.add_argument('--engine', choices=ENGINES, default='bing')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--requests', type=int, default=20, help='requests per concurrency step')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added by the fixture server')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=50)
+    parser.add_argument('--output', help='write the JSON results to a file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    report = {'meta': run_meta()}
+    if args.suite in ('micro', 'all'):
+        report['micro'] = bench_micro(args.repeat, args.number)
+    if args.suite in ('e2e', 'all'):
+        report['e2e'] = asyncio.run(bench_e2e(args.engine, args.concurrency, args.requests, args.latency))
+
+    data = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(data + '\n')
+    print(data)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression, file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
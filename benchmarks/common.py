@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import platform
+import socket
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+
+import aiohttp
+import uvicorn
+
+
+def percentile(sorted_values, q):
+    """Returns the q-th percentile (0-100) of sorted values, linearly interpolated."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def latency_summary(latencies):
+    """Returns the latency percentiles of a list of seconds, in milliseconds."""
+    values = sorted(latencies)
+    if not values:
+        return {}
+    return {
+        'p50': round(percentile(values, 50) * 1000, 3),
+        'p90': round(percentile(values, 90) * 1000, 3),
+        'p95': round(percentile(values, 95) * 1000, 3),
+        'p99': round(percentile(values, 99) * 1000, 3),
+        'max': round(values[-1] * 1000, 3),
+        'mean': round(sum(values) / len(values) * 1000, 3),
+    }
+
+
+def run_meta():
+    """Returns what identifies a run: time, host and code revision."""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        revision = None
+    return {
+        'time': datetime.now(timezone.utc).isoformat(),
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class AppServer(object):
+    """Runs an ASGI app with uvicorn on its own event loop thread, as a worker would."""
+
+    def __init__(self, app, port=None):
+        self.port = port or free_port()
+        self.origin = 'http://127.0.0.1:{}'.format(self.port)
+        self.loop = None
+        self._server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=self.port, log_level='warning'))
+        self._thread = None
+
+    def start(self, timeout=30):
+        self._thread = threading.Thread(target=self._run, name='app-server', daemon=True)
+        self._thread.start()
+        deadline = time.time() + timeout
+        while not self._server.started:
+            if time.time() > deadline or not self._thread.is_alive():
+                raise RuntimeError('App server failed to start')
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._server.serve())
+
+
+async def drive(url, concurrency, requests, params=None, method='POST', timeout=120):
+    """
+    Sends requests to url from concurrency clients.
+    Returns the latencies of the successful requests, the number of errors and the wall time.
+    """
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def client(session):
+        nonlocal errors
+        for i in remaining:
+            start = time.perf_counter()
+            try:
+                async with session.request(method, url, params=params(i) if callable(params) else params) as r:
+                    await r.read()
+                    if r.status != 200:
+                        errors += 1
+                        continue
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(session) for _ in range(concurrency)])
+        wall = time.perf_counter() - start
+    return latencies, errors, wall
+
+
+def step_report(concurrency, latencies, errors, wall):
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall, 3) if wall else None,
+        'latency_ms': latency_summary(latencies),
+    }
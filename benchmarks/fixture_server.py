@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local server replaying recorded SERPs and result pages.
+
+    /{engine}/search, /{engine}/html/   the recorded SERP of bing, google or duckduckgo
+    /article/{n}                        the recorded result page, titled by n
+
+Recorded files keep `{base}` in place of the server origin, so result links point back here.
+
+    python -m benchmarks.fixture_server serve --port 8765
+    python -m benchmarks.fixture_server record bing "python asyncio"
+"""
+
+import argparse
+import asyncio
+import os
+import threading
+
+from aiohttp import web
+from bs4 import BeautifulSoup
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+ENGINES = ('bing', 'google', 'duckduckgo')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class FixtureServer(object):
+    """Serves the fixtures on 127.0.0.1 from a background thread."""
+
+    def __init__(self, port=0, latency=0.0):
+        """
+        :param int port: optional, 0 picks a free port
+        :param float latency: optional, seconds added to every response to mimic a remote site
+        """
+        self.port = port
+        self.latency = latency
+        self.origin = None
+        self._serps = {engine: load_fixture(engine + '.html') for engine in ENGINES}
+        self._article = load_fixture('article.html')
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._started = threading.Event()
+
+    def base_url(self, engine):
+        """Returns the base URL to give an engine so that it searches this server."""
+        return '{}/{}'.format(self.origin, engine)
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/{engine}/search', self._serp)
+        app.router.add_route('*', '/{engine}/html/', self._serp)
+        app.router.add_get('/article/{n}', self._article_page)
+        return app
+
+    async def _serp(self, request):
+        engine = request.match_info['engine']
+        if engine not in self._serps:
+            raise web.HTTPNotFound()
+        await asyncio.sleep(self.latency)
+        return web.Response(text=self._serps[engine].replace('{base}', self.origin), content_type='text/html')
+
+    async def _article_page(self, request):
+        await asyncio.sleep(self.latency)
+        title = 'Recorded article {}'.format(request.match_info['n'])
+        return web.Response(text=self._article.replace('{title}', title), content_type='text/html')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='fixture-server', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, '127.0.0.1', self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.origin = 'http://127.0.0.1:{}'.format(self.port)
+        self._started.set()
+        self._loop.run_forever()
+
+
+async def record(engine_name, query, path=None):
+    """Saves a live SERP as a fixture, with its result links pointing to the recorded article."""
+    from search_engines.engines import Bing, Google, Duckduckgo
+
+    engine = {'bing': Bing, 'google': Google, 'duckduckgo': Duckduckgo}[engine_name]()
+    engine._query = query
+    request = engine._first_page()
+    async with engine._persistent_browser as browser:
+        response = await browser.get_raw_html(request['url'], engine.content_selector)
+
+    soup = BeautifulSoup(response.html, features='lxml')
+    for n, tag in enumerate(soup.select(engine._selectors('links')), 1):
+        for link in tag.select(engine._selectors('url')):
+            link['href'] = '{base}/article/' + str(n)
+    for script in soup.select('script'):
+        script.decompose()
+
+    path = path or os.path.join(FIXTURES_DIR, engine_name + '.html')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(str(soup))
+    print('Recorded {} results to {}'.format(len(soup.select(engine._selectors('links'))), path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay recorded SERPs and result pages')
+    subparsers = parser.add_subparsers(dest='command')
+    serve_parser = subparsers.add_parser('serve', help='serve the fixtures (default)')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--latency', type=float, default=0.0)
+    record_parser = subparsers.add_parser('record', help='record a live SERP as a fixture')
+    record_parser.add_argument('engine', choices=ENGINES)
+    record_parser.add_argument('query')
+    record_parser.add_argument('--path')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        asyncio.run(record(args.engine, args.query, args.path))
+    else:
+        server = FixtureServer(getattr(args, 'port', 8765), getattr(args, 'latency', 0.0)).start()
+        print('Serving fixtures on ' + server.origin)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.stop()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Load test of the /search app and capacity report, printed as JSON.
+
+    python -m benchmarks.loadtest
+    python -m benchmarks.loadtest --max-concurrency 128 --duration 20 --serp-latency 0.8
+    python -m benchmarks.loadtest --browser
+
+One worker is run in process against a stub search backend: SERPs come from the local
+fixture server after --serp-latency seconds instead of a Chrome navigation (unless --browser),
+result pages are fetched and extracted as usual. Concurrency grows by --factor until throughput
+stops growing, p95 latency exceeds --slo or errors appear, then the worker settings
+of gunicorn_config_*.py and the browser pool size are recommended for this host.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+import aiohttp
+
+from benchmarks.common import AppServer, drive, latency_summary, run_meta, step_report
+from benchmarks.fixture_server import FixtureServer
+from search_engines.persistent_browser import Response
+
+QUERY = 'python asyncio'
+
+
+class StubBrowser(object):
+    """Stands in for PersistentBrowser, fetching SERPs over HTTP after a simulated navigation time."""
+
+    def __init__(self, latency):
+        self.browser = None
+        self.latency = latency
+        self.response = Response
+        self._session = None
+
+    async def start(self):
+        self.browser = self._session = aiohttp.ClientSession()
+
+    async def warm(self):
+        await self.start()
+
+    async def stop(self):
+        if self._session is not None:
+            await self._session.close()
+            self.browser = self._session = None
+
+    async def get_raw_html(self, request_url, content_selector, block_selectors=(), block_urls=()):
+        await asyncio.sleep(self.latency)
+        async with self._session.get(request_url) as response:
+            return self.response(http=response.status, html=await response.text())
+
+
+class LoopLagProbe(object):
+    """Measures from another thread how late callbacks scheduled on an event loop run."""
+
+    def __init__(self, loop, interval=0.05):
+        self.loop = loop
+        self.interval = interval
+        self.lags = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='lag-probe', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.lags
+
+    def _run(self):
+        while not self._stop.is_set():
+            scheduled = time.perf_counter()
+            self.loop.call_soon_threadsafe(lambda t=scheduled: self.lags.append(time.perf_counter() - t))
+            self._stop.wait(self.interval)
+
+
+def rss_bytes(pid='self'):
+    try:
+        with open('/proc/{}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return 0
+
+
+def chrome_processes():
+    """Returns the pids of the running Chrome processes."""
+    pids = []
+    for pid in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/{}/cmdline'.format(pid), 'rb') as f:
+                executable = f.read().split(b'\0')[0]
+        except (IOError, OSError):
+            continue
+        name = os.path.basename(executable).lower()
+        if b'chrome' in name or b'chromium' in name or b'headless_shell' in name:
+            pids.append(int(pid))
+    return pids
+
+
+def available_memory():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def find_saturation(steps, slo_ms, min_gain=0.1):
+    """Returns the last step before throughput stops growing by min_gain, p95 exceeds slo_ms or errors appear."""
+    best = None
+    for step in steps:
+        failing = step['errors'] > 0 or not step['latency_ms'] or step['latency_ms']['p95'] > slo_ms
+        if failing:
+            break
+        if best is not None and step['throughput_rps'] < best['throughput_rps'] * (1 + min_gain):
+            break
+        best = step
+    return best
+
+
+def recommend(saturation, worker_rss, chrome_rss, browser):
+    """Recommends gunicorn and browser pool settings for this host."""
+    cpus = os.cpu_count() or 1
+    memory = available_memory()
+    per_worker = worker_rss + chrome_rss
+    workers = cpus
+    if memory and per_worker:
+        # keep 30% of the available memory for spikes and the page cache
+        workers = max(1, min(cpus, int(memory * 0.7 // per_worker)))
+    concurrency = saturation['concurrency'] if saturation else 1
+    recommendation = {
+        'workers': workers,
+        'threads': 1,
+        'worker_connections': int(math.ceil(concurrency * 1.5)),
+        'estimated_capacity_rps': round(workers * saturation['throughput_rps'], 3) if saturation else None,
+        'notes': [
+            'UvicornWorker runs one event loop per worker, the threads setting is not used by it.',
+            'worker_connections leaves 50% headroom over the saturation concurrency of one worker.',
+        ],
+    }
+    if browser:
+        recommendation['BROWSER_POOL_SIZE'] = max(1, concurrency)
+    else:
+        recommendation['notes'].append('Run with --browser to size BROWSER_POOL_SIZE against Chrome.')
+    return recommendation
+
+
+async def run(args):
+    import web_search
+    from search_engines.cache import PageCache, SerpCache
+    from search_engines.engines import Bing
+
+    steps = []
+    with FixtureServer(latency=args.page_latency) as fixtures:
+        engine = Bing()
+        engine._base_url = fixtures.base_url('bing')
+        engine._delay = (0, 0)
+        if not args.browser:
+            engine._persistent_browser = StubBrowser(args.serp_latency)
+        web_search.wsaio.engine = engine
+        # the same query is replayed, measure searches rather than cache hits
+        web_search.wsaio.serp_cache = SerpCache(max_size=0)
+        web_search.wsaio.page_cache = PageCache(max_size=0)
+
+        with AppServer(web_search.app) as server:
+            url = server.origin + '/search'
+            await drive(url, 1, 1, params={'query': QUERY})
+            rss_before = rss_bytes()
+
+            concurrency = args.start_concurrency
+            while concurrency <= args.max_concurrency:
+                probe = LoopLagProbe(server.loop).start()
+                chrome_peak, rss_peak = 0, 0
+                sampling = True
+
+                async def sample():
+                    nonlocal chrome_peak, rss_peak
+                    while sampling:
+                        chrome_peak = max(chrome_peak, len(chrome_processes()))
+                        rss_peak = max(rss_peak, rss_bytes())
+                        await asyncio.sleep(0.5)
+
+                sampler = asyncio.ensure_future(sample())
+                requests = max(concurrency, int(concurrency * args.duration / max(args.serp_latency, 0.1)))
+                latencies, errors, wall = await drive(url, concurrency, requests, params={'query': QUERY})
+                sampling = False
+                await sampler
+
+                step = step_report(concurrency, latencies, errors, wall)
+                step['event_loop_lag_ms'] = latency_summary(probe.stop())
+                step['rss_mb'] = round(rss_peak / 2 ** 20, 1)
+                step['chrome_processes'] = chrome_peak
+                steps.append(step)
+                print('concurrency {:<5} {:>8} rps  p95 {:>10} ms  errors {}'.format(
+                    concurrency, step['throughput_rps'], step['latency_ms'].get('p95'), errors), file=sys.stderr)
+
+                saturation = find_saturation(steps, args.slo)
+                if saturation is not steps[-1]:
+                    break
+                concurrency = int(math.ceil(concurrency * args.factor))
+
+            chrome_rss = sum(rss_bytes(pid) for pid in chrome_processes())
+            await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(engine._persistent_browser.stop(), server.loop))
+
+    saturation = find_saturation(steps, args.slo)
+    worker_rss = max(step['rss_mb'] for step in steps) * 2 ** 20
+    return {
+        'meta': dict(run_meta(), browser=args.browser, serp_latency=args.serp_latency,
+                     page_latency=args.page_latency, slo_ms=args.slo),
+        'steps': steps,
+        'saturation': saturation,
+        'worker': {
+            'rss_mb_idle': round(rss_before / 2 ** 20, 1),
+            'rss_mb_peak': round(worker_rss / 2 ** 20, 1),
+            'chrome_rss_mb': round(chrome_rss / 2 ** 20, 1),
+        },
+        'recommendation': recommend(saturation, worker_rss, chrome_rss, args.browser),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test /search and recommend worker settings')
+    parser.add_argument('--browser', action='store_true', help='navigate the fixture SERPs with Chrome')
+    parser.add_argument('--serp-latency', type=float, default=0.5, help='seconds of a stub SERP navigation')
+    parser.add_argument('--page-latency', type=float, default=0.1, help='seconds to serve a result page')
+    parser.add_argument('--start-concurrency', type=int, default=1)
+    parser.add_argument('--max-concurrency', type=int, default=256)
+    parser.add_argument('--factor', type=float, default=2.0)
+    parser.add_argument('--duration', type=float, default=10.0, help='approximate seconds per step')
+    parser.add_argument('--slo', type=float, default=10000.0, help='p95 latency limit in milliseconds')
+    parser.add_argument('--output', help='write the JSON report to a file')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    data = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(data + '\n')
+    print(data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Searches a file of queries, one per line, and streams the results to a JSON Lines or Parquet file.
+
+    python bulk_search.py queries.txt -o results.jsonl
+    python bulk_search.py queries.txt -o results.parquet --concurrency 4 --rate 0.5 --pages 2 --no-enhance
+
+Progress is checkpointed next to the output (results.jsonl.checkpoint): running the same command
+again after a crash or an interruption skips the queries already done. Queries hit by a ban are
+not checkpointed, they are searched again on resume. Parquet output is converted from the JSON Lines
+file once every query is done, and requires pyarrow.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+
+import aiohttp
+
+from search_engines.config import BATCH_CONCURRENCY, SEARCH_ENGINE_RESULTS_PAGES, SERP_RATE_BURST
+from search_engines.http_pool import close_sessions
+from search_engines.output import console, Level
+from search_engines.query import cache_key
+from search_engines.ratelimit import set_rate_limit
+
+
+def read_queries(path):
+    """Returns the distinct queries of a file, skipping blank lines and # comments."""
+    queries = {}
+    with io.open(path, encoding='utf-8') as f:
+        for line in f:
+            query = line.strip()
+            if query and not query.startswith('#'):
+                queries.setdefault(cache_key(query), query)
+    return list(queries.values())
+
+
+def set_rate_limits(wsaio, rate, burst=SERP_RATE_BURST):
+    """Limits the SERP navigations of every engine a run may search: the engine, and its fallbacks while degraded."""
+    for name in wsaio.engines:
+        set_rate_limit(name, rate, burst)
+
+
+class Checkpoint(object):
+    """
+    Appends a line per finished query with the size of the results file once its results were written.
+    On resume the results file is truncated to the last recorded size, dropping the results of a query
+    interrupted while being written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.offset = 0
+        if os.path.exists(path):
+            with io.open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # a line cut by a crash
+                    self.done.add(record['key'])
+                    self.offset = record['offset']
+        self._file = None
+
+    def open(self):
+        self._file = io.open(self.path, 'a', encoding='utf-8')
+
+    def record(self, query, offset, results):
+        self._file.write(json.dumps({'key': cache_key(query), 'query': query, 'results': results,
+                                     'offset': offset}, ensure_ascii=False) + u'\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class Progress(object):
+    """Counts searches and prints the throughput and the ban rate of the run."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.results = 0
+        self.banned = 0
+        self.failed = 0
+        self.started_at = time.perf_counter()
+
+    @property
+    def ban_rate(self):
+        searched = self.done + self.banned + self.failed
+        return self.banned / searched if searched else 0.0
+
+    def line(self):
+        elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+        return u'{}/{} queries  {:.2f} queries/s  {:.1f} results/s  banned {} ({:.1%})  failed {}'.format(
+            self.done, self.total, self.done / elapsed, self.results / elapsed,
+            self.banned, self.ban_rate, self.failed)
+
+    async def report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            console(self.line())
+
+
+async def run(args):
+    from web_search import wsaio
+
+    queries = read_queries(args.queries)
+    jsonl_path = args.output if not args.output.endswith('.parquet') else args.output[:-len('.parquet')] + '.jsonl'
+    checkpoint = Checkpoint(args.checkpoint or args.output + '.checkpoint')
+    pending_queries = [query for query in queries if cache_key(query) not in checkpoint.done]
+    console(u'{} queries, {} already done'.format(len(queries), len(queries) - len(pending_queries)))
+
+    if args.rate:
+        set_rate_limits(wsaio, args.rate, args.burst)
+    wsaio.engine.ignore_duplicate_urls = True
+
+    mode = 'r+b' if os.path.exists(jsonl_path) else 'wb'
+    progress = Progress(len(pending_queries))
+    semaphore = asyncio.Semaphore(args.concurrency)
+    write_lock = asyncio.Lock()
+    stopping = asyncio.Event()
+
+    with open(jsonl_path, mode) as results_file:
+        results_file.truncate(checkpoint.offset)
+        results_file.seek(checkpoint.offset)
+        checkpoint.open()
+
+        async def search_one(query, session, pending):
+            if stopping.is_set():
+                return
+            async with semaphore:
+                if stopping.is_set():
+                    return
+                engine = wsaio.route_engine()
+                try:
+                    search_results = list(await engine.search(query, max_pages=args.pages))
+                except Exception as e:
+                    progress.failed += 1
+                    logging.error(f"Error occurred when searching '{query}' in bulk: {e}")
+                    return
+            if engine.is_banned:
+                progress.banned += 1
+                if progress.banned + progress.done >= args.min_queries and progress.ban_rate > args.max_ban_rate:
+                    console(u'Ban rate over {:.0%}, stopping, run again later to resume'.format(args.max_ban_rate),
+                            level=Level.error)
+                    stopping.set()
+                return
+
+            if args.enhance:
+                search_results = await wsaio.search_result_enhancement(search_results, session, pending, query)
+                for res in search_results:
+                    pending.pop(res['link'], None)  # bulk queries rarely share pages, keep memory flat
+
+            engine_name = engine.__class__.__name__
+            data = u''.join(json.dumps(dict(res, query=query, engine=engine_name), ensure_ascii=False) + u'\n'
+                            for res in search_results).encode('utf-8')
+            async with write_lock:
+                results_file.write(data)
+                results_file.flush()
+                os.fsync(results_file.fileno())
+                checkpoint.record(query, results_file.tell(), len(search_results))
+            progress.done += 1
+            progress.results += len(search_results)
+
+        reporter = asyncio.ensure_future(progress.report(args.report_interval))
+        try:
+            if wsaio.needs_browser:
+                await wsaio.engine._persistent_browser.start()
+            async with aiohttp.ClientSession() as session:
+                pending = {}
+                await asyncio.gather(*[search_one(query, session, pending) for query in pending_queries])
+        finally:
+            reporter.cancel()
+            checkpoint.close()
+            await wsaio.engine._persistent_browser.stop()
+            await close_sessions()
+            console(progress.line())
+
+    remaining = len(pending_queries) - progress.done
+    if remaining:
+        console(u'{} queries not done, run the same command again to resume'.format(remaining), level=Level.warning)
+    elif args.output.endswith('.parquet'):
+        write_parquet_from_jsonl(jsonl_path, args.output)
+    return remaining
+
+
+def write_parquet_from_jsonl(jsonl_path, path):
+    try:
+        import pyarrow.json as pa_json
+        import pyarrow.parquet as pq
+    except ImportError:
+        console(u'pyarrow is required for Parquet output, results are in ' + jsonl_path, level=Level.error)
+        return
+    if not os.path.getsize(jsonl_path):
+        console(u'No results to convert, ' + jsonl_path + u' is empty', level=Level.warning)
+        return
+    pq.write_table(pa_json.read_json(jsonl_path), path)
+    console(u'Output file: ' + path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search a file of queries, resuming where a previous run stopped')
+    parser.add_argument('queries', help='file of queries, one per line')
+    parser.add_argument('-o', '--output', required=True, help='results file, .jsonl or .parquet')
+    parser.add_argument('--checkpoint', help='checkpoint file, OUTPUT.checkpoint by default')
+    parser.add_argument('--pages', type=int, default=SEARCH_ENGINE_RESULTS_PAGES, help='SERP pages per query')
+    parser.add_argument('--concurrency', type=int, default=BATCH_CONCURRENCY, help='queries searched at once')
+    parser.add_argument('--rate', type=float, help='maximum SERP navigations per second')
+    parser.add_argument('--burst', type=int, default=SERP_RATE_BURST, help='navigations allowed at once by --rate')
+    parser.add_argument('--no-enhance', dest='enhance', action='store_false',
+                        help='keep the SERP snippets instead of extracting result pages')
+    parser.add_argument('--max-ban-rate', type=float, default=0.5, help='stop when the share of banned queries exceeds it')
+    parser.add_argument('--min-queries', type=int, default=10, help='queries searched before the ban rate is checked')
+    parser.add_argument('--report-interval', type=float, default=10.0, help='seconds between progress lines')
+    args = parser.parse_args()
+
+    remaining = asyncio.run(run(args))
+    raise SystemExit(1 if remaining else 0)
+
+
+if __name__ == '__main__':
+    main()
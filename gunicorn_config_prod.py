@@ -1,5 +1,6 @@
 import multiprocessing
 import os
+import shutil
 from datetime import datetime
 
 # 监听内网端口
@@ -42,6 +43,17 @@ capture_output = True
 # 设置日志记录水平
 loglevel = 'info'
 
+# 各工作进程的监控指标快照目录, /metrics 汇总所有工作进程的指标
+metrics_dir = os.path.abspath('./flagged/metrics')
+os.environ['WSAIO_METRICS_DIR'] = metrics_dir
+
+
+def on_starting(server):
+    # 清空上次运行留下的指标快照
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
 # python程序
 # pythonpath = ''
 
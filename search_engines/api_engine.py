@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import logging
+
+import aiohttp
+
+from search_engines.config import PROXY, TIMEOUT
+from search_engines.engine import SearchEngine
+from search_engines.health import engine_health
+from search_engines.http_pool import http_session
+from search_engines.metrics import SERP_PARSE
+from search_engines.output import console
+from search_engines.persistent_browser import Response
+from search_engines.tracing import span
+
+
+class ApiSearchEngine(SearchEngine):
+    """
+    The base class of the engines of search APIs answering JSON over HTTP, searched through
+    the pooled aiohttp session without a browser. Pages are numbered, a page without result is the last one.
+    """
+
+    needs_browser = False
+    predictable_pagination = True
+    opt_in = True
+
+    def __init__(self, proxy=PROXY, timeout=TIMEOUT):
+        super(ApiSearchEngine, self).__init__(proxy, timeout)
+        self._delay = (0, 0)
+
+    def _headers(self):
+        """Returns the headers of the API requests."""
+        return {'Accept': 'application/json'}
+
+    def _decode(self, response):
+        """Returns the answer of the API."""
+        return json.loads(response.html)
+
+    def _results_of(self, data):
+        """Returns the result items of an API answer."""
+        raise NotImplementedError()
+
+    def _has_next_page(self, data, items):
+        """Checks if a page follows the page of an API answer."""
+        return bool(items)
+
+    def _first_page(self):
+        return self._page_request(1)
+
+    def _next_page(self, tags):
+        return self._page_request(self._page + 1)
+
+    async def _fetch(self, page: str, content_selector: str, data=None):
+        """Gets an API answer, GET or POST of a JSON body."""
+        try:
+            session = http_session()
+            async with session.request('POST' if data is not None else 'GET', page, json=data,
+                                       headers=self._headers()) as response:
+                return Response(http=response.status, html=await response.text())
+        except asyncio.TimeoutError:
+            return Response(http=0, html='Timeout of the search API {}'.format(self._base_url))
+        except aiohttp.ClientError as e:
+            return Response(http=0, html='Error of the search API {}: {}'.format(self._base_url, e))
+
+    def _parse_page(self, response):
+        """Collects the results of an API answer and keeps the request of the next page."""
+        name = self.__class__.__name__
+        self._next_request = None
+        if not self._is_ok(response):
+            engine_health.failed(name)
+            return False
+
+        with SERP_PARSE.time(), span('serp_parse'):
+            try:
+                data = self._decode(response)
+                items = self._results_of(data)
+            except (ValueError, KeyError, TypeError) as e:
+                engine_health.failed(name)
+                logging.error(f"Error occurred when parsing the answer of {name}: {e}")
+                return False
+            self._collect_results(self._apply_filters(items))
+        engine_health.succeeded(name)  # an answer without result is not a failure of the API
+        if self._has_next_page(data, items):
+            self._next_request = self._page_request(self._page + 1)
+
+        msg = 'page:{:<8} links:{} \n'.format(self._page, len(self.results))
+        console(msg, end='')
+        return True
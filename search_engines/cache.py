@@ -0,0 +1,538 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlparse, parse_qs
+
+from .config import SERP_CACHE_SIZE, SERP_CACHE_TTL, SERP_CACHE_STALE_TTL, NEAR_DUP_CACHE, NEAR_DUP_THRESHOLD, \
+    NEAR_DUP_MAX_AGE, PAGE_CACHE_SIZE, PAGE_CACHE_MAX_BYTES, PAGE_CACHE_TTL, PAGE_CACHE_STALE_TTL, CACHE_BACKEND, \
+    CACHE_SQLITE_PATH, CACHE_REDIS_URL, CACHE_TIMEOUT, CACHE_NEAR_SIZE, CACHE_NEAR_TTL
+from .query import cache_key, simhash, similarity
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# values smaller than this are stored uncompressed
+COMPRESS_MIN_SIZE = 512
+# seconds a far tier is skipped after an error
+RETRY_INTERVAL = 5
+
+# errors raised by decode on a corrupt entry
+DECODE_ERRORS = (ValueError, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def encode(value):
+    """
+    Serializes a value to bytes: msgpack, or JSON when msgpack is not installed,
+    compressed with zstd, or zlib when zstandard is not installed. Two header bytes record the choices.
+    """
+    if msgpack is not None:
+        data, kind = msgpack.packb(value, use_bin_type=True), b'm'
+    else:
+        data, kind = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), b'j'
+    if len(data) < COMPRESS_MIN_SIZE:
+        return kind + b'-' + data
+    if zstandard is not None:
+        return kind + b'z' + zstandard.ZstdCompressor(level=3).compress(data)
+    return kind + b'Z' + zlib.compress(data, 6)
+
+
+def decode(data):
+    kind, compression, data = data[:1], data[1:2], data[2:]
+    if compression == b'z':
+        if zstandard is None:
+            raise ValueError('zstandard is required to read this cache entry')
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif compression == b'Z':
+        data = zlib.decompress(data)
+    if kind == b'm':
+        if msgpack is None:
+            raise ValueError('msgpack is required to read this cache entry')
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data.decode('utf-8'))
+
+
+def size_of(value):
+    """Returns the approximate bytes of memory held by a value made of dicts, lists and scalars."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(size_of(key) + size_of(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(size_of(item) for item in value)
+    return size
+
+
+class MemoryBackend(object):
+    """
+    A LRU cache in the memory of the process, entries expire ttl seconds after being set.
+    The least recently used entries are dropped past max_size entries, or past max_bytes of values when set.
+    """
+
+    def __init__(self, max_size, max_bytes=0):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        '''approximate bytes of the values, counted when max_bytes is set'''
+        self._entries = OrderedDict()
+        '''key -> (stored_at, expires_at, value, bytes), least recently used first'''
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns (stored_at, value) of a fresh entry, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() > entry[1]:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[2]
+
+    def set(self, key, value, ttl, stored_at=None):
+        """
+        :param stored_at: float Optional, the time the value was produced, when copied from another tier
+        """
+        now = time.time()
+        size = size_of(value) if self.max_bytes else 0
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (stored_at or now, now + ttl, value, size)
+            self.bytes += size
+            while self._entries and (len(self._entries) > self.max_size or
+                                     (self.max_bytes and self.bytes > self.max_bytes)):
+                self.bytes -= self._entries.popitem(last=False)[1][3]
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[3]
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+class SQLiteBackend(object):
+    """
+    A cache shared by the worker processes of a host, in a memory mapped SQLite database in WAL mode.
+    Errors, including a lock held longer than CACHE_TIMEOUT, are logged and count as misses.
+    """
+
+    def __init__(self, namespace, max_size, path=CACHE_SQLITE_PATH, timeout=CACHE_TIMEOUT):
+        self.max_size = max_size
+        self._table = 'cache_' + namespace
+        self._sets = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA mmap_size=268435456')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, stored_at REAL, '
+                           'expires_at REAL, value BLOB)'.format(self._table))
+
+    def get(self, key):
+        try:
+            with self._lock:
+                row = self._conn.execute('SELECT stored_at, expires_at, value FROM {} WHERE key = ?'.format(
+                    self._table), (key,)).fetchone()
+            if row is None or time.time() > row[1]:
+                return None
+            return row[0], decode(row[2])
+        except (sqlite3.Error,) + DECODE_ERRORS as e:
+            logging.error(f"Error occurred when reading the SQLite cache: {e}")
+            return None
+
+    def set(self, key, value, ttl, stored_at=None):
+        now = time.time()
+        try:
+            with self._lock:
+                self._conn.execute('INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?)'.format(self._table),
+                                   (key, stored_at or now, now + ttl, encode(value)))
+                self._sets += 1
+                if self._sets % 100 == 0:
+                    self._evict(now)
+        except sqlite3.Error as e:
+            logging.error(f"Error occurred when writing the SQLite cache: {e}")
+
+    def _evict(self, now):
+        """Deletes the expired entries, then the oldest ones over max_size."""
+        self._conn.execute('DELETE FROM {} WHERE expires_at < ?'.format(self._table), (now,))
+        count = self._conn.execute('SELECT COUNT(*) FROM {}'.format(self._table)).fetchone()[0]
+        if count > self.max_size:
+            self._conn.execute('DELETE FROM {0} WHERE key IN (SELECT key FROM {0} ORDER BY stored_at LIMIT ?)'.format(
+                self._table), (count - self.max_size,))
+
+    def delete(self, key):
+        try:
+            with self._lock:
+                self._conn.execute('DELETE FROM {} WHERE key = ?'.format(self._table), (key,))
+        except sqlite3.Error as e:
+            logging.error(f"Error occurred when writing the SQLite cache: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM {}'.format(self._table))
+
+
+class RespError(Exception):
+    """An error reply of a Redis protocol server."""
+
+
+class RespClient(object):
+    """
+    A minimal blocking client of the Redis protocol (RESP2), enough for GET/SET/DEL/SCAN,
+    for Redis or any local server speaking the protocol. redis://host:port/db or unix:///path?db=0 URLs.
+    """
+
+    def __init__(self, url=CACHE_REDIS_URL, timeout=CACHE_TIMEOUT):
+        url = urlparse(url)
+        self.timeout = timeout
+        self.path = url.path if url.scheme == 'unix' else None
+        self.address = (url.hostname or '127.0.0.1', url.port or 6379)
+        if url.scheme == 'unix':
+            self.db = int(parse_qs(url.query).get('db', ['0'])[0])
+        else:
+            self.db = int(url.path.strip('/') or 0)
+        self.password = url.password
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self.path:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(self.timeout)
+            self._sock.connect(self.path)
+        else:
+            self._sock = socket.create_connection(self.address, timeout=self.timeout)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile('rb')
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', self.db)
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = self._file = None
+
+    def execute(self, *args):
+        """Sends a command and returns its reply, reconnecting first if needed."""
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                return self._call(*args)
+            except OSError:
+                self.close()
+                raise
+
+    def _call(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            arg = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self._sock.sendall(b''.join(parts))
+        return self._read()
+
+    def _read(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError('connection closed by the cache server')
+        kind, data = line[:1], line[1:-2]
+        if kind == b'+':
+            return data.decode('utf-8')
+        if kind == b'-':
+            raise RespError(data.decode('utf-8'))
+        if kind == b':':
+            return int(data)
+        if kind == b'$':
+            if data == b'-1':
+                return None
+            value = self._file.read(int(data) + 2)
+            return value[:-2]
+        if kind == b'*':
+            if data == b'-1':
+                return None
+            return [self._read() for _ in range(int(data))]
+        raise RespError('unexpected reply ' + repr(line))
+
+
+class RedisBackend(object):
+    """
+    A cache shared by the workers of several hosts, on a Redis protocol server.
+    Values are stored with the time they were produced and expire on the server.
+    Errors are logged, count as misses and skip the server for RETRY_INTERVAL seconds.
+    """
+
+    def __init__(self, namespace, url=CACHE_REDIS_URL, timeout=CACHE_TIMEOUT):
+        self.prefix = 'wsaio:{}:'.format(namespace)
+        self.client = RespClient(url, timeout)
+        self._down_until = 0
+
+    def _execute(self, *args):
+        if time.time() < self._down_until:
+            return None
+        try:
+            return self.client.execute(*args)
+        except (OSError, RespError) as e:
+            self._down_until = time.time() + RETRY_INTERVAL
+            logging.error(f"Error occurred when calling the cache server: {e}")
+            return None
+
+    def get(self, key):
+        data = self._execute('GET', self.prefix + key)
+        if not data:
+            return None
+        try:
+            return struct.unpack('>d', data[:8])[0], decode(data[8:])
+        except (struct.error,) + DECODE_ERRORS as e:
+            logging.error(f"Error occurred when decoding a cache entry: {e}")
+            return None
+
+    def set(self, key, value, ttl, stored_at=None):
+        data = struct.pack('>d', stored_at or time.time()) + encode(value)
+        self._execute('SET', self.prefix + key, data, 'PX', max(1, int(ttl * 1000)))
+
+    def delete(self, key):
+        self._execute('DEL', self.prefix + key)
+
+    def clear(self):
+        cursor = '0'
+        while True:
+            reply = self._execute('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 500)
+            if not reply:
+                return
+            cursor, keys = reply[0].decode('utf-8'), reply[1]
+            if keys:
+                self._execute('DEL', *keys)
+            if cursor == '0':
+                return
+
+
+class TieredBackend(object):
+    """
+    The asynchronous interface of the caches: looks up a near in-process cache, then a far shared one,
+    whose blocking calls run in a thread so that a busy database or server never stalls the event loop.
+    Far hits are copied to the near cache for near_ttl seconds, so that hot keys are served from the process.
+    Without a far cache, the near one keeps the entries for their whole ttl.
+    """
+
+    def __init__(self, near, far=None, near_ttl=CACHE_NEAR_TTL):
+        self.near = near
+        self.far = far
+        self.near_ttl = near_ttl if far is not None else float('inf')
+
+    async def get(self, key):
+        entry = self.near.get(key)
+        if entry is not None or self.far is None:
+            return entry
+        entry = await asyncio.to_thread(self.far.get, key)
+        if entry is not None:
+            self.near.set(key, entry[1], self.near_ttl, stored_at=entry[0])
+        return entry
+
+    async def set(self, key, value, ttl, stored_at=None):
+        self.near.set(key, value, min(ttl, self.near_ttl), stored_at)
+        if self.far is not None:
+            await asyncio.to_thread(self.far.set, key, value, ttl, stored_at)
+
+    async def delete(self, key):
+        self.near.delete(key)
+        if self.far is not None:
+            await asyncio.to_thread(self.far.delete, key)
+
+    async def clear(self):
+        self.near.clear()
+        if self.far is not None:
+            await asyncio.to_thread(self.far.clear)
+
+
+def make_backend(namespace, max_size, backend=CACHE_BACKEND, near_size=CACHE_NEAR_SIZE, max_bytes=0):
+    """
+    Returns the cache backend configured by CACHE_BACKEND: 'memory', 'sqlite' or 'redis'.
+    :param near_size: int Optional, entries of a shared cache kept in process, 0 to always read the shared one
+    :param max_bytes: int Optional, bounds the bytes of the values kept in process, 0 for no bound
+    """
+    if backend == 'memory' or not max_size:
+        return TieredBackend(MemoryBackend(max_size, max_bytes))
+    if backend == 'sqlite':
+        far = SQLiteBackend(namespace, max_size)
+    elif backend == 'redis':
+        far = RedisBackend(namespace)
+    else:
+        raise ValueError('Unknown cache backend: {}'.format(backend))
+    return TieredBackend(MemoryBackend(min(max_size, near_size), max_bytes), far)
+
+
+Hit = namedtuple('Hit', ['value', 'stored_at', 'stale', 'near_dup'])
+
+
+class AccessTracker(object):
+    """Counts the lookups of each key, halved by every decay, to find the hot keys."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._counts = OrderedDict()
+        '''key -> [hits, argument of the lookup], least recently looked up first'''
+        self._lock = threading.Lock()
+
+    def record(self, key, argument):
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is None:
+                entry = self._counts[key] = [0, argument]
+            entry[0] += 1
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+
+    def hot(self, min_hits):
+        """Returns (key, argument) of the keys looked up at least min_hits times."""
+        with self._lock:
+            return [(key, argument) for key, (hits, argument) in self._counts.items() if hits >= min_hits]
+
+    def decay(self):
+        with self._lock:
+            for key in list(self._counts):
+                self._counts[key][0] //= 2
+                if not self._counts[key][0]:
+                    del self._counts[key]
+
+
+class SerpCache(object):
+    """
+    Caches search results by normalized query and number of pages.
+    Entries are fresh for ttl seconds, then served as stale until stale_ttl, for a refresh in the background.
+    With near_dup, a query missing the cache is served the results of the most similar query
+    cached less than max_age seconds ago, if their SimHash similarity reaches threshold.
+    The near-duplicate index and the access counts only hold the queries searched by this process.
+    """
+
+    def __init__(self, max_size=SERP_CACHE_SIZE, ttl=SERP_CACHE_TTL, stale_ttl=SERP_CACHE_STALE_TTL,
+                 near_dup=NEAR_DUP_CACHE, threshold=NEAR_DUP_THRESHOLD, max_age=NEAR_DUP_MAX_AGE, backend=None):
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl)
+        self.near_dup = near_dup
+        self.threshold = threshold
+        self.max_age = min(max_age, ttl)
+        self.max_size = max_size
+        self.backend = backend if backend is not None else make_backend('serp', max_size)
+        self.accesses = AccessTracker(max_size)
+        '''lookups per key, the argument is (query, pages)'''
+        self._recent = OrderedDict()
+        '''key -> (simhash, pages, stored_at) of the recently cached queries, oldest first'''
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(query, pages=1):
+        return u'{}#{}'.format(cache_key(query), pages)
+
+    async def get(self, query, pages=1):
+        """Returns a Hit, stale once older than ttl, or None on a miss. Near-duplicate hits are never stale."""
+        key = self.key(query, pages)
+        self.accesses.record(key, (query, pages))
+        entry = await self.backend.get(key)
+        if entry is not None:
+            return Hit(entry[1], entry[0], time.time() - entry[0] > self.ttl, False)
+        if not self.near_dup:
+            return None
+
+        key = self._nearest(query, pages)
+        entry = await self.backend.get(key) if key is not None else None
+        if entry is None or time.time() - entry[0] > self.max_age:
+            return None
+        return Hit(entry[1], entry[0], False, True)
+
+    async def age(self, key):
+        """Returns the seconds since the entry of a key was stored, or None."""
+        entry = await self.backend.get(key)
+        return time.time() - entry[0] if entry is not None else None
+
+    async def set(self, query, results, pages=1):
+        key = self.key(query, pages)
+        await self.backend.set(key, results, self.stale_ttl)
+        if self.near_dup:
+            with self._lock:
+                self._recent[key] = (simhash(cache_key(query)), pages, time.time())
+                self._recent.move_to_end(key)
+                while len(self._recent) > self.max_size:
+                    self._recent.popitem(last=False)
+
+    async def clear(self):
+        await self.backend.clear()
+        with self._lock:
+            self._recent.clear()
+
+    def _nearest(self, query, pages):
+        """Returns the key of the most similar query cached within max_age, scanning from the newest."""
+        query_hash = simhash(cache_key(query))
+        oldest = time.time() - self.max_age
+        best_key, best_similarity = None, self.threshold
+        with self._lock:
+            for key, (other_hash, other_pages, stored_at) in reversed(self._recent.items()):
+                if stored_at < oldest:
+                    break
+                if other_pages != pages:
+                    continue
+                score = similarity(query_hash, other_hash)
+                if score >= best_similarity:
+                    best_key, best_similarity = key, score
+        return best_key
+
+
+class PageCache(object):
+    """
+    Caches the fields extracted from result pages, by link, fresh for ttl seconds and kept until stale_ttl.
+    The whole texts are kept, their passages relevant to each query are selected on use, so the pages held
+    in process are bounded by max_bytes as well as by number.
+    """
+
+    def __init__(self, max_size=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL, stale_ttl=PAGE_CACHE_STALE_TTL, backend=None,
+                 max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl)
+        self.backend = backend if backend is not None else make_backend('page', max_size, max_bytes=max_bytes)
+
+    async def get(self, link):
+        """Returns a Hit, stale once older than ttl, or None on a miss."""
+        entry = await self.backend.get(link)
+        if entry is None:
+            return None
+        return Hit(entry[1], entry[0], time.time() - entry[0] > self.ttl, False)
+
+    async def set(self, link, extracted):
+        await self.backend.set(link, extracted, self.stale_ttl)
+
+    async def clear(self):
+        await self.backend.clear()
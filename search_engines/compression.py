@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipResponder
+
+from .config import COMPRESSION_MIN_SIZE, GZIP_LEVEL, BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepted_encodings(header):
+    """Returns the encodings of an Accept-Encoding header which are not refused with q=0."""
+    encodings = set()
+    for part in header.lower().split(','):
+        name, _, params = part.partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        encodings.add(name.strip())
+    return encodings
+
+
+class CompressionMiddleware(object):
+    """
+    Compresses responses of at least minimum_size bytes with brotli when the client accepts it
+    and the brotli package is installed, with gzip otherwise.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE, gzip_level=GZIP_LEVEL, brotli_quality=BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            encodings = accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+            app = self._coalesced
+            if brotli is not None and "br" in encodings:
+                await BrotliResponder(app, self.minimum_size, self.brotli_quality)(scope, receive, send)
+                return
+            if "gzip" in encodings:
+                await GZipResponder(app, self.minimum_size, compresslevel=self.gzip_level)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+    async def _coalesced(self, scope, receive, send):
+        """
+        Runs the app, merging the first body chunks until minimum_size bytes or the end of the body,
+        so that small bodies sent in several chunks (by http middlewares) are not compressed.
+        """
+        chunks, size, merged = [], 0, False
+
+        async def coalescing_send(message):
+            nonlocal size, merged
+            if merged or message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more_body = message.get("more_body", False)
+            if size >= self.minimum_size or not more_body:
+                merged = True
+                await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": more_body})
+
+        await self.app(scope, receive, coalescing_send)
+
+
+class BrotliResponder(object):
+    """Brotli counterpart of starlette's GZipResponder, for whole and streamed bodies."""
+
+    def __init__(self, app, minimum_size, quality):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compressor = brotli.Compressor(quality=quality)
+        self.send = None
+        self.initial_message = {}
+        self.started = False
+        self.content_encoding_set = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_with_brotli)
+
+    async def send_with_brotli(self, message):
+        if message["type"] == "http.response.start":
+            # held until the first body tells whether to compress
+            self.initial_message = message
+            self.content_encoding_set = "content-encoding" in Headers(raw=message["headers"])
+            return
+        if message["type"] != "http.response.body" or self.content_encoding_set:
+            if not self.started and message["type"] == "http.response.body":
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.started:
+            self.started = True
+            if len(body) < self.minimum_size and not more_body:
+                await self.send(self.initial_message)
+                await self.send(message)
+                self.content_encoding_set = True  # nothing left to compress
+                return
+
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            headers["Content-Encoding"] = "br"
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+                message["body"] = self.compressor.process(body)
+            else:
+                message["body"] = self.compressor.process(body) + self.compressor.finish()
+                headers["Content-Length"] = str(len(message["body"]))
+            await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        message["body"] = self.compressor.process(body) + (b"" if more_body else self.compressor.finish())
+        await self.send(message)
@@ -1,26 +1,31 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import logging
 import time
-import warnings
 from functools import wraps
 
+from .metrics import FUNCTION_SECONDS
+
 
 def timer(time_limit: float = 5, convey: bool = False):
     """
-    compute time cost
-    :param time_limit: warn if func run time surpass the limit
+    compute time cost, recorded in the wsaio_function_duration_seconds histogram
+    :param time_limit: log a warning if func run time surpass the limit
     :param convey: output time cost as an arg if True
     """
 
     def deco_timer(func):
+        histogram = FUNCTION_SECONDS.labels(func.__qualname__)
+
         @wraps(func)
         def clocked(*args, **kwargs):
-            start_time = time.time()
+            start_time = time.perf_counter()
             result = func(*args, **kwargs)
-            time_cost = time.time() - start_time
-            print("func (" + func.__name__ + ") costs {:.4f}s".format(time_cost))
-            if time_cost > time_limit: warnings.warn(f"func_{func.__name__} took over {time_limit}s to run")
+            time_cost = time.perf_counter() - start_time
+            histogram.observe(time_cost)
+            if time_cost > time_limit:
+                logging.warning(f"func_{func.__name__} took {time_cost:.4f}s, over {time_limit}s to run")
             if convey:
                 return time_cost, result
             else:
@@ -32,19 +37,22 @@ def timer(time_limit: float = 5, convey: bool = False):
 
 def atimer(time_limit: float = 5, convey: bool = False):
     """
-    compute time cost
-    :param time_limit: warn if func run time surpass the limit
+    compute time cost, recorded in the wsaio_function_duration_seconds histogram
+    :param time_limit: log a warning if func run time surpass the limit
     :param convey: output time cost as an arg if True
     """
 
     def deco_timer(func):
+        histogram = FUNCTION_SECONDS.labels(func.__qualname__)
+
         @wraps(func)
         async def clocked(*args, **kwargs):
-            start_time = time.time()
+            start_time = time.perf_counter()
             result = await func(*args, **kwargs)
-            time_cost = time.time() - start_time
-            print("func (" + func.__name__ + ") costs {:.4f}s".format(time_cost))
-            if time_cost > time_limit: warnings.warn(f"func_{func.__name__} took over {time_limit}s to run")
+            time_cost = time.perf_counter() - start_time
+            histogram.observe(time_cost)
+            if time_cost > time_limit:
+                logging.warning(f"func_{func.__name__} took {time_cost:.4f}s, over {time_limit}s to run")
             if convey:
                 return time_cost, result
             else:
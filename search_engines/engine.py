@@ -2,14 +2,21 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+import copy
+import logging
 import os
 from random import uniform as random_uniform
 
 from bs4 import BeautifulSoup
 
-from search_engines.config import PROXY, TIMEOUT, SEARCH_ENGINE_RESULTS_PAGES, OUTPUT_DIR, SEARCH_ENGINE_RESULTS_NUMS
+from search_engines.config import PROXY, TIMEOUT, SEARCH_ENGINE_RESULTS_PAGES, OUTPUT_DIR, SEARCH_ENGINE_RESULTS_NUMS, \
+    SERP_RATE_BURST
+from search_engines.health import engine_health
+from search_engines.metrics import BANS, SERP_PARSE, SELECTOR_MISSES
+from search_engines.tracing import span
 from search_engines.output import *
-from search_engines.persistent_browser import PersistentBrowser
+from search_engines.persistent_browser import PersistentBrowser, BLOCK_STATUSES
+from search_engines.ratelimit import rate_limiter, concurrency_limiter
 from search_engines.results import SearchResults
 from search_engines.utils import *
 
@@ -17,6 +24,28 @@ from search_engines.utils import *
 class SearchEngine(object):
     """The base class for all Search Engines."""
 
+    name = None
+    '''The name the engine is registered under, see registry.register.'''
+    needs_browser = True
+    '''Searches through the persistent browser, engines of search APIs do not need it.'''
+    predictable_pagination = False
+    '''Page requests are built from the page number by _page_request, the next pages are fetched at once.'''
+    rate_limit = None
+    '''SERP navigations per second by default, SERP_RATE_LIMIT overrides it, and burst size.'''
+    rate_burst = SERP_RATE_BURST
+    max_concurrency = 0
+    '''SERP navigations of the engine at once (per worker process), 0 for no limit.'''
+    opt_in = False
+    '''Searched only when named, not by AllSearchEngines: the engine needs a server or data of its own.'''
+    _selector_sets = []
+    '''CSS selectors of the result items ('links') and of their fields, tried in order to survive markup changes.'''
+    _block_selectors = []
+    '''CSS selectors of the captcha, block or consent pages served instead of results.'''
+    _block_urls = []
+    '''Parts of the URLs a blocked search is redirected to.'''
+    _query_param = 'q'
+    '''The URL parameter of the query in the next page URLs, checked in the URLs of cursors.'''
+
     def __init__(self, proxy=PROXY, timeout=TIMEOUT):
         """
         :param str proxy: optional, a proxy server
@@ -26,6 +55,10 @@ class SearchEngine(object):
         self._delay = (0.01, 1)
         self._query = ''
         self._filters = []
+        self._current_page = 1
+        self._page = 0
+        self._next_request = None
+        self._selector_version = 0
         self.content_selector = None
 
         self.results = SearchResults()
@@ -37,9 +70,31 @@ class SearchEngine(object):
         self.is_banned = False
         '''Indicates if a ban occurred'''
 
+    @classmethod
+    def capabilities(cls):
+        """Returns what the scheduler needs to know about the engine."""
+        return {
+            'needs_browser': cls.needs_browser,
+            'predictable_pagination': cls.predictable_pagination,
+            'rate_limit': cls.rate_limit,
+            'rate_burst': cls.rate_burst,
+            'max_concurrency': cls.max_concurrency,
+            'opt_in': cls.opt_in,
+            'block_selectors': list(cls._block_selectors),
+            'block_urls': list(cls._block_urls),
+        }
+
+    def fork(self):
+        """Returns an engine of the same kind with its own search state, sharing this engine's browser."""
+        engine = copy.copy(self)
+        engine._filters = list(self._filters)
+        engine.results = SearchResults()
+        engine.is_banned = False
+        return engine
+
     def _selectors(self, element):
-        """Returns the appropriate CSS selector."""
-        raise NotImplementedError()
+        """Returns the CSS selector of the selector set matching the last page parsed, the first one by default."""
+        return self._selector_sets[self._selector_version or 0][element]
 
     def _first_page(self):
         """Returns the initial page URL."""
@@ -49,6 +104,10 @@ class SearchEngine(object):
         """Returns the next page URL and post data."""
         raise NotImplementedError()
 
+    def _page_request(self, page):
+        """Returns the URL and post data of a page number, for engines with predictable pagination."""
+        raise NotImplementedError()
+
     def _get_url(self, tag, item='href'):
         """Returns the URL of search results items."""
         selector = self._selectors('url')
@@ -65,9 +124,27 @@ class SearchEngine(object):
         selector = self._selectors('text')
         return self._get_tag_item(tag.select_one(selector), item)
 
-    def _get_page(self, page: str, content_selector:str):
-        """Gets pagination links."""
-        return self._persistent_browser.get_raw_html(page, content_selector)
+    async def _get_page(self, page: str, content_selector:str, data=None):
+        """Gets pagination links, within the rate and concurrency limits of the engine."""
+        name = self.__class__.__name__
+        limiter = rate_limiter(name, self.rate_limit, self.rate_burst)
+        if limiter is not None:
+            await limiter.acquire()
+        slots = concurrency_limiter(name, self.max_concurrency)
+        if slots is None:
+            return await self._fetch(page, content_selector, data)
+        async with slots:
+            return await self._fetch(page, content_selector, data)
+
+    async def _fetch(self, page: str, content_selector:str, data=None):
+        """Gets a SERP with the browser, or at once the block page served instead."""
+        return await self._persistent_browser.get_raw_html(page, content_selector, self._block_selectors,
+                                                           self._block_urls)
+
+    async def _start(self):
+        """Launches the browser, if the engine needs it and it is not launched yet."""
+        if self.needs_browser and self._persistent_browser.browser is None:
+            await self._persistent_browser.start()
 
     def _get_tag_item(self, tag, item):
 
@@ -90,10 +167,20 @@ class SearchEngine(object):
         return self._query.lower() in item.lower()
 
     def _filter_results(self, soup):
-        """Processes and filters the search results."""
-        tags = soup.select(self._selectors('links'))
-        results = [self._item(l) for l in tags]
+        """Processes and filters the search results, from the first selector set matching any result."""
+        tags = []
+        for version, selectors in enumerate(self._selector_sets):
+            tags = soup.select(selectors['links'])
+            if tags:
+                self._selector_version = version
+                break
+            SELECTOR_MISSES.labels(self.__class__.__name__, str(version)).inc()
+        else:
+            self._selector_version = None
+        return self._apply_filters([self._item(l) for l in tags])
 
+    def _apply_filters(self, results):
+        """Keeps the results matching the search operators."""
         if u'url' in self._filters:
             results = [l for l in results if self._query_in(l['link'])]
         if u'title' in self._filters:
@@ -119,11 +206,16 @@ class SearchEngine(object):
             self.results.append(item)
 
     def _is_ok(self, response):
-        """Checks if the HTTP response is 200/OK."""
-        self.is_banned = response.http in [403, 429, 503]
-        if response.http == 200:
+        """Checks if the HTTP response is 200/OK and not a block page."""
+        self.is_banned = response.http in BLOCK_STATUSES or response.blocked is not None
+        if self.is_banned:
+            BANS.labels(self.__class__.__name__).inc()
+        if response.http == 200 and response.blocked is None:
             return True
-        msg = ('HTTP ' + str(response.http)) if response.http else response.html
+        if response.blocked is not None:
+            msg = 'Blocked ({})'.format(response.blocked)
+        else:
+            msg = ('HTTP ' + str(response.http)) if response.http else response.html
         console(msg, level=Level.error)
         return False
 
@@ -148,49 +240,140 @@ class SearchEngine(object):
 
         self._query = decode_bytes(query)
         self.results = SearchResults()
+        self._current_page = 1
+        self._page = 0
         request = self._first_page()
 
-        if self._persistent_browser.browser is None:
-            await self._persistent_browser.start()
+        await self._start()
 
-        if self.content_selector is None:
+        if self.needs_browser and self.content_selector is None:
             raise ValueError('Fail to convert content selector')
 
         for page in range(1, max_pages + 1):
             try:
-                # get raw html from page
-                response = await self._get_page(request['url'], self.content_selector)
-
-                if not self._is_ok(response):
+                if not await self.search_page(request):
                     break
 
-                tags = BeautifulSoup(response.html, features='lxml')
-                items = self._filter_results(tags)
-                self._collect_results(items)
-
-                msg = 'page:{:<8} links:{} \n'.format(page, len(self.results))
-                console(msg, end='')
-
                 reached_result_limit = 0 < max_results <= len(self.results)  # results num limit
                 reached_page_limit = page >= max_pages  # pages num limit
 
-                if reached_result_limit or reached_page_limit:
+                if reached_result_limit or reached_page_limit or self._next_request is None:
                     break
 
-                await asyncio.sleep(random_uniform(*self._delay))
-                request = self._next_page(tags)
-                if not request['url']:
+                if self.predictable_pagination:
+                    await self._search_pages(range(page + 1, max_pages + 1))
                     break
 
+                await asyncio.sleep(random_uniform(*self._delay))
+                request = self._next_request
+
             except KeyboardInterrupt:
                 break
 
         console('', end='')
         return self.results[:max_results] if max_results > 0 else self.results
 
+    async def search_page(self, request):
+        """
+        Gets one SERP page and collects its results, keeping the request of the next page.
+        Returns False when the page could not be searched. Pages without any result count against
+        the health of the engine, see EngineHealth.
+
+        :param request: dict The page URL and post data, from _first_page or _next_page
+        """
+        name = self.__class__.__name__
+        self._page += 1
+        with span('serp_page', engine=name, page=self._page):
+            # get raw html from page
+            try:
+                response = await self._get_page(request['url'], self.content_selector, request.get('data'))
+            except Exception:
+                engine_health.failed(name)
+                raise
+            return self._parse_page(response)
+
+    async def _search_pages(self, pages):
+        """
+        Fetches SERP pages of an engine with predictable pagination at once, within its rate and concurrency
+        limits, and collects them in page order up to the first page which failed or is the last one.
+        """
+        name = self.__class__.__name__
+        requests = [self._page_request(page) for page in pages]
+        with span('serp_pages', engine=name, pages=len(requests)):
+            responses = await asyncio.gather(*[self._get_page(request['url'], self.content_selector, request.get('data'))
+                                               for request in requests], return_exceptions=True)
+        for page, response in zip(pages, responses):
+            self._page = page
+            if isinstance(response, Exception):
+                engine_health.failed(name)
+                self._next_request = None
+                logging.error(f"Error occurred when searching page {page} from {name}: {response}")
+                break
+            if not self._parse_page(response) or self._next_request is None:
+                break
+
+    def _parse_page(self, response):
+        """
+        Collects the results of a SERP and keeps the request of the next page.
+        Returns False when the page was refused.
+        """
+        name = self.__class__.__name__
+        self._next_request = None
+        if not self._is_ok(response):
+            engine_health.failed(name)
+            return False
+
+        with SERP_PARSE.time(), span('serp_parse'):
+            tags = BeautifulSoup(response.html, features='lxml')
+            items = self._filter_results(tags)
+            self._collect_results(items)
+            request = self._next_page(tags)
+        if self._selector_version is None:
+            engine_health.failed(name)
+        else:
+            engine_health.succeeded(name)
+        if request['url']:
+            self._next_request = {'url': request['url'], 'data': request.get('data')}
+
+        msg = 'page:{:<8} links:{} \n'.format(self._page, len(self.results))
+        console(msg, end='')
+        return True
+
+    def pagination_state(self):
+        """Returns what is needed to search the page after the last one searched, or None on the last page."""
+        if self._next_request is None:
+            return None
+        return {
+            'engine': self.__class__.__name__,
+            'query': self._query,
+            'page': self._page + 1,
+            'current_page': self._current_page,
+            'request': self._next_request,
+        }
+
+    async def search_next(self, state, seen_links=()):
+        """
+        Searches the page of a pagination state with one navigation, and returns its new results.
+
+        :param state: dict The pagination state of a previous search
+        :param seen_links: list Optional, the links of the previous pages, not collected again
+        """
+        self._query = state['query']
+        self._current_page = state['current_page']
+        self._page = state['page'] - 1
+        self.results = SearchResults([{'link': link, 'host': domain(link)} for link in seen_links])
+
+        await self._start()
+
+        # the pages of predictable engines are rebuilt from their number rather than taken from the state
+        request = self._page_request(state['page']) if self.predictable_pagination else state['request']
+        await self.search_page(request)
+        self.results = SearchResults(self.results[len(seen_links):])
+        return self.results
+
     def output(self, output=PRINT, path=None):
         """Prints search results and/or creates report files.
-        Supported output format: HTML, csv, json.
+        Supported output format: HTML, csv, json, jsonl, parquet.
 
         :param output: str Optional, the output format
         :param path: str Optional, the file to save the report
@@ -200,11 +383,4 @@ class SearchEngine(object):
             path = os.path.join(OUTPUT_DIR, u'_'.join(self._query.split()))
         console('')
 
-        if PRINT in output:
-            print_results([self])
-        if HTML in output:
-            write_file(create_html_data([self]), path + u'.html')
-        if CSV in output:
-            write_file(create_csv_data([self]), path + u'.csv')
-        if JSON in output:
-            write_file(create_json_data([self]), path + u'.json')
+        write_report([self], output, path)
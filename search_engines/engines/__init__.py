@@ -1,3 +1,10 @@
 from .bing import Bing
 from .duckduckgo import Duckduckgo
-from .google import Google
\ No newline at end of file
+from .elasticsearch import Elasticsearch
+from .google import Google
+from .local import Local
+from .searxng import Searxng
+from ..registry import registered_engines
+
+# the built-in engines by name, engines of entry points are found with registry.engine_class
+search_engines_dict = registered_engines()
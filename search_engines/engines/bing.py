@@ -3,34 +3,54 @@
 
 from ..config import PROXY, TIMEOUT
 from ..engine import SearchEngine
+from ..registry import register
+from ..utils import quote_url
 
 
+@register('bing')
 class Bing(SearchEngine):
     """Searches bing.com"""
 
-    def __init__(self, proxy=PROXY, timeout=TIMEOUT):
-        super(Bing, self).__init__(proxy, timeout)
-        self._base_url = u'https://www.bing.com'
-        self.content_selector = '#b_results'
-
-    def _selectors(self, element):
-        # 'links': 'ol#b_results > li.b_algo', -> 'links': 'li.b_algo',
-        # 没有指定上层的ol元素，ol#b_results的选择器可能是多余的。在答案中出现聚合搜索的时候还会出现问题。
-        """Returns the appropriate CSS selector."""
-        selectors = {
+    # 'links': 'ol#b_results > li.b_algo', -> 'links': 'li.b_algo',
+    # 没有指定上层的ol元素，ol#b_results的选择器可能是多余的。在答案中出现聚合搜索的时候还会出现问题。
+    _selector_sets = [
+        {
             'url': 'a[href]',
             'title': 'h2',
             'text': 'p',
             'links': 'li.b_algo',
             'next': 'a.sb_pagN'
-        }
-        return selectors[element]
+        },
+        {
+            'url': 'h2 a[href]',
+            'title': 'h2',
+            'text': '.b_caption p, p',
+            'links': '#b_results > li:has(h2 a[href])',
+            'next': 'a.sb_pagN, a[title="Next page"]'
+        },
+    ]
+
+    predictable_pagination = True
+    max_concurrency = 3
+
+    _block_selectors = ['#b_captcha', 'iframe[src*="challenges.cloudflare.com"]', 'iframe[src*="captcha"]']
+    _block_urls = ['/challenge/', '/captcha']
+
+    def __init__(self, proxy=PROXY, timeout=TIMEOUT):
+        super(Bing, self).__init__(proxy, timeout)
+        self._base_url = u'https://www.bing.com'
+        self.content_selector = '#b_results'
 
     def _first_page(self):
         """Returns the initial page and query."""
         url = u'{}/search?&q={}&form=QBRE'.format(self._base_url, self._query)
         return {'url': url, 'data': None, 'base_url':self._base_url, 'query':self._query}
 
+    def _page_request(self, page):
+        """Returns the URL and post data of a page number, 10 results per page."""
+        url = u'{}/search?q={}&first={}&FORM=PERE'.format(self._base_url, quote_url(self._query, ''), (page - 1) * 10 + 1)
+        return {'url': url, 'data': None}
+
     def _next_page(self, tags):
         """Returns the next page URL and post data (if any)"""
         selector = self._selectors('next')
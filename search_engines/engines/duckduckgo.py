@@ -1,27 +1,37 @@
 from ..engine import SearchEngine
+from ..registry import register
 from ..config import PROXY, TIMEOUT
 from ..utils import unquote_url, quote_url
 
 
+@register('duckduckgo')
 class Duckduckgo(SearchEngine):
     """Searches duckduckgo.com"""
 
-    def __init__(self, proxy=PROXY, timeout=TIMEOUT):
-        super(Duckduckgo, self).__init__(proxy, timeout)
-        self._base_url = u'https://html.duckduckgo.com'
-        self._current_page = 1
-        self.content_selector = '#links'
-
-    def _selectors(self, element):
-        """Returns the appropriate CSS selector."""
-        selectors = {
+    _selector_sets = [
+        {
             'url': 'a.result__a',
             'title': 'a.result__a',
             'text': 'a.result__snippet',
             'links': 'div#links div.result',
             'next': 'input[value="next"]'
-        }
-        return selectors[element]
+        },
+        {
+            'url': 'h2 a[href]',
+            'title': 'h2 a',
+            'text': '.result__snippet',
+            'links': 'div.result:has(h2 a[href])',
+            'next': 'input[value="next"]'
+        },
+    ]
+
+    _block_selectors = ['div.anomaly-modal__modal', 'form#challenge-form', 'iframe[src*="captcha"]']
+
+    def __init__(self, proxy=PROXY, timeout=TIMEOUT):
+        super(Duckduckgo, self).__init__(proxy, timeout)
+        self._base_url = u'https://html.duckduckgo.com'
+        self._current_page = 1
+        self.content_selector = '#links, div.results'
 
     def _first_page(self):
         """Returns the initial page and query."""
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from ..api_engine import ApiSearchEngine
+from ..config import PROXY, TIMEOUT, ELASTICSEARCH_URL, ELASTICSEARCH_INDEX, ELASTICSEARCH_FIELDS, \
+    ELASTICSEARCH_API_KEY, ELASTICSEARCH_PAGE_SIZE
+from ..query import truncate_tokens
+from ..registry import register
+from ..utils import domain
+
+
+@register('elasticsearch')
+class Elasticsearch(ApiSearchEngine):
+    """Searches an Elasticsearch or OpenSearch index of documents with url, title and content fields"""
+
+    def __init__(self, proxy=PROXY, timeout=TIMEOUT):
+        super(Elasticsearch, self).__init__(proxy, timeout)
+        self._base_url = ELASTICSEARCH_URL.rstrip('/')
+
+    def _headers(self):
+        headers = super(Elasticsearch, self)._headers()
+        if ELASTICSEARCH_API_KEY:
+            headers['Authorization'] = 'ApiKey ' + ELASTICSEARCH_API_KEY
+        return headers
+
+    def _page_request(self, page):
+        """Returns the URL and the query of a page number, the best passages of content are highlighted."""
+        url, title, content = ELASTICSEARCH_FIELDS
+        data = {
+            'query': {'multi_match': {'query': self._query, 'fields': [title + '^2', content]}},
+            'from': (page - 1) * ELASTICSEARCH_PAGE_SIZE,
+            'size': ELASTICSEARCH_PAGE_SIZE,
+            '_source': [url, title, content],
+            'highlight': {'fields': {content: {'fragment_size': 200, 'number_of_fragments': 3}}},
+        }
+        return {'url': u'{}/{}/_search'.format(self._base_url, ELASTICSEARCH_INDEX), 'data': data}
+
+    def _results_of(self, data):
+        url, title, content = ELASTICSEARCH_FIELDS
+        results = []
+        for hit in data['hits']['hits']:
+            source = hit.get('_source') or {}
+            link = source.get(url)
+            if not link:
+                continue
+            fragments = (hit.get('highlight') or {}).get(content)
+            snippet = u' ... '.join(fragments) if fragments else truncate_tokens(source.get(content) or u'', 100)
+            results.append({
+                'host': domain(link),
+                'link': link,
+                'title': (source.get(title) or u'').strip(),
+                'snippet': snippet.strip(),
+            })
+        return results
+
+    def _has_next_page(self, data, items):
+        total = data['hits'].get('total')
+        total = total['value'] if isinstance(total, dict) else total
+        shown = (self._page - 1) * ELASTICSEARCH_PAGE_SIZE + len(data['hits']['hits'])
+        return bool(data['hits']['hits']) and (total is None or shown < total)
@@ -1,28 +1,40 @@
 from ..engine import SearchEngine
+from ..registry import register
 from ..config import PROXY, TIMEOUT
 from ..utils import unquote_url, quote_url
 
 
+@register('google')
 class Google(SearchEngine):
     """Searches google.com"""
 
-    def __init__(self, proxy=PROXY, timeout=TIMEOUT):
-        super(Google, self).__init__(proxy, timeout)
-        self._base_url = 'https://www.google.com'
-        self._delay = (2, 6)
-        self._current_page = 1
-        self.content_selector = '#rcnt'
-
-    def _selectors(self, element):
-        """Returns the appropriate CSS selector."""
-        selectors = {
+    _selector_sets = [
+        {
             'url': 'a[href]',
             'title': 'a',
             'text': 'div[data-sncf="1"]',
             'links': 'div#search div.g',
             'next': 'a[href][aria-label="Page {page}"]'
-        }
-        return selectors[element]
+        },
+        {
+            'url': 'a[href]:has(h3)',
+            'title': 'h3',
+            'text': 'div[style*="-webkit-line-clamp"], div.VwiC3b',
+            'links': 'div#rso div.MjjYud:has(h3)',
+            'next': 'a[href][aria-label="Page {page}"]'
+        },
+    ]
+
+    _block_selectors = ['form#captcha-form', '#recaptcha', 'iframe[src*="recaptcha"]',
+                        'form[action*="consent.google.com"]']
+    _block_urls = ['/sorry/', 'consent.google.com']
+
+    def __init__(self, proxy=PROXY, timeout=TIMEOUT):
+        super(Google, self).__init__(proxy, timeout)
+        self._base_url = 'https://www.google.com'
+        self._delay = (2, 6)
+        self._current_page = 1
+        self.content_selector = '#rcnt, #rso'
 
     def _first_page(self):
         """Returns the initial page and query."""
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from ..api_engine import ApiSearchEngine
+from ..config import PROXY, TIMEOUT, LOCAL_INDEX_RESULTS
+from ..local_index import shared_index
+from ..persistent_browser import Response
+from ..registry import register
+
+
+@register('local')
+class Local(ApiSearchEngine):
+    """Searches the local index of the pages extracted from previous search results"""
+
+    def __init__(self, proxy=PROXY, timeout=TIMEOUT):
+        super(Local, self).__init__(proxy, timeout)
+        self._base_url = u'local://index'
+
+    def _page_request(self, page):
+        """Returns the URL and post data of a page number."""
+        return {'url': self._base_url + u'/search', 'data': {'page': page}}
+
+    async def _fetch(self, page: str, content_selector: str, data=None):
+        """Searches the index in a thread, the answer carries the results themselves."""
+        offset = (data['page'] - 1) * LOCAL_INDEX_RESULTS
+        results = await asyncio.to_thread(shared_index().search, self._query, LOCAL_INDEX_RESULTS, offset)
+        return Response(http=200, html=results)
+
+    def _decode(self, response):
+        return response.html
+
+    def _results_of(self, data):
+        return data
+
+    def _has_next_page(self, data, items):
+        return len(data) == LOCAL_INDEX_RESULTS
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from ..api_engine import ApiSearchEngine
+from ..config import PROXY, TIMEOUT, SEARXNG_URL, SEARXNG_CATEGORIES, SEARXNG_ENGINES, SEARXNG_LANGUAGE
+from ..registry import register
+from ..utils import domain, quote_url
+
+
+@register('searxng')
+class Searxng(ApiSearchEngine):
+    """Searches a SearxNG instance through its JSON API (the json format must be enabled in its settings.yml)"""
+
+    def __init__(self, proxy=PROXY, timeout=TIMEOUT):
+        super(Searxng, self).__init__(proxy, timeout)
+        self._base_url = SEARXNG_URL.rstrip('/')
+
+    def _page_request(self, page):
+        """Returns the URL and post data of a page number."""
+        url = u'{}/search?q={}&format=json&pageno={}&categories={}'.format(
+            self._base_url, quote_url(self._query, ''), page, SEARXNG_CATEGORIES)
+        if SEARXNG_ENGINES:
+            url += u'&engines=' + u','.join(SEARXNG_ENGINES)
+        if SEARXNG_LANGUAGE:
+            url += u'&language=' + SEARXNG_LANGUAGE
+        return {'url': url, 'data': None}
+
+    def _results_of(self, data):
+        return [
+            {
+                'host': domain(res['url']),
+                'link': res['url'],
+                'title': (res.get('title') or u'').strip(),
+                'snippet': (res.get('content') or u'').strip(),
+            }
+            for res in data['results'] if res.get('url')
+        ]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import random
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+from .config import FINGERPRINTS_FILE
+
+# characters and versions of the GREASE brand of the client hints of Chrome, and orders of its brands,
+# chosen by the major version as Chrome does (components/embedder_support/user_agent_utils.cc)
+_GREASE_CHARS = ' (:-./);=?_'
+_GREASE_VERSIONS = ('8', '99', '24')
+_BRAND_ORDERS = ((0, 1, 2), (0, 2, 1), (1, 0, 2), (1, 2, 0), (2, 0, 1), (2, 1, 0))
+
+
+def sec_ch_ua(major):
+    """Returns the sec-ch-ua header sent by Chrome of a major version."""
+    brands = [None] * 3
+    order = _BRAND_ORDERS[major % 6]
+    brands[order[0]] = '"Not{}A{}Brand";v="{}"'.format(
+        _GREASE_CHARS[major % 11], _GREASE_CHARS[(major + 1) % 11], _GREASE_VERSIONS[major % 3])
+    brands[order[1]] = '"Chromium";v="{}"'.format(major)
+    brands[order[2]] = '"Google Chrome";v="{}"'.format(major)
+    return ', '.join(brands)
+
+
+def chrome_major(version):
+    """Returns the major version of a Chrome version, e.g. 130 of '130.0.6723.58'."""
+    return int(version.split('.')[0])
+
+
+class Fingerprint(namedtuple('Fingerprint', [
+    'user_agent', 'sec_ch_ua', 'sec_ch_ua_mobile', 'sec_ch_ua_platform',
+    'platform', 'accept_language', 'locale', 'screen',
+])):
+    """
+    A user agent with the headers and browser settings consistent with it.
+    The table holds templates of user agents, filled with the major version of the launched Chrome.
+    """
+    __slots__ = ()
+
+    def for_chrome(self, major):
+        """Returns the fingerprint of a template for Chrome of a major version."""
+        return self._replace(user_agent=self.user_agent.format(major=major), sec_ch_ua=sec_ch_ua(major))
+
+    def client_hints(self):
+        """Returns the headers a browser context sends on top of its user agent."""
+        return {
+            'Accept-Language': self.accept_language,
+            'sec-ch-ua': self.sec_ch_ua,
+            'sec-ch-ua-mobile': self.sec_ch_ua_mobile,
+            'sec-ch-ua-platform': self.sec_ch_ua_platform,
+        }
+
+    def headers(self):
+        """Returns the HTTP headers a browser with this fingerprint sends."""
+        headers = {
+            'User-Agent': self.user_agent,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+        }
+        headers.update(self.client_hints())
+        return headers
+
+    def languages(self):
+        """Returns navigator.languages matching the Accept-Language header."""
+        return tuple(language.split(';')[0].strip() for language in self.accept_language.split(','))
+
+
+@lru_cache(maxsize=None)
+def load_fingerprints(path=FINGERPRINTS_FILE):
+    """Returns the version, the default Chrome major version and the fingerprint templates of the bundled table."""
+    with open(path, encoding='utf-8') as f:
+        table = json.load(f)
+    return table['version'], table['chrome_major'], tuple(Fingerprint(sec_ch_ua=None, **fp)
+                                                          for fp in table['fingerprints'])
+
+
+class FingerprintRotator(object):
+    """
+    Hands out the fingerprints of the table in turn, from a random one so that workers differ,
+    for the Chrome major version of the launched browser, or the default one of the table before.
+    """
+
+    def __init__(self, path=FINGERPRINTS_FILE):
+        self.version, major, self.templates = load_fingerprints(path)
+        self.fingerprints = ()
+        self.set_chrome_major(major)
+        self._index = random.randrange(len(self.templates))
+        self._lock = threading.Lock()
+
+    def set_chrome_major(self, major):
+        self.major = major
+        self.fingerprints = tuple(template.for_chrome(major) for template in self.templates)
+
+    def next(self):
+        with self._lock:
+            self._index = (self._index + 1) % len(self.fingerprints)
+            return self.fingerprints[self._index]
+
+
+_rotator = None
+
+
+def _shared_rotator():
+    global _rotator
+    if _rotator is None:
+        _rotator = FingerprintRotator()
+    return _rotator
+
+
+def next_fingerprint():
+    """Returns the next fingerprint of the process wide rotation."""
+    return _shared_rotator().next()
+
+
+def set_chrome_version(version):
+    """Makes the fingerprints of the rotation match the version of the launched Chrome, e.g. '130.0.6723.58'."""
+    _shared_rotator().set_chrome_major(chrome_major(version))
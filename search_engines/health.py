@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from .config import ENGINE_DEGRADED_AFTER, ENGINE_DEGRADED_COOLDOWN
+from .metrics import ENGINE_DEGRADED
+
+
+class EngineHealth(object):
+    """
+    Counts the consecutive failed SERP pages of each engine: pages without any result,
+    refused pages and navigations which raised. An engine is degraded after max_failures of them
+    for cooldown seconds, then the next search probes it: a success restores it, a failure degrades it again.
+    """
+
+    def __init__(self, max_failures=ENGINE_DEGRADED_AFTER, cooldown=ENGINE_DEGRADED_COOLDOWN):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self._failures = {}
+        '''engine name -> consecutive failed pages'''
+        self._degraded_until = {}
+        '''engine name -> end of its cooldown'''
+        self._lock = threading.Lock()
+
+    def succeeded(self, name):
+        with self._lock:
+            self._failures[name] = 0
+            if self._degraded_until.pop(name, None) is not None:
+                ENGINE_DEGRADED.labels(name).set(0)
+
+    def failed(self, name):
+        with self._lock:
+            failures = self._failures[name] = self._failures.get(name, 0) + 1
+            if self.max_failures and failures >= self.max_failures:
+                self._degraded_until[name] = time.monotonic() + self.cooldown
+                ENGINE_DEGRADED.labels(name).set(1)
+
+    def is_degraded(self, name):
+        """Returns True while an engine is degraded, False once its cooldown is over."""
+        return time.monotonic() < self._degraded_until.get(name, 0)
+
+    def reset(self):
+        with self._lock:
+            for name in self._degraded_until:
+                ENGINE_DEGRADED.labels(name).set(0)
+            self._failures.clear()
+            self._degraded_until.clear()
+
+
+engine_health = EngineHealth()
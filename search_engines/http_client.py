@@ -7,7 +7,8 @@ import goose3
 import requests
 
 from . import utils as utl
-from .config import TIMEOUT, PROXY, FAKE_USER_AGENT
+from .config import TIMEOUT, PROXY
+from .fingerprints import next_fingerprint
 
 from goose3 import Goose
 from goose3.text import StopWordsChinese
@@ -18,8 +19,9 @@ class HttpClient(object):
     def __init__(self, timeout=TIMEOUT, proxy=PROXY):
         self.session = requests.session()
         self.session.proxies = self._set_proxy(proxy)
-        self.session.headers['User-Agent'] = FAKE_USER_AGENT
-        self.goose = Goose({"http_timeout": TIMEOUT, "stopwords_class": StopWordsChinese,"browser_user_agent": FAKE_USER_AGENT})
+        fingerprint = next_fingerprint()
+        self.session.headers.update(fingerprint.headers())
+        self.goose = Goose({"http_timeout": TIMEOUT, "stopwords_class": StopWordsChinese,"browser_user_agent": fingerprint.user_agent})
         self.timeout = timeout
         self.response = namedtuple('response', ['http', 'html'])
 
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import aiohttp
+
+from .config import API_POOL_SIZE, API_TIMEOUT
+
+_sessions = {}
+'''event loop -> aiohttp session of the search APIs'''
+
+
+def http_session():
+    """Returns the aiohttp session of the running event loop, its connections are kept alive between searches."""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=API_POOL_SIZE, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=API_TIMEOUT),
+        )
+    return session
+
+
+async def close_sessions():
+    """Closes the session of the running event loop."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import time
+import uuid
+
+from .cache import make_backend
+from .config import JOB_WORKERS, JOB_QUEUE_SIZE, JOB_STORE_SIZE, JOB_TTL, JOB_BACKEND
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# seconds an unfinished job is kept, should the worker process running it die
+UNFINISHED_TTL = 86400
+# seconds between two reads of a job run by another worker process, while polling it
+POLL_INTERVAL = 0.5
+
+
+def is_finished(state):
+    return state['status'] in (DONE, FAILED)
+
+
+class Job(object):
+    """A unit of work run in the background, observed by polling."""
+
+    def __init__(self, work, store):
+        """
+        :param work: coroutine function called with the job, it publishes partial results with `update`
+        :param store: JobStore where every state of the job is published
+        """
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.results = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.version = 0
+        '''Incremented on every change, lets pollers wait for a newer state.'''
+        self._work = work
+        self._store = store
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    async def update(self, results=None, status=None, error=None):
+        """Publishes a new state of the job to the store and wakes up its pollers."""
+        if results is not None:
+            self.results = results
+        if status is not None:
+            self.status = status
+            if self.finished:
+                self.finished_at = time.time()
+        if error is not None:
+            self.error = error
+        self.version += 1
+        await self._store.set(self)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self, timeout, version=None):
+        """Waits up to timeout seconds until the job is newer than version or finished."""
+        version = self.version if version is None else version
+        if self.finished or self.version > version or timeout <= 0:
+            return self
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'version': self.version,
+            'results': self.results,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobStore(object):
+    """
+    Keeps the states of jobs by id in the shared JOB_BACKEND, so that any worker process can answer their polls.
+    Finished jobs expire after ttl seconds. The backend is opened on first use.
+    """
+
+    def __init__(self, max_size=JOB_STORE_SIZE, ttl=JOB_TTL, backend=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            # states are changed by other processes, they are always read from the shared tier
+            self._backend = make_backend('job', self.max_size, backend=JOB_BACKEND, near_size=0)
+        return self._backend
+
+    async def set(self, job):
+        await self.backend.set(job.id, job.to_dict(), self.ttl if job.finished else UNFINISHED_TTL)
+
+    async def get(self, job_id):
+        """Returns the state of a job, or None."""
+        entry = await self.backend.get(job_id)
+        return entry[1] if entry is not None else None
+
+    async def delete(self, job_id):
+        await self.backend.delete(job_id)
+
+
+class JobQueue(object):
+    """
+    Runs submitted jobs on a bounded number of asyncio workers. The states of the jobs are kept in the store,
+    only the jobs running or queued in this process are kept here.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_size=JOB_QUEUE_SIZE, store=None):
+        self.store = JobStore() if store is None else store
+        self._workers_num = workers
+        self._max_size = max_size
+        self._queue = None
+        self._workers = []
+        self._jobs = {}
+        '''id -> job queued or running in this process'''
+
+    async def submit(self, work):
+        """
+        Queues a job and returns it at once.
+        :raises asyncio.QueueFull: if too many jobs are waiting
+        """
+        self._start()
+        if self._queue.full():
+            raise asyncio.QueueFull
+        job = Job(work, self.store)
+        await self.store.set(job)  # before a worker publishes a newer state
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            await self.store.delete(job.id)
+            raise
+        self._jobs[job.id] = job
+        return job
+
+    async def get(self, job_id, wait=0, version=None):
+        """
+        Returns the state of a job, or None when it is unknown or expired, once it is newer than version
+        or finished, or after wait seconds.
+        :param version: int Optional, the version already seen, the current one by default
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            await job.wait(wait, version)
+            return job.to_dict()
+
+        state = await self.store.get(job_id)
+        if state is None:
+            return None
+        version = state['version'] if version is None else version
+        deadline = time.monotonic() + wait
+        while not is_finished(state) and state['version'] <= version and time.monotonic() < deadline:
+            await asyncio.sleep(min(POLL_INTERVAL, deadline - time.monotonic()))
+            state = await self.store.get(job_id) or state
+        return state
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _start(self):
+        """Starts the workers on the running event loop, on first use."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(self._max_size)
+        self._workers = [asyncio.ensure_future(self._run()) for _ in range(self._workers_num)]
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await job.update(status=RUNNING)
+                await job._work(job)
+                await job.update(status=DONE)
+            except asyncio.CancelledError:
+                await job.update(status=FAILED, error='cancelled')
+                raise
+            except Exception as e:
+                logging.error(f"Error occurred when running job {job.id}: {e}")
+                await job.update(status=FAILED, error=str(e))
+            finally:
+                self._jobs.pop(job.id, None)
+                self._queue.task_done()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .config import LOCAL_INDEX_PATH, LOCAL_INDEX_MAX_DOCUMENTS, LOCAL_INDEX_MAX_CHARS, LOCAL_INDEX_RESULTS, \
+    LOCAL_INDEX_TIMEOUT
+from .matcher import TermMatcher
+from .passages import select_passages
+from .query import tokenize
+from .utils import domain
+
+# title matches weigh twice text matches in the BM25 ranking of FTS5
+_TITLE_WEIGHT = 2.0
+
+
+class LocalIndex(object):
+    """
+    A full text index of the pages extracted from search results, in an SQLite FTS5 database shared by
+    the worker processes of a host. Texts are indexed as the terms of query.tokenize, CJK characters
+    and bigrams included, and ranked by BM25. The oldest documents are evicted over max_documents.
+    """
+
+    def __init__(self, path=LOCAL_INDEX_PATH, max_documents=LOCAL_INDEX_MAX_DOCUMENTS,
+                 max_chars=LOCAL_INDEX_MAX_CHARS, timeout=LOCAL_INDEX_TIMEOUT):
+        self.max_documents = max_documents
+        self.max_chars = max_chars
+        self._adds = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, link TEXT UNIQUE, '
+                           'title TEXT, text TEXT, indexed_at REAL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS documents_indexed_at ON documents (indexed_at)')
+        self._conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS documents_terms USING fts5(title, text)')
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def add(self, link, title, text, indexed_at=None):
+        """Indexes the title and text of a page, replacing its previous version."""
+        text = (text or u'')[:self.max_chars]
+        terms = (u' '.join(tokenize(title or u'')), u' '.join(tokenize(text)))
+        try:
+            with self._lock:
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    row = self._conn.execute('SELECT id FROM documents WHERE link = ?', (link,)).fetchone()
+                    if row is not None:
+                        self._conn.execute('DELETE FROM documents_terms WHERE rowid = ?', row)
+                        self._conn.execute('DELETE FROM documents WHERE id = ?', row)
+                    rowid = self._conn.execute('INSERT INTO documents (link, title, text, indexed_at) VALUES '
+                                               '(?, ?, ?, ?)', (link, title, text, indexed_at or time.time())).lastrowid
+                    self._conn.execute('INSERT INTO documents_terms (rowid, title, text) VALUES (?, ?, ?)',
+                                       (rowid,) + terms)
+                    self._adds += 1
+                    if self._adds % 100 == 0:
+                        self._evict()
+                    self._conn.execute('COMMIT')
+                except BaseException:
+                    self._conn.execute('ROLLBACK')
+                    raise
+        except sqlite3.Error as e:
+            logging.error(f"Error occurred when indexing {link} in the local index: {e}")
+
+    def _evict(self):
+        """Deletes the oldest documents over max_documents."""
+        count = self._conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+        if count <= self.max_documents:
+            return
+        oldest = 'SELECT id FROM documents ORDER BY indexed_at LIMIT {}'.format(count - self.max_documents)
+        self._conn.execute('DELETE FROM documents_terms WHERE rowid IN ({})'.format(oldest))
+        self._conn.execute('DELETE FROM documents WHERE id IN ({})'.format(oldest))
+
+    def search(self, query, limit=LOCAL_INDEX_RESULTS, offset=0, max_age=None):
+        """
+        Returns the documents matching any term of the query, most relevant first, with the passages
+        of their text relevant to the query as snippet, "indexed_at" and "age" in seconds.
+        :param max_age: float Optional, ignores the documents indexed more than max_age seconds ago
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        match = u' OR '.join(u'"{}"'.format(term.replace(u'"', u'""')) for term in terms)
+        now = time.time()
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT d.link, d.title, d.text, d.indexed_at FROM documents_terms JOIN documents d '
+                    'ON d.id = documents_terms.rowid WHERE documents_terms MATCH ? AND d.indexed_at >= ? '
+                    'ORDER BY bm25(documents_terms, ?, 1.0) LIMIT ? OFFSET ?',
+                    (match, now - max_age if max_age else 0, _TITLE_WEIGHT, limit, offset)).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Error occurred when searching the local index: {e}")
+            return []
+
+        matcher = TermMatcher(terms)
+        return [{
+            'host': domain(link),
+            'link': link,
+            'title': title,
+            'snippet': select_passages(query, text, matcher=matcher),
+            'indexed_at': indexed_at,
+            'age': now - indexed_at,
+        } for link, title, text, indexed_at in rows]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM documents_terms')
+            self._conn.execute('DELETE FROM documents')
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_index():
+    """Returns the local index of LOCAL_INDEX_PATH, opened on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = LocalIndex()
+        return _shared
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from .config import LOOP_MONITOR_INTERVAL, LOOP_BLOCK_THRESHOLD, LOOP_MONITOR_DEBUG
+from .metrics import LOOP_LAG, LOOP_BLOCKS
+
+_project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+
+class LoopMonitor(object):
+    """
+    Measures the event loop lag continuously.
+    In debug mode a watchdog thread samples the stack of the loop thread when a callback
+    blocks it longer than block_threshold, and attributes the stall to the innermost project function.
+    """
+
+    def __init__(self, interval=LOOP_MONITOR_INTERVAL, block_threshold=LOOP_BLOCK_THRESHOLD, debug=LOOP_MONITOR_DEBUG):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.debug = debug
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+        self._loop_thread_id = None
+        self._expected = None
+        '''perf_counter time at which the loop should wake the monitor up'''
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.ensure_future(self._measure())
+        if self.debug:
+            self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    async def _measure(self):
+        while True:
+            self._expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            LOOP_LAG.observe(max(0.0, time.perf_counter() - self._expected))
+
+    def _watch(self):
+        sampled = None
+        while not self._stopped.wait(self.block_threshold / 2):
+            expected = self._expected
+            if expected is None or expected == sampled:
+                continue
+            if time.perf_counter() - expected > self.block_threshold:
+                sampled = expected
+                self._sample()
+
+    def _sample(self):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        function = blamed_function(frame)
+        LOOP_BLOCKS.labels(function).inc()
+        logging.warning(f"Event loop blocked for over {self.block_threshold}s in {function}\n"
+                        + ''.join(traceback.format_list(stack[-15:])))
+
+
+def blamed_function(frame):
+    """Returns module.function of the innermost project frame of a stack, or of its innermost frame."""
+    innermost = frame
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_project_dir) and os.sep + 'site-packages' + os.sep not in filename \
+                and not filename.endswith('loop_monitor.py'):
+            break
+        frame = frame.f_back
+    frame = frame or innermost
+    return '{}.{}'.format(frame.f_globals.get('__name__', '?'), frame.f_code.co_name)
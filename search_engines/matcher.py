@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+from collections import Counter
+
+from .query import fold, is_cjk
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+def _is_word_char(c):
+    return c.isalnum() and not is_cjk(c)
+
+
+class TermMatcher(object):
+    """
+    Finds the occurrences of a set of terms in texts, in one pass per text. Texts and terms are compared
+    in NFKC form and casefolded, as query.fold does, and offsets refer to the original text.
+    Uses a pyahocorasick automaton, or a compiled alternation when pyahocorasick is not installed.
+    Terms starting or ending with a letter or digit only match whole words, CJK terms match anywhere.
+    """
+
+    def __init__(self, terms):
+        self.terms = sorted({fold(term)[0] for term in terms if term}, key=len, reverse=True)
+        self._automaton = None
+        self._pattern = None
+        if not self.terms:
+            return
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for term in self.terms:
+                self._automaton.add_word(term, term)
+            self._automaton.make_automaton()
+        else:
+            self._pattern = re.compile(u'(?=({}))'.format(u'|'.join(map(re.escape, self.terms))))
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def _bounded(self, text, start, end):
+        if start > 0 and _is_word_char(text[start]) and _is_word_char(text[start - 1]):
+            return False
+        if end < len(text) and _is_word_char(text[end - 1]) and _is_word_char(text[end]):
+            return False
+        return True
+
+    def _matches(self, text):
+        """Yields (start, end, term) of every occurrence, overlapping ones included."""
+        if not self.terms or not text:
+            return
+        folded, offsets = fold(text)
+        for start, end, term in self._folded_matches(folded):
+            if offsets is not None:
+                start, end = offsets[start], offsets[end - 1] + 1
+            yield start, end, term
+
+    def _folded_matches(self, folded):
+        if self._automaton is not None:
+            for last, term in self._automaton.iter(folded):
+                start, end = last - len(term) + 1, last + 1
+                if self._bounded(folded, start, end):
+                    yield start, end, term
+            return
+        for match in self._pattern.finditer(folded):
+            # the alternation only yields the longest term at each position, try the shorter ones too
+            for term in self.terms:
+                start, end = match.start(), match.start() + len(term)
+                if folded.startswith(term, start) and self._bounded(folded, start, end):
+                    yield start, end, term
+
+    def count(self, text):
+        """Returns term -> number of occurrences in the text."""
+        return Counter(term for _, _, term in self._matches(text))
+
+    def spans(self, text):
+        """Returns the [start, end) offsets of the leftmost longest, non overlapping occurrences."""
+        spans = []
+        for start, end, _ in sorted(self._matches(text), key=lambda m: (m[0], -m[1])):
+            if spans and start < spans[-1][1]:
+                continue
+            spans.append((start, end))
+        return spans
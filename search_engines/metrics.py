@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Minimal Prometheus instrumentation, rendered in the text exposition format.
+
+Metrics live in the worker process, label children are created once and cached,
+so recording a value on the hot path is a dict lookup and a few additions.
+Behind several worker processes, each one writes snapshots of its metrics to a shared directory
+and /metrics renders them all: counters and histograms summed, gauges labelled by worker.
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+# seconds, from a cache hit to a full Chrome navigation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+
+class _Timer(object):
+    """Observes the seconds spent in a with block."""
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class _CounterChild(object):
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount=1.0):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramChild(object):
+    __slots__ = ('_bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self._bounds, value)] += 1
+        self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Metric(object):
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError()
+
+    def labels(self, *values):
+        """Returns the child metric of the given label values, keep it to record without lookups."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError('{} expects labels {}'.format(self.name, self.labelnames))
+            child = self._children[values] = self._new_child()
+        return child
+
+    @staticmethod
+    def _label_str(labelnames, values, extra=()):
+        pairs = list(zip(labelnames, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, _escape(str(v))) for k, v in pairs) + '}'
+
+    def _samples(self, children, labelnames):
+        raise NotImplementedError()
+
+    def _value(self, child):
+        """Returns the value of a child, as written in snapshots."""
+        return child.value
+
+    def _merge(self, child, value):
+        child.value += value
+
+    def render(self, children=None, labelnames=None):
+        """
+        :param children: dict Optional, the children to render instead of the ones of the process
+        :param labelnames: tuple Optional, the label names of these children
+        """
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} {}'.format(self.name, self.type),
+        ]
+        lines.extend(self._samples(self._children if children is None else children,
+                                   self.labelnames if labelnames is None else labelnames))
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """A value which only goes up."""
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1.0):
+        self._children[()].inc(amount)
+
+    def _samples(self, children, labelnames):
+        return ['{}{} {}'.format(self.name, self._label_str(labelnames, k), _num(c.value)) for k, c in children.items()]
+
+
+class Gauge(Counter):
+    """A value which goes up and down."""
+    type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def dec(self, amount=1.0):
+        self._children[()].dec(amount)
+
+    def set(self, value):
+        self._children[()].set(value)
+
+
+class Histogram(_Metric):
+    """Counts observations in buckets."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self._bounds = tuple(sorted(buckets))
+        super(Histogram, self).__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self._bounds)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+    def time(self):
+        return self._children[()].time()
+
+    def _value(self, child):
+        return [child.counts, child.sum]
+
+    def _merge(self, child, value):
+        counts, total = value
+        child.counts = [a + b for a, b in zip(child.counts, counts)]
+        child.sum += total
+
+    def _samples(self, children, labelnames):
+        samples = []
+        for key, child in children.items():
+            cumulative = 0
+            for bound, count in zip(self._bounds + (float('inf'),), child.counts):
+                cumulative += count
+                le = (('le', _num(bound)),)
+                samples.append('{}_bucket{} {}'.format(self.name, self._label_str(labelnames, key, le), cumulative))
+            samples.append('{}_sum{} {}'.format(self.name, self._label_str(labelnames, key), _num(child.sum)))
+            samples.append('{}_count{} {}'.format(self.name, self._label_str(labelnames, key), cumulative))
+        return samples
+
+
+def snapshot():
+    """Returns the values of every metric of the process, by name."""
+    return {metric.name: [[list(key), metric._value(child)] for key, child in metric._children.items()]
+            for metric in _registry}
+
+
+def _write_snapshot(path, values):
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'pid': os.getpid(), 'metrics': values}, f)
+    os.replace(path + '.tmp', path)
+
+
+def _snapshot_path(directory):
+    return os.path.join(directory, '{}.json'.format(os.getpid()))
+
+
+async def write_snapshots(directory, interval):
+    """Writes a snapshot of the metrics of the process to a directory every interval seconds, and when cancelled."""
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory)
+    try:
+        while True:
+            await asyncio.to_thread(_write_snapshot, path, snapshot())
+            await asyncio.sleep(interval)
+    finally:
+        _write_snapshot(path, snapshot())
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_snapshots(directory):
+    """Returns (pid, values) of the snapshots of the other processes in a directory."""
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error occurred when reading the metrics snapshot {path}: {e}")
+            continue
+        if data['pid'] != os.getpid():
+            snapshots.append((data['pid'], data['metrics']))
+    return snapshots
+
+
+def _merged(metric, snapshots):
+    """Returns the children of a metric summed over the snapshots, the gauges of live processes by worker."""
+    children = {}
+    for pid, values in snapshots:
+        gauge = isinstance(metric, Gauge)
+        if gauge and not _is_alive(pid):
+            continue  # the gauges of an exited worker are not true anymore, its counters still count
+        for key, value in values.get(metric.name, ()):
+            key = tuple(key) + ((str(pid),) if gauge else ())
+            child = children.get(key)
+            if child is None:
+                child = children[key] = metric._new_child()
+            metric._merge(child, value)
+    return children
+
+
+def render():
+    """Returns every metric of the process in the Prometheus text exposition format."""
+    return '\n'.join(metric.render() for metric in _registry) + '\n'
+
+
+async def render_all(directory):
+    """
+    Returns the metrics of every worker process writing snapshots to a directory, in the Prometheus
+    text exposition format. Values of the other processes are up to their last snapshot.
+    """
+    snapshots = [(os.getpid(), snapshot())] + await asyncio.to_thread(_read_snapshots, directory)
+    return '\n'.join(metric.render(_merged(metric, snapshots),
+                                    metric.labelnames + (('worker',) if isinstance(metric, Gauge) else ()))
+                     for metric in _registry) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _num(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+STAGE_SECONDS = Histogram(
+    'wsaio_stage_duration_seconds', 'Seconds spent in each stage of a search.', ['stage'])
+FUNCTION_SECONDS = Histogram(
+    'wsaio_function_duration_seconds', 'Seconds spent in functions decorated with a timer.', ['function'])
+BANS = Counter('wsaio_bans_total', 'Search engine responses with a ban status.', ['engine'])
+CACHE_HITS = Counter('wsaio_cache_hits_total', 'Lookups served without fetching again.', ['cache'])
+CACHE_MISSES = Counter('wsaio_cache_misses_total', 'Lookups which had to fetch.', ['cache'])
+CACHE_REFRESHES = Counter(
+    'wsaio_cache_refreshes_total', 'Cache entries refreshed in the background.', ['cache', 'trigger'])
+TIMEOUTS = Counter('wsaio_timeouts_total', 'Operations which exceeded their timeout.', ['stage'])
+SELECTOR_MISSES = Counter('wsaio_selector_misses_total', 'SERP pages on which a selector set matched no result.',
+                          ['engine', 'version'])
+LOCAL_INDEX_FALLBACKS = Counter('wsaio_local_index_fallbacks_total',
+                                'Searches answered with the local index, by cause: banned, error, empty or slow.',
+                                ['cause'])
+LOCAL_INDEX_DROPPED = Counter('wsaio_local_index_dropped_total',
+                              'Extracted pages not indexed because too many were waiting to be indexed.')
+PROXY_REQUESTS = Counter('wsaio_proxy_requests_total', 'Requests sent through each proxy, by outcome.',
+                         ['proxy', 'outcome'])
+PROXY_SCORE = Gauge('wsaio_proxy_score', 'Selection weight of each proxy: success rate squared per second of latency.',
+                    ['proxy'])
+PROXY_QUARANTINED = Gauge('wsaio_proxy_quarantined', '1 while the last request through a proxy failed.', ['proxy'])
+ENGINE_DEGRADED = Gauge('wsaio_engine_degraded', '1 while an engine is degraded and its searches are re-routed.',
+                        ['engine'])
+BROWSER_CONTEXTS_IN_USE = Gauge('wsaio_browser_contexts_in_use', 'Browser contexts currently open.')
+BROWSER_CONTEXTS_WAITING = Gauge('wsaio_browser_contexts_waiting', 'Searches waiting for a free browser context.')
+COLD_START = Gauge('wsaio_cold_start_seconds', 'Seconds from the import of the app to ready, by phase.', ['phase'])
+LOOP_LAG = Histogram('wsaio_event_loop_lag_seconds', 'Seconds the event loop woke up late.',
+                     buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+LOOP_BLOCKS = Counter('wsaio_event_loop_blocks_total', 'Callbacks which blocked the event loop, by function.',
+                      ['function'])
+
+# children of the hot path stages, bound once
+BROWSER_NAVIGATION = STAGE_SECONDS.labels('browser_navigation')
+SELECTOR_WAIT = STAGE_SECONDS.labels('selector_wait')
+SERP_PARSE = STAGE_SECONDS.labels('serp_parse')
+ENHANCEMENT_FETCH = STAGE_SECONDS.labels('enhancement_fetch')
+EXTRACTION = STAGE_SECONDS.labels('extraction')
+SERIALIZATION = STAGE_SECONDS.labels('serialization')
+PASSAGE_SCORING = STAGE_SECONDS.labels('passage_selection')
+RERANKING = STAGE_SECONDS.labels('rerank')
@@ -1,18 +1,27 @@
+import asyncio
+import logging
+
 from .results import SearchResults
-from .engines import search_engines_dict
+from . import engines  # registers the built-in engines
+from .registry import create_engine, engine_names
 from . import output as out
 from . import config as cfg
 
 
 class MultipleSearchEngines(object):
-    """Uses multiple search engines."""
+    """Uses multiple search engines, searched at once. The engines which need a browser share one."""
 
     def __init__(self, engines, proxy=cfg.PROXY, timeout=cfg.TIMEOUT):
-        self._engines = [
-            se(proxy, timeout)
-            for se in search_engines_dict.values()
-            if se.__name__.lower() in engines
-        ]
+        names = engine_names()
+        self._engines = []
+        for name in engines:
+            if name.lower() not in names:
+                out.console(u'Ignoring unknown search engine "{}"'.format(name), level=out.Level.warning)
+                continue
+            self._engines.append(create_engine(name, proxy, timeout))
+        browser_engines = [engine for engine in self._engines if engine.needs_browser]
+        for engine in browser_engines[1:]:
+            engine._persistent_browser = browser_engines[0]._persistent_browser
         self._filter = None
 
         self.ignore_duplicate_urls = False
@@ -24,16 +33,23 @@ class MultipleSearchEngines(object):
         """Filters search results based on the operator."""
         self._filter = operator
 
-    def search(self, query, pages=cfg.SEARCH_ENGINE_RESULTS_PAGES):
-        """Searches multiples engines and collects the results."""
+    async def search(self, query, pages=cfg.SEARCH_ENGINE_RESULTS_PAGES):
+        """Searches multiples engines at once and collects the results, in the order of the engines."""
         self.results = SearchResults()
+        self.banned_engines = []
         for engine in self._engines:
             engine.ignore_duplicate_urls = self.ignore_duplicate_urls
             engine.ignore_duplicate_domains = self.ignore_duplicate_domains
             if self._filter:
                 engine.set_search_operator(self._filter)
 
-            engine_results = engine.search(query, pages)
+        searches = await asyncio.gather(*[engine.search(query, pages) for engine in self._engines],
+                                        return_exceptions=True)
+        for engine, engine_results in zip(self._engines, searches):
+            if isinstance(engine_results, Exception):
+                logging.error(f"Error occurred when searching from {engine.__class__.__name__}: {engine_results}")
+                continue
+            engine_results = SearchResults(list(engine_results))
             if engine.ignore_duplicate_urls:
                 engine_results._results = [
                     item for item in engine_results._results
@@ -50,6 +66,12 @@ class MultipleSearchEngines(object):
                 self.banned_engines.append(engine.__class__.__name__)
         return self.results
 
+    async def close(self):
+        """Stops the browser of the engines."""
+        for engine in self._engines:
+            if engine.needs_browser:
+                await engine._persistent_browser.stop()
+
     def output(self, output=out.PRINT, path=None):
         """Prints search results and/or creates report files."""
         output = (output or '').lower()
@@ -58,20 +80,13 @@ class MultipleSearchEngines(object):
             path = cfg.OUTPUT_DIR + u'_'.join(query.split())
         out.console('')
 
-        if out.PRINT in output:
-            out.print_results(self._engines)
-        if out.HTML in output:
-            out.write_file(out.create_html_data(self._engines), path + u'.html')
-        if out.CSV in output:
-            out.write_file(out.create_csv_data(self._engines), path + u'.csv')
-        if out.JSON in output:
-            out.write_file(out.create_json_data(self._engines), path + u'.json')
+        out.write_report(self._engines, output, path)
 
 
 class AllSearchEngines(MultipleSearchEngines):
-    """Uses all search engines."""
+    """Uses all search engines, except the opt-in ones (search APIs and the local index) which must be named."""
 
     def __init__(self, proxy=cfg.PROXY, timeout=cfg.TIMEOUT):
         super(AllSearchEngines, self).__init__(
-            list(search_engines_dict), proxy, timeout
+            engine_names(opt_in=False), proxy, timeout
         )
@@ -1,6 +1,7 @@
 from __future__ import print_function
 
 import csv
+import html
 import json
 import io
 import re
@@ -13,7 +14,9 @@ except ImportError:
 
 from .utils import encode_str, decode_bytes
 from .libs import windows_cmd_encoding
-from .config import PYTHON_VERSION
+from .config import PYTHON_VERSION, PARQUET_BATCH_SIZE
+from .matcher import TermMatcher
+from .query import tokenize, query_words, is_cjk
 
 
 def print_results(search_engines):
@@ -26,60 +29,190 @@ def print_results(search_engines):
         console(u'')
 
 
-def create_csv_data(search_engines):
-    """CSV formats the search results."""
-    encoder = decode_bytes if PYTHON_VERSION == 3 else encode_str
-    data = [['query', 'engine', 'domain', 'URL', 'title', 'text']]
+def _snippet(item):
+    """Returns the text of a result, stored as 'snippet' (or 'text' by older engines)."""
+    return item.get('snippet', item.get('text', u''))
 
+
+def iter_results(search_engines):
+    """Yields (query, engine name, result) of every search result."""
     for engine in search_engines:
         for i in engine.results:
-            row = [
-                engine._query, engine.__class__.__name__,
-                i['host'], i['link'], i['title'], i['text']
-            ]
-            row = [encoder(i) for i in row]
-            data.append(row)
-    return data
+            yield engine._query, engine.__class__.__name__, i
+
+
+def iter_csv_rows(search_engines):
+    """Yields the CSV header, then one row per search result."""
+    encoder = decode_bytes if PYTHON_VERSION == 3 else encode_str
+    yield ['query', 'engine', 'domain', 'URL', 'title', 'text']
+
+    for query, engine_name, i in iter_results(search_engines):
+        row = [query, engine_name, i.get('host', u''), i['link'], i.get('title', u''), _snippet(i)]
+        yield [encoder(i) for i in row]
+
+
+def create_csv_data(search_engines):
+    """CSV formats the search results."""
+    return list(iter_csv_rows(search_engines))
+
+
+def iter_jsonl_lines(search_engines):
+    """Yields one JSON line per search result, with its query and engine."""
+    for query, engine_name, i in iter_results(search_engines):
+        yield json.dumps(dict(i, query=query, engine=engine_name), ensure_ascii=False) + u'\n'
+
+
+def iter_json_chunks(search_engines):
+    """Yields the JSON report of the search results piece by piece, one result at a time."""
+    query = search_engines[0]._query if search_engines else u''
+    yield u'{"query": ' + json.dumps(query) + u', "results": {'
+    for n, se in enumerate(search_engines):
+        yield (u', ' if n else u'') + json.dumps(se.__class__.__name__) + u': ['
+        for k, i in enumerate(se.results):
+            yield (u', ' if k else u'') + json.dumps(i)
+        yield u']'
+    yield u'}}'
 
 
 def create_json_data(search_engines):
     """JSON formats the search results."""
-    jobj = {
-        u'query': search_engines[0]._query,
-        u'results': {
-            se.__class__.__name__: [i for i in se.results]
-            for se in search_engines
-        }
-    }
-    return json.dumps(jobj)
+    return u''.join(iter_json_chunks(search_engines))
 
 
-def create_html_data(search_engines):
-    """HTML formats the search results."""
+def iter_html_chunks(search_engines):
+    """Yields the HTML report of the search results piece by piece, one row at a time."""
     query = decode_bytes(search_engines[0]._query) if search_engines else u''
-    tables = u''
+    highlighter = Highlighter(query)
+    html_head, html_tail = HtmlTemplate.html.split(u'{table}')
+    table_head, table_tail = HtmlTemplate.table.split(u'{rows}')
+    yield html_head.format(query=html.escape(query))
 
     for engine in search_engines:
-        rows = u''
+        yield table_head.format(engine=engine.__class__.__name__)
         for i, v in enumerate(engine.results, 1):
-            data = u''
+            data = []
             if u'title' in engine._filters:
-                data += HtmlTemplate.data.format(_replace_with_bold(query, v['title']))
+                data.append(HtmlTemplate.data.format(highlighter.markup(v['title'])))
             if u'text' in engine._filters:
-                data += HtmlTemplate.data.format(_replace_with_bold(query, v['text']))
-            link = _replace_with_bold(query, v['link']) if u'url' in engine._filters else v['link']
-            rows += HtmlTemplate.row.format(number=i, href=v['link'], link=link, data=data)
+                data.append(HtmlTemplate.data.format(highlighter.markup(_snippet(v))))
+            link = highlighter.markup(v['link']) if u'url' in engine._filters else html.escape(v['link'])
+            yield HtmlTemplate.row.format(number=i, href=html.escape(v['link']), link=link, data=u''.join(data))
+        yield table_tail.format()
+    yield html_tail.format()
+
+
+def create_html_data(search_engines):
+    """HTML formats the search results."""
+    return u''.join(iter_html_chunks(search_engines))
+
+
+def highlight_terms(query):
+    """
+    Returns the terms of a query to highlight: the whole query, its words with their symbols (c++),
+    and the words and CJK bigrams of tokenize. CJK characters are only highlighted alone when not part of a bigram.
+    """
+    words = query_words(query)
+    terms = tokenize(query)
+    bigram_chars = {c for term in terms if len(term) == 2 and all(map(is_cjk, term)) for c in term}
+    return [u' '.join(words)] + words + [term for term in terms if not (len(term) == 1 and term in bigram_chars)]
+
+
+class Highlighter(object):
+    """Finds the query terms in texts in a single pass per text, with one matcher built per query."""
+
+    def __init__(self, query):
+        self.matcher = TermMatcher(highlight_terms(query or u''))
+
+    def spans(self, text):
+        """Returns the [start, end) offsets of the query terms in the text, adjacent ones merged."""
+        spans = []
+        for start, end in self.matcher.spans(text or u''):
+            if spans and start == spans[-1][1]:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+        return spans
+
+    def markup(self, text, tag=u'b'):
+        """Returns the text HTML escaped, with the query terms in <tag> tags."""
+        text = text or u''
+        parts, position = [], 0
+        for start, end in self.spans(text):
+            parts.append(html.escape(text[position:start]))
+            parts.append(u'<{0}>{1}</{0}>'.format(tag, html.escape(text[start:end])))
+            position = end
+        parts.append(html.escape(text[position:]))
+        return u''.join(parts)
+
+
+def write_parquet(search_engines, path, batch_size=PARQUET_BATCH_SIZE):
+    """Writes the search results to a Parquet file, batch_size rows per row group. Requires pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        console(u'pyarrow is required for Parquet output: pip install pyarrow', level=Level.error)
+        return
+
+    columns = ['query', 'engine', 'host', 'link', 'title', 'snippet']
+    schema = pa.schema([(column, pa.string()) for column in columns])
+
+    def flush(writer, batch):
+        writer.write_table(pa.Table.from_pydict(
+            {column: [row[k] for row in batch] for k, column in enumerate(columns)}, schema=schema))
+
+    try:
+        with pq.ParquetWriter(path, schema) as writer:
+            batch = []
+            for query, engine_name, i in iter_results(search_engines):
+                batch.append((query, engine_name, i.get('host'), i.get('link'), i.get('title'), _snippet(i)))
+                if len(batch) >= batch_size:
+                    flush(writer, batch)
+                    batch = []
+            if batch:
+                flush(writer, batch)
+        console(u'Output file: ' + path)
+    except (IOError, pa.ArrowException) as e:
+        console(str(e), level=Level.error)
+
+
+def write_stream(chunks, path, encoding='utf-8', csv_rows=False):
+    """Writes an iterable of text chunks, or of CSV rows, to a file as it is consumed."""
+    try:
+        with io.open(path, 'w', encoding=encoding, newline='') as f:
+            if csv_rows:
+                csv.writer(f).writerows(chunks)
+            else:
+                for chunk in chunks:
+                    f.write(chunk)
+        console(u'Output file: ' + path)
+    except IOError as e:
+        console(str(e), level=Level.error)
+
 
-        engine_name = engine.__class__.__name__
-        tables += HtmlTemplate.table.format(engine=engine_name, rows=rows)
-    return HtmlTemplate.html.format(query=query, table=tables)
+def requested_formats(output):
+    """Returns the set of output formats named in a string such as 'html,csv'."""
+    return set(re.findall(r'[a-z]+', (output or u'').lower()))
 
 
-def _replace_with_bold(query, data):
-    """Places the query in <b> tags."""
-    for match in re.findall(query, data, re.I):
-        data = data.replace(match, u'<b>{}</b>'.format(match))
-    return data
+def write_report(search_engines, output, path):
+    """
+    Prints the search results and/or streams report files of the formats named in output.
+    Supported output formats: print, html, csv, json, jsonl, parquet.
+    """
+    formats = requested_formats(output)
+    if PRINT in formats:
+        print_results(search_engines)
+    if HTML in formats:
+        write_stream(iter_html_chunks(search_engines), path + u'.html')
+    if CSV in formats:
+        write_stream(iter_csv_rows(search_engines), path + u'.csv', csv_rows=True)
+    if JSON in formats:
+        write_stream(iter_json_chunks(search_engines), path + u'.json')
+    if JSONL in formats:
+        write_stream(iter_jsonl_lines(search_engines), path + u'.jsonl')
+    if PARQUET in formats:
+        write_parquet(search_engines, path + u'.parquet')
 
 
 def write_file(data, path, encoding='utf-8'):
@@ -118,7 +251,9 @@ Level = namedtuple('Level', ['info', 'warning', 'error'])(
 PRINT = 'print'
 HTML = 'html'
 JSON = 'json'
+JSONL = 'jsonl'
 CSV = 'csv'
+PARQUET = 'parquet'
 
 
 class HtmlTemplate:
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import base64
+import json
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+from .cache import make_backend
+from .config import CURSOR_CACHE_SIZE, CURSOR_TTL, CURSOR_MAX_PAGE
+from .query import cache_key
+
+_STATE_KEYS = {'id': str, 'engine': str, 'query': str, 'page': int, 'current_page': int, 'request': dict}
+
+
+def encode_cursor(state):
+    """Returns the opaque cursor of a pagination state."""
+    data = json.dumps(state, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor, engines):
+    """
+    Returns the pagination state of a cursor, raises ValueError when it is malformed,
+    made by an engine which is not searched, or leads off the engine's site or to another query than its own.
+
+    :param engines: dict The engines which may search the next page, by class name
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        state = json.loads(data.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Malformed cursor')
+    if not isinstance(state, dict) or any(not isinstance(state.get(key), kind) for key, kind in _STATE_KEYS.items()):
+        raise ValueError('Malformed cursor')
+    engine = engines.get(state['engine'])
+    if engine is None:
+        raise ValueError('Cursor of another search engine')
+    url = state['request'].get('url')
+    if not isinstance(url, str) or not url.startswith(engine._base_url + '/'):
+        raise ValueError('Cursor of another site')
+    # the pages of predictable engines are rebuilt from the query of the state, the others follow the URL
+    if not engine.predictable_pagination:
+        url_query = parse_qs(urlsplit(url).query).get(engine._query_param)
+        if not url_query or cache_key(url_query[0]) != cache_key(state['query']):
+            raise ValueError('Cursor of another query')
+    if not 1 < state['page'] <= CURSOR_MAX_PAGE:
+        raise ValueError('Cursor past the last page')
+    return state
+
+
+class CursorCache(object):
+    """
+    Keeps the in-flight pagination of searches for ttl seconds: the state of the page after the last one
+    searched for a query, the links already returned by each pagination, and every page searched through
+    a cursor with the state of its next page, so that a cursor sent again is not searched again.
+    """
+
+    def __init__(self, max_size=CURSOR_CACHE_SIZE, ttl=CURSOR_TTL, backend=None):
+        self.ttl = ttl
+        self.backend = backend if backend is not None else make_backend('cursor', max_size)
+
+    async def _get(self, key):
+        entry = await self.backend.get(key)
+        return entry[1] if entry is not None else None
+
+    async def start(self, serp_key, state, links):
+        """Starts the pagination of a search, its state is kept under the SERP cache key."""
+        state = dict(state, id=uuid.uuid4().hex)
+        await self.backend.set(u'links:' + state['id'], list(links), self.ttl)
+        await self.backend.set(u'serp:' + serp_key, state, self.ttl)
+
+    async def state(self, serp_key):
+        """Returns the state of the next page of a search, or None."""
+        return await self._get(u'serp:' + serp_key)
+
+    async def links(self, state):
+        """Returns the links returned before the page of a state."""
+        return await self._get(u'links:' + state['id']) or []
+
+    async def page(self, state):
+        """Returns the (results, next state) of the page of a state, or None when it was not searched."""
+        entry = await self._get(u'page:{}:{}'.format(state['id'], state['page']))
+        return (entry['results'], entry['next']) if entry is not None else None
+
+    async def set_page(self, state, results, next_state):
+        """Stores a page searched through a cursor, its links are not collected again by the next pages."""
+        if next_state is not None:
+            next_state = dict(next_state, id=state['id'])
+        links = await self.links(state)
+        await self.backend.set(u'links:' + state['id'], links + [res['link'] for res in results], self.ttl)
+        await self.backend.set(u'page:{}:{}'.format(state['id'], state['page']),
+                         {'results': results, 'next': next_state}, self.ttl)
+        return next_state
+
+    async def clear(self):
+        await self.backend.clear()
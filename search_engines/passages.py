@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+
+from .config import PASSAGE_SIZE, PASSAGE_TOP_K, PASSAGE_TOKEN_BUDGET
+from .matcher import TermMatcher
+from .query import tokenize, estimate_tokens, truncate_tokens
+from .rerank import BM25
+
+# sentence ends, latin and CJK
+_SENTENCES = re.compile(u'(?<=[.!?;。！？；])\\s*')
+
+
+def split_passages(text, size=PASSAGE_SIZE):
+    """
+    Splits a text into passages of about size tokens, made of whole sentences.
+    A paragraph end closes a passage once it is half full.
+    """
+    passages, sentences, tokens = [], [], 0
+    for paragraph in (text or u'').split(u'\n'):
+        for sentence in _SENTENCES.split(paragraph.strip()):
+            if not sentence:
+                continue
+            sentence_tokens = estimate_tokens(sentence)
+            if sentences and tokens + sentence_tokens > size:
+                passages.append(u' '.join(sentences))
+                sentences, tokens = [], 0
+            sentences.append(sentence)
+            tokens += sentence_tokens
+        if tokens >= size // 2:
+            passages.append(u' '.join(sentences))
+            sentences, tokens = [], 0
+    if sentences:
+        passages.append(u' '.join(sentences))
+    return passages
+
+
+def select_passages(query, text, top_k=PASSAGE_TOP_K, budget=PASSAGE_TOKEN_BUDGET, matcher=None):
+    """
+    Returns the top_k passages of a text most relevant to the query, within budget tokens, in text order.
+    Query term frequencies are counted by one keyword automaton pass per passage and scored with BM25,
+    the beginning of the text is returned when no passage contains a query term.
+    :param matcher: TermMatcher Optional, the matcher of the query terms, to share it between texts
+    """
+    passages = split_passages(text)
+    if not passages:
+        return u''
+    matcher = matcher if matcher is not None else TermMatcher(tokenize(query))
+    term_frequencies = [matcher.count(passage) for passage in passages]
+    if not any(term_frequencies):
+        return truncate_tokens(u' '.join(passages), budget)
+
+    lengths = [estimate_tokens(passage) for passage in passages]
+    scores = BM25(term_frequencies, lengths).scores(query)
+    ranked = sorted((i for i in range(len(passages)) if scores[i] > 0), key=lambda i: (-scores[i], i))
+
+    selected, used = [], 0
+    for i in ranked[:top_k]:
+        if used + lengths[i] > budget:
+            if not selected:
+                selected.append((i, truncate_tokens(passages[i], budget)))
+                used = budget
+            continue
+        selected.append((i, passages[i]))
+        used += lengths[i]
+    return u' ... '.join(passage for _, passage in sorted(selected))
@@ -4,18 +4,27 @@
 import asyncio
 import re
 import socket
+import time
 from collections import namedtuple
+from urllib.parse import urlsplit
 
-from fake_useragent import UserAgent
-from playwright.async_api import async_playwright
-from playwright_stealth import stealth_async
-
-from search_engines.config import TIMEOUT, PROXY
+from search_engines.config import TIMEOUT, PROXY, BROWSER_POOL_SIZE
 from search_engines.decorator import atimer
+from search_engines.fingerprints import next_fingerprint, set_chrome_version
+from search_engines.proxies import proxy_pool as default_proxy_pool, browser_proxy
+from search_engines.metrics import BROWSER_NAVIGATION, SELECTOR_WAIT, TIMEOUTS, BROWSER_CONTEXTS_IN_USE, \
+    BROWSER_CONTEXTS_WAITING
+from search_engines.tracing import span
 from search_engines.utils import *
 
-ua = UserAgent()
-FAKE_USER_AGENT = ua.chrome
+# a local page navigated once at startup, so the first search does not pay for the browser warm up
+WARMUP_PAGE = 'data:text/html,<html><head><title>warmup</title></head><body></body></html>'
+
+# statuses of a refused search, answered at once without waiting for the content
+BLOCK_STATUSES = (403, 429, 503)
+
+# blocked: None, or the block page signature matched ('HTTP 429', a URL part or a CSS selector)
+Response = namedtuple('response', ['http', 'html', 'blocked'], defaults=[None])
 
 
 def get_local_ip() -> str | None:
@@ -36,30 +45,89 @@ def is_valid_url(url: str) -> bool:
 
 class PersistentBrowser(object):
 
-    def __init__(self, timeout=TIMEOUT, proxy=PROXY):
+    def __init__(self, timeout=TIMEOUT, proxy=PROXY, pool_size=BROWSER_POOL_SIZE, proxy_pool=None):
+        """
+        :param proxy: str Optional, the proxy of the whole browser
+        :param proxy_pool: ProxyPool Optional, proxies chosen per browser context, the configured PROXIES by default
+        """
         self.browser = None
         self.page = None
+        self._playwright = None
         self.timeout = timeout
         self.proxy = self._set_proxy(proxy)
-        self.user_Agent = FAKE_USER_AGENT
-        self.response = namedtuple('response', ['http', 'html'])
+        self.proxy_pool = proxy_pool if proxy_pool is not None else default_proxy_pool
+        self.response = Response
+        # every search sharing this browser waits here for a free context slot
+        self._pool = asyncio.Semaphore(pool_size)
+        # concurrent first searches wait for the same launch
+        self._start_lock = asyncio.Lock()
 
     async def start(self):
-        if self.browser is None:
-            playwright = await async_playwright().start()
-            chromium = playwright.chromium
-            self.browser = await chromium.launch(
-                channel='chrome',
-                timeout=self.timeout,
-                headless=True,
-                proxy={'server': self.proxy} if self.proxy else None,
-            )
+        """Launches the browser, once for all the searches and forks of engines sharing it."""
+        async with self._start_lock:
+            if self.browser is not None:
+                return
+            from playwright.async_api import async_playwright
+
+            self._playwright = await async_playwright().start()
+            try:
+                self.browser = await self._playwright.chromium.launch(
+                    channel='chrome',
+                    timeout=self.timeout,
+                    headless=True,
+                    proxy={'server': self.proxy} if self.proxy else None,
+                )
+            except BaseException:
+                await self._playwright.stop()
+                self._playwright = None
+                raise
+            # the user agents and client hints of the contexts tell the version of the installed Chrome
+            set_chrome_version(self.browser.version)
 
     async def stop(self):
         if self.browser is not None:
             await self.browser.close()
             self.browser = None
             self.page = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def warm(self):
+        """Launches the browser and navigates a stealthed context to a local page."""
+        await self.start()
+        context, page = await self._new_page()
+        try:
+            await page.goto(WARMUP_PAGE)
+        finally:
+            await context.close()
+
+    async def _new_page(self, **context_options):
+        """
+        Opens a browser context with the next fingerprint of the rotation and a stealthed page in it.
+        The user agent, client hints, languages and platform all come from the same fingerprint.
+        """
+        from playwright_stealth import StealthConfig, stealth_async
+
+        fingerprint = next_fingerprint()
+        context = await self.browser.new_context(
+            screen=fingerprint.screen,
+            locale=fingerprint.locale,
+            user_agent=fingerprint.user_agent,
+            extra_http_headers=fingerprint.client_hints(),
+            **context_options,
+        )
+        try:
+            page = await context.new_page()
+            await stealth_async(page, StealthConfig(
+                nav_user_agent=fingerprint.user_agent,
+                nav_platform=fingerprint.platform,
+                languages=fingerprint.languages(),
+            ))
+        except Exception:
+            await context.close()
+            raise
+        return context, page
 
     async def __aenter__(self):
         await self.start()
@@ -84,6 +152,18 @@ class PersistentBrowser(object):
             url = quote_url(url)
         return url
 
+    async def _acquire_context_slot(self):
+        BROWSER_CONTEXTS_WAITING.inc()
+        try:
+            await self._pool.acquire()
+        finally:
+            BROWSER_CONTEXTS_WAITING.dec()
+        BROWSER_CONTEXTS_IN_USE.inc()
+
+    def _release_context_slot(self):
+        BROWSER_CONTEXTS_IN_USE.dec()
+        self._pool.release()
+
     # block elements (for some reason makes it slower)
     async def intercept(self, route):
         if route.request.resource_type in {"image", "font", 'media'}:
@@ -91,8 +171,33 @@ class PersistentBrowser(object):
         else:
             return await route.continue_()
 
+    @staticmethod
+    async def _block_signature(page, response, content_selector, block_selectors=(), block_urls=()):
+        """Returns the signature of the block page, captcha or consent interstitial shown instead of the content, or None."""
+        if response is not None and response.status in BLOCK_STATUSES:
+            return 'HTTP {}'.format(response.status)
+        if block_urls:
+            parts = urlsplit(page.url)
+            location = parts.netloc + parts.path  # the query string holds the searched words
+            for part in block_urls:
+                if part in location:
+                    return part
+        if not block_selectors or await page.query_selector(content_selector) is not None:
+            return None
+        for selector in block_selectors:
+            if await page.query_selector(selector) is not None:
+                return selector
+        return None
+
     @atimer()
-    async def get_raw_html(self, request_url: str, content_selector:str) -> namedtuple:
+    async def get_raw_html(self, request_url: str, content_selector:str, block_selectors=(), block_urls=()) -> namedtuple:
+        """
+        Navigates to a page and returns its html once the content selector is shown.
+        The content selector is raced against the block page signatures: a refused status, a URL part
+        or a CSS selector, and a blocked response is returned as soon as one of them shows up.
+        """
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
         request_url = self._quote(request_url)
 
         if not is_valid_url(request_url):
@@ -101,49 +206,69 @@ class PersistentBrowser(object):
         if not self.browser:
             raise RuntimeError("Browser context is not initialized")
 
-        context = await self.browser.new_context(
-            screen={'width': 1280, 'height': 720},
-            locale='zh-CN.utf8',
-            user_agent=FAKE_USER_AGENT,
-        )
-
+        await self._acquire_context_slot()
         try:
-            page = await context.new_page()
-            await stealth_async(page)
-            response = await page.goto(request_url)
-            await page.wait_for_selector(content_selector)
-            raw_html = await page.content()
-            # await page.screenshot(path=f'screenshot_{datetime.now().strftime("%Y%m%d%H%M%S")}.png')
-            return self.response(http=response.status, html=raw_html)
+            proxy = self.proxy_pool.choose() if len(self.proxy_pool) else None
+            context, page = await self._new_page(**({'proxy': browser_proxy(proxy)} if proxy else {}))
+
+            started = time.perf_counter()
+            try:
+                stage = 'browser_navigation'
+                with BROWSER_NAVIGATION.time(), span(stage, url=request_url):
+                    response = await page.goto(request_url)
+                blocked = await self._block_signature(page, response, content_selector, (), block_urls)
+                if blocked is None:
+                    stage = 'selector_wait'
+                    with SELECTOR_WAIT.time(), span(stage, selector=content_selector):
+                        await page.wait_for_selector(', '.join([content_selector] + list(block_selectors)))
+                    blocked = await self._block_signature(page, None, content_selector, block_selectors)
+                raw_html = await page.content()
+                # await page.screenshot(path=f'screenshot_{datetime.now().strftime("%Y%m%d%H%M%S")}.png')
+                if proxy is not None:
+                    if blocked is None:
+                        self.proxy_pool.succeeded(proxy, time.perf_counter() - started)
+                    else:
+                        self.proxy_pool.failed(proxy, banned=True)
+                return self.response(http=response.status, html=raw_html, blocked=blocked)
 
+            except PlaywrightTimeoutError:
+                TIMEOUTS.labels(stage).inc()
+                if proxy is not None:
+                    self.proxy_pool.failed(proxy)
+                raise
+
+            except Exception:
+                if proxy is not None:
+                    self.proxy_pool.failed(proxy)
+                raise
+
+            finally:
+                await context.close()
         finally:
-            await context.close()
+            self._release_context_slot()
 
     @atimer()
     async def search_main_page(self, base_url: str, query: str, content_selector:str) -> namedtuple:
         if not self.browser:
             raise RuntimeError("Browser context is not initialized")
 
-        context = await self.browser.new_context(
-            base_url=base_url,
-            screen={'width': 1280, 'height': 720},
-            locale='zh-CN.utf8',
-            user_agent=FAKE_USER_AGENT,
-        )
-
+        await self._acquire_context_slot()
         try:
-            page = await context.new_page()
-            await stealth_async(page)
-            response = await page.goto(base_url) # "domcontentloaded", "load", "networkidle", "commit"
-            await page.get_by_role("searchbox").fill(query)
-            await page.get_by_role("searchbox").press('Enter')
-            await page.wait_for_selector(content_selector)
-            raw_html = await page.content()
-            # await page.screenshot(path=f'screenshot_{datetime.now().strftime("%Y%m%d%H%M%S")}.png')
-            return self.response(http=response.status, html=raw_html)
+            context, page = await self._new_page(base_url=base_url)
 
+            try:
+                response = await page.goto(base_url) # "domcontentloaded", "load", "networkidle", "commit"
+                await page.get_by_role("searchbox").fill(query)
+                await page.get_by_role("searchbox").press('Enter')
+                await page.wait_for_selector(content_selector)
+                raw_html = await page.content()
+                # await page.screenshot(path=f'screenshot_{datetime.now().strftime("%Y%m%d%H%M%S")}.png')
+                return self.response(http=response.status, html=raw_html)
+
+            finally:
+                await context.close()
         finally:
-            await context.close()
+            self._release_context_slot()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from .config import PROXIES, USE_TOR, TOR, PROXY_LATENCY_SMOOTHING, PROXY_QUARANTINE, PROXY_MAX_QUARANTINE
+from .metrics import PROXY_REQUESTS, PROXY_SCORE, PROXY_QUARANTINED
+
+# proxy schemes aiohttp can send requests through, it does not support TLS to an https proxy
+HTTP_SCHEMES = ('http',)
+SOCKS_SCHEMES = ('socks4', 'socks5', 'socks5h')
+
+
+def proxy_label(url):
+    """Returns a proxy URL without its credentials, for logs and metrics."""
+    parts = urlsplit(url)
+    if not parts.scheme or not parts.hostname:
+        raise ValueError('Invalid proxy format!')
+    return u'{}://{}'.format(parts.scheme, parts.hostname + (':{}'.format(parts.port) if parts.port else ''))
+
+
+def check_proxy(url):
+    """Raises ValueError for a proxy URL which can not be used: malformed, or a SOCKS proxy with credentials."""
+    parts = urlsplit(url)
+    proxy_label(url)
+    if parts.scheme in SOCKS_SCHEMES and (parts.username or parts.password):
+        raise ValueError('Chromium does not support SOCKS proxy authentication, remove the credentials of {} '
+                         'or use an http proxy'.format(proxy_label(url)))
+
+
+def browser_proxy(url):
+    """Returns the playwright proxy settings of a proxy URL, credentials apart."""
+    check_proxy(url)
+    parts = urlsplit(url)
+    scheme = 'socks5' if parts.scheme == 'socks5h' else parts.scheme  # chromium resolves names through socks5
+    settings = {'server': u'{}://{}'.format(scheme, proxy_label(url).split('://', 1)[1])}
+    if parts.username:
+        settings['username'] = parts.username
+        settings['password'] = parts.password or ''
+    return settings
+
+
+class ProxyStats(object):
+    """The health of a proxy: smoothed latency, outcomes and quarantine."""
+
+    def __init__(self, url):
+        self.url = url
+        self.label = proxy_label(url)
+        self.latency = None
+        '''exponentially smoothed seconds of the successful requests'''
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.quarantined_until = 0.0
+
+    @property
+    def score(self):
+        """Success rate (smoothed with one success and one failure) per second of latency."""
+        success_rate = (self.successes + 1.0) / (self.successes + self.failures + 2.0)
+        return success_rate * success_rate / max(self.latency or 1.0, 0.05)
+
+
+class ProxyPool(object):
+    """
+    Chooses proxies at random, weighted by their score: success rate squared over smoothed latency.
+    A failed or banned request quarantines its proxy for quarantine seconds, doubled by each
+    consecutive failure up to max_quarantine. A success ends the backoff.
+    Raises ValueError for a proxy which can not be used, see check_proxy.
+    """
+
+    def __init__(self, proxies=(), smoothing=PROXY_LATENCY_SMOOTHING, quarantine=PROXY_QUARANTINE,
+                 max_quarantine=PROXY_MAX_QUARANTINE):
+        self.smoothing = smoothing
+        self.quarantine = quarantine
+        self.max_quarantine = max_quarantine
+        for url in proxies:
+            check_proxy(url)
+        self._stats = {url: ProxyStats(url) for url in proxies}
+        self._lock = threading.Lock()
+        for stats in self._stats.values():
+            PROXY_SCORE.labels(stats.label).set(stats.score)
+            PROXY_QUARANTINED.labels(stats.label).set(0)
+
+    def __len__(self):
+        return len(self._stats)
+
+    def choose(self, schemes=None):
+        """
+        Returns a proxy URL out of quarantine, or the one released first when all are quarantined,
+        or None when the pool has no proxy of the schemes.
+
+        :param schemes: tuple Optional, the accepted proxy schemes, all by default
+        """
+        with self._lock:
+            candidates = [stats for stats in self._stats.values()
+                          if schemes is None or urlsplit(stats.url).scheme in schemes]
+            if not candidates:
+                return None
+            now = time.monotonic()
+            available = [stats for stats in candidates if stats.quarantined_until <= now]
+            if not available:
+                return min(candidates, key=lambda stats: stats.quarantined_until).url
+            return random.choices(available, weights=[stats.score for stats in available])[0].url
+
+    def succeeded(self, url, latency):
+        with self._lock:
+            stats = self._stats.get(url)
+            if stats is None:
+                return
+            stats.successes += 1
+            stats.consecutive_failures = 0
+            stats.quarantined_until = 0.0
+            stats.latency = latency if stats.latency is None else \
+                stats.latency + self.smoothing * (latency - stats.latency)
+            self._export(stats, 'success')
+
+    def failed(self, url, banned=False):
+        """Quarantines a proxy after a request which failed, or was banned."""
+        with self._lock:
+            stats = self._stats.get(url)
+            if stats is None:
+                return
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            backoff = min(self.quarantine * 2 ** (stats.consecutive_failures - 1), self.max_quarantine)
+            stats.quarantined_until = time.monotonic() + backoff
+            self._export(stats, 'banned' if banned else 'error')
+
+    def stats(self):
+        """Returns the health of every proxy, best score first."""
+        with self._lock:
+            now = time.monotonic()
+            return [{'proxy': stats.label, 'score': stats.score, 'latency': stats.latency,
+                     'successes': stats.successes, 'failures': stats.failures,
+                     'quarantined': max(0.0, stats.quarantined_until - now)}
+                    for stats in sorted(self._stats.values(), key=lambda stats: -stats.score)]
+
+    @staticmethod
+    def _export(stats, outcome):
+        PROXY_REQUESTS.labels(stats.label, outcome).inc()
+        PROXY_SCORE.labels(stats.label).set(stats.score)
+        PROXY_QUARANTINED.labels(stats.label).set(1 if stats.consecutive_failures else 0)
+
+
+def configured_proxies():
+    """Returns PROXIES, with TOR when USE_TOR is set."""
+    return list(PROXIES) + ([TOR] if USE_TOR and TOR not in PROXIES else [])
+
+
+proxy_pool = ProxyPool(configured_proxies())
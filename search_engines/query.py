@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import re
+import unicodedata
+
+_PUNCTUATION = {'P', 'S'}
+_SPACES = re.compile(r'\s+')
+_CJK_RANGES = u'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af'
+# single CJK characters, or runs of other letters and digits
+_TOKENS = re.compile(u'[{0}]|[^\\W_{0}]+'.format(_CJK_RANGES))
+_CJK = re.compile(u'[{}]'.format(_CJK_RANGES))
+# punctuation stripped from the ends of the words of a query, symbols such as c++ or c# are kept
+_WORD_EDGES = u'"\'\u201c\u201d\u2018\u2019\u00ab\u00bb()[]{}<>,.;:!?'
+
+
+def normalize_query(query):
+    """
+    Returns the query in NFKC form (full-width to half-width), casefolded,
+    with punctuation replaced by spaces and whitespace collapsed.
+    """
+    query = unicodedata.normalize('NFKC', query or u'').casefold()
+    query = u''.join(u' ' if unicodedata.category(c)[0] in _PUNCTUATION else c for c in query)
+    return _SPACES.sub(u' ', query).strip()
+
+
+def fold(text):
+    """
+    Returns a text in NFKC form and casefolded like the terms of tokenize, and the offset in the text of each
+    of its characters, None when they keep their offsets. A character with its combining marks is folded at once.
+    """
+    if text.isascii():
+        return text.lower(), None
+    if unicodedata.is_normalized('NFKC', text):
+        folded = text.casefold()
+        if len(folded) == len(text):
+            return folded, None
+    chunks, offsets, start = [], [], 0
+    for end in range(1, len(text) + 1):
+        if end < len(text) and unicodedata.combining(text[end]):
+            continue
+        chunk = unicodedata.normalize('NFKC', text[start:end]).casefold()
+        chunks.append(chunk)
+        offsets.extend([start] * len(chunk))
+        start = end
+    return u''.join(chunks), offsets
+
+
+def query_words(query):
+    """Returns the folded words of a query, without surrounding punctuation but with their symbols (c++, c#)."""
+    words = (word.strip(_WORD_EDGES) for word in fold(query or u'')[0].split())
+    return [word for word in words if word]
+
+
+def cache_key(query):
+    """Returns the key shared by queries differing only by width, case, punctuation, spacing or word order."""
+    return u' '.join(sorted(normalize_query(query).split()))
+
+
+def tokenize(text):
+    """Returns the search terms of a text: latin words, and CJK characters with their bigrams."""
+    text = normalize_query(text)
+    tokens = []
+    for chunk in text.split():
+        parts = _TOKENS.findall(chunk)
+        for i, part in enumerate(parts):
+            tokens.append(part)
+            if _CJK.match(part) and i + 1 < len(parts) and _CJK.match(parts[i + 1]):
+                tokens.append(part + parts[i + 1])
+    return tokens
+
+
+def is_cjk(char):
+    return bool(_CJK.match(char))
+
+
+def estimate_tokens(text):
+    """Returns a rough count of the LLM tokens of a text: its words plus its CJK characters."""
+    return len(_TOKENS.findall(text or u''))
+
+
+def truncate_tokens(text, max_tokens):
+    """Returns the beginning of a text holding at most max_tokens estimated tokens."""
+    for i, match in enumerate(_TOKENS.finditer(text or u'')):
+        if i == max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def simhash(text, bits=64):
+    """Returns the SimHash of the character trigrams of a text, close texts get close hashes."""
+    text = u' {} '.format(text)
+    weights = [0] * bits
+    for i in range(max(1, len(text) - 2)):
+        digest = hashlib.blake2b(text[i:i + 3].encode('utf-8'), digest_size=bits // 8).digest()
+        value = int.from_bytes(digest, 'big')
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+
+def similarity(hash_a, hash_b, bits=64):
+    """Returns the share of equal bits of two SimHashes."""
+    return 1 - bin(hash_a ^ hash_b).count('1') / bits
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+from .config import SERP_RATE_LIMIT, SERP_RATE_BURST
+
+
+class TokenBucket(object):
+    """Lets `rate` operations per second through on average, and up to `burst` at once."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Waits for a token, callers are served in arrival order."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+_limiters = {}
+
+
+def set_rate_limit(name, rate, burst=SERP_RATE_BURST):
+    """Limits the SERP navigations of an engine to rate per second, None removes the limit."""
+    if rate:
+        _limiters[name] = TokenBucket(rate, burst)
+    else:
+        _limiters.pop(name, None)
+
+
+def rate_limiter(name, rate=None, burst=SERP_RATE_BURST):
+    """
+    Returns the token bucket of an engine, created on first use from SERP_RATE_LIMIT,
+    or else from the default rate of the engine, or None.
+    """
+    if name not in _limiters and (SERP_RATE_LIMIT or rate):
+        set_rate_limit(name, SERP_RATE_LIMIT or rate, burst)
+    return _limiters.get(name)
+
+
+_slots = {}
+
+
+def concurrency_limiter(name, max_concurrency):
+    """Returns the semaphore bounding the SERP navigations of an engine at once, or None without bound."""
+    if not max_concurrency:
+        return None
+    if name not in _slots:
+        _slots[name] = asyncio.Semaphore(max_concurrency)
+    return _slots[name]
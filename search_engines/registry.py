@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+from importlib.metadata import entry_points
+
+from .config import PROXY, TIMEOUT
+
+# entry point group of the engines of other packages, e.g. in their pyproject.toml:
+#   [project.entry-points."websearchaio.engines"]
+#   my_engine = "my_package.engines:MyEngine"
+ENTRY_POINT_GROUP = 'websearchaio.engines'
+
+_engines = {}
+'''name -> registered engine class'''
+_entry_points = None
+'''name -> engine entry point, discovered on the first lookup of a name which is not registered'''
+
+
+def register(name):
+    """Class decorator registering a SearchEngine subclass under a name, its capabilities are class attributes."""
+    def decorator(cls):
+        cls.name = name
+        _engines[name] = cls
+        return cls
+    return decorator
+
+
+def _discovered():
+    global _entry_points
+    if _entry_points is None:
+        _entry_points = {entry_point.name: entry_point for entry_point in entry_points(group=ENTRY_POINT_GROUP)}
+    return _entry_points
+
+
+def engine_names(opt_in=True):
+    """
+    Returns the names of the registered engines and of the engines of entry points, which are not loaded.
+    :param opt_in: bool Optional, False leaves out the engines searched only when named, the engines
+                   of entry points are then loaded to know it
+    """
+    names = sorted(set(_engines) | set(_discovered()))
+    if opt_in:
+        return names
+    default_names = []
+    for name in names:
+        try:
+            if not engine_class(name).opt_in:
+                default_names.append(name)
+        except Exception as e:
+            logging.error(f"Error occurred when loading the search engine {name}: {e}")
+    return default_names
+
+
+def engine_class(name):
+    """Returns the engine class registered under a name, loaded from its entry point on first use."""
+    name = name.lower()
+    if name not in _engines:
+        entry_point = _discovered().get(name)
+        if entry_point is None:
+            raise ValueError('Unknown search engine: {}'.format(name))
+        register(name)(entry_point.load())
+    return _engines[name]
+
+
+def create_engine(name, proxy=PROXY, timeout=TIMEOUT):
+    return engine_class(name)(proxy, timeout)
+
+
+def registered_engines():
+    """Returns the registered engine classes by name, without the engines of entry points not loaded yet."""
+    return _engines
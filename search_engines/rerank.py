@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+from collections import Counter
+
+from .config import BM25_K1, BM25_B, RRF_K
+from .query import tokenize
+
+
+class BM25(object):
+    """
+    Okapi BM25 over a small set of documents, scored term at a time:
+    each query term updates the scores of all the documents containing it in one pass.
+    """
+
+    def __init__(self, term_frequencies, lengths=None, k1=BM25_K1, b=BM25_B):
+        """
+        :param term_frequencies: list of term -> frequency Counters, one per document
+        :param lengths: list Optional, the document lengths, the sums of their term frequencies by default
+        """
+        self.k1 = k1
+        self.b = b
+        self.term_frequencies = term_frequencies
+        self.lengths = lengths if lengths is not None else [sum(tf.values()) for tf in term_frequencies]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        self.postings = {}
+        '''term -> [(document index, term frequency)]'''
+        for i, tf in enumerate(self.term_frequencies):
+            for term, frequency in tf.items():
+                self.postings.setdefault(term, []).append((i, frequency))
+
+    @classmethod
+    def from_documents(cls, documents, **kwargs):
+        return cls([Counter(tokenize(document)) for document in documents], **kwargs)
+
+    def idf(self, term):
+        n = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.lengths) - n + 0.5) / (n + 0.5))
+
+    def scores(self, query):
+        """Returns the score of every document for the query."""
+        scores = [0.0] * len(self.lengths)
+        if not self.average_length:
+            return scores
+        norms = [self.k1 * (1 - self.b + self.b * length / self.average_length) for length in self.lengths]
+        for term, count in Counter(tokenize(query)).items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            weight = self.idf(term) * count * (self.k1 + 1)
+            for i, frequency in postings:
+                scores[i] += weight * frequency / (frequency + norms[i])
+        return scores
+
+
+def result_text(result):
+    return u' '.join(result.get(field) or u'' for field in ('title', 'snippet', 'text'))
+
+
+def rerank(query, results, top_k=0, min_score=None):
+    """
+    Reorders search results by BM25 relevance of their title and snippet to the query,
+    the SERP order breaking ties.
+    :param top_k: int Optional, keeps the top_k best results, 0 keeps them all
+    :param min_score: float Optional, drops the results scoring below it
+    """
+    results = list(results)
+    scores = BM25.from_documents([result_text(result) for result in results]).scores(query)
+    ranked = sorted(range(len(results)), key=lambda i: (-scores[i], i))
+    if min_score is not None:
+        ranked = [i for i in ranked if scores[i] >= min_score]
+    if top_k > 0:
+        ranked = ranked[:top_k]
+    return [results[i] for i in ranked]
+
+
+def fuse(result_lists, k=RRF_K, top_k=0):
+    """
+    Merges ranked lists of search results by reciprocal rank fusion: a result scores the sum of
+    1 / (k + rank) over the lists it is in. A result found in several lists keeps its fields from the first one.
+    :param top_k: int Optional, keeps the top_k best results, 0 keeps them all
+    """
+    scores, results = {}, {}
+    for result_list in result_lists:
+        for rank, result in enumerate(result_list, 1):
+            link = result['link']
+            scores[link] = scores.get(link, 0.0) + 1.0 / (k + rank)
+            results.setdefault(link, result)
+    ranked = sorted(results, key=lambda link: -scores[link])  # stable, earlier lists break ties
+    if top_k > 0:
+        ranked = ranked[:top_k]
+    return [results[link] for link in ranked]
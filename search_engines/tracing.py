@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Opt-in request tracing.
+
+Spans follow the OpenTelemetry data model (W3C trace context ids, parent span ids,
+unix nano timestamps) and can be exported as OTLP/JSON to a file or a collector.
+When no trace is active, `span` costs a context variable lookup.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import aiohttp
+
+from .config import TRACE_EXPORTER, TRACE_FILE, OTLP_ENDPOINT
+
+_current_span = ContextVar('wsaio_current_span', default=None)
+_background = set()
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+_TRUE = ('1', 'true', 'yes', 'on')
+
+
+class Span(object):
+    """A timed operation of a trace."""
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'start', 'end', 'attributes')
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes or {}
+
+    @property
+    def duration_ms(self):
+        return ((self.end or time.time_ns()) - self.start) / 1e6
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end or time.time_ns()),
+            'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in self.attributes.items()],
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class Trace(object):
+    """The spans recorded for one request."""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.spans = []
+
+    def server_timing(self):
+        """
+        Returns a Server-Timing header value, the root span as total then one metric per span name.
+        The duration is the wall time covered by the spans of that name, so parallel spans are not summed.
+        """
+        by_name = {}
+        for span in self.spans[1:]:
+            by_name.setdefault(span.name, []).append(span)
+
+        metrics = ['total;dur={:.1f}'.format(self.spans[0].duration_ms)]
+        for name, spans in by_name.items():
+            metric = '{};dur={:.1f}'.format(_token(name), _covered_ms(spans))
+            if len(spans) > 1:
+                slowest = max(spans, key=lambda s: s.duration_ms)
+                desc = 'n={} max={:.1f}'.format(len(spans), slowest.duration_ms)
+                if 'host' in slowest.attributes:
+                    desc += ' ' + str(slowest.attributes['host'])
+                metric += ';desc="{}"'.format(desc.replace('"', ''))
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+    def to_otlp(self):
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'websearchaio'}}]},
+                'scopeSpans': [{
+                    'scope': {'name': 'search_engines'},
+                    'spans': [span.to_otlp() for span in self.spans],
+                }],
+            }]
+        }
+
+
+def is_requested(flag=None, headers=None):
+    """Checks the trace query flag, the X-Trace header and the sampled flag of a traceparent header."""
+    headers = headers or {}
+    if str(flag or headers.get('x-trace', '')).lower() in _TRUE:
+        return True
+    parent = _parse_traceparent(headers.get('traceparent'))
+    return bool(parent and int(parent[2], 16) & 1)
+
+
+@contextmanager
+def start_trace(name, traceparent=None, **attributes):
+    """Starts a trace with its root span, continuing the caller's trace if a traceparent is given."""
+    parent = _parse_traceparent(traceparent)
+    trace = Trace(parent[0] if parent else None)
+    root = Span(trace, name, parent[1] if parent else None, attributes)
+    trace.spans.append(root)
+    token = _current_span.set(root)
+    try:
+        yield trace
+    finally:
+        root.end = time.time_ns()
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Records a child span of the current span, does nothing outside a trace."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    parent.trace.spans.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.time_ns()
+        _current_span.reset(token)
+
+
+def traceparent(trace):
+    """Returns the W3C traceparent header of the root span of a trace."""
+    return '00-{}-{}-01'.format(trace.trace_id, trace.spans[0].span_id)
+
+
+def export(trace, exporter=TRACE_EXPORTER):
+    """Exports a finished trace in the background to the configured exporter ('file' or 'otlp')."""
+    if exporter == 'file':
+        coroutine = asyncio.to_thread(_write_file, trace.to_otlp(), TRACE_FILE)
+    elif exporter == 'otlp':
+        coroutine = _post_otlp(trace.to_otlp(), OTLP_ENDPOINT)
+    else:
+        return
+    task = asyncio.ensure_future(coroutine)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def _write_file(payload, path):
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(payload, ensure_ascii=False) + '\n')
+    except IOError as e:
+        logging.error(f"Error occurred when exporting a trace to {path}: {e}")
+
+
+async def _post_otlp(payload, endpoint):
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(endpoint, json=payload, timeout=aiohttp.ClientTimeout(total=5)) as response:
+                if response.status >= 300:
+                    logging.error(f"OTLP collector answered HTTP {response.status}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error(f"Error occurred when exporting a trace to {endpoint}: {e}")
+
+
+def _parse_traceparent(value):
+    match = _TRACEPARENT.match((value or '').strip().lower())
+    if not match or set(match.group(1)) == {'0'} or set(match.group(2)) == {'0'}:
+        return None
+    return match.groups()
+
+
+def _covered_ms(spans):
+    """Returns the milliseconds covered by the union of the spans' intervals."""
+    now = time.time_ns()
+    intervals = sorted((s.start, s.end or now) for s in spans)
+    covered, current_start, current_end = 0, intervals[0][0], intervals[0][1]
+    for start, end in intervals[1:]:
+        if start > current_end:
+            covered += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    covered += current_end - current_start
+    return covered / 1e6
+
+
+def _token(name):
+    return re.sub(r'[^A-Za-z0-9!#$%&\'*+.^_`|~-]', '_', name)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
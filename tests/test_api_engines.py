@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+
+from aiohttp import web
+
+from search_engines.health import engine_health
+from search_engines.http_pool import close_sessions
+from search_engines.registry import create_engine
+
+SEARXNG_PAGES = {
+    '1': [{'url': 'https://a.com/1', 'title': ' A ', 'content': 'first'},
+          {'url': 'https://b.com/2', 'title': 'B', 'content': 'second'}],
+    '2': [{'url': 'https://c.com/3', 'title': 'C', 'content': 'third'}],
+}
+
+DOCUMENTS = [{'url': 'https://doc.com/{}'.format(i), 'title': 'Doc {}'.format(i), 'content': 'text of doc {}'.format(i)}
+             for i in range(13)]
+
+
+async def searxng(request):
+    request.app['requests'].append(dict(request.query))
+    if request.query.get('q') == 'broken':
+        return web.Response(text='<html>not json</html>')
+    return web.json_response({'results': SEARXNG_PAGES.get(request.query['pageno'], [])})
+
+
+async def elasticsearch(request):
+    body = await request.json()
+    request.app['requests'].append(body)
+    if request.headers.get('Authorization') != 'ApiKey secret':
+        return web.json_response({'error': 'unauthorized'}, status=401)
+    hits = [{'_source': doc, 'highlight': {'content': ['<em>text</em> of']}} if i == 0 else {'_source': doc}
+            for i, doc in enumerate(DOCUMENTS[body['from']:body['from'] + body['size']])]
+    return web.json_response({'hits': {'total': {'value': len(DOCUMENTS), 'relation': 'eq'}, 'hits': hits}})
+
+
+async def search_stand_in(name, query, max_pages, monkeypatch=None):
+    """Searches an engine against a local stand-in of its API, returns the results and the API requests."""
+    app = web.Application()
+    app['requests'] = []
+    app.router.add_get('/search', searxng)
+    app.router.add_post('/documents/_search', elasticsearch)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    try:
+        engine = create_engine(name)
+        engine._base_url = 'http://127.0.0.1:{}'.format(site._server.sockets[0].getsockname()[1])
+        results = await engine.search(query, max_pages=max_pages)
+        return engine, list(results), app['requests']
+    finally:
+        await close_sessions()
+        await runner.cleanup()
+
+
+def test_searxng_pages():
+    engine, results, requests = asyncio.run(search_stand_in('searxng', 'python asyncio', 3))
+    assert [res['link'] for res in results] == ['https://a.com/1', 'https://b.com/2', 'https://c.com/3']
+    assert results[0] == {'host': 'a.com', 'link': 'https://a.com/1', 'title': 'A', 'snippet': 'first'}
+    assert [req['pageno'] for req in requests] == ['1', '2', '3']
+    assert requests[0]['q'] == 'python asyncio' and requests[0]['format'] == 'json'
+    assert not engine.needs_browser
+
+
+def test_searxng_invalid_answer_is_a_failure():
+    engine_health.reset()
+    engine, results, requests = asyncio.run(search_stand_in('searxng', 'broken', 1))
+    assert results == [] and engine_health._failures['Searxng'] == 1
+    engine_health.reset()
+
+
+def test_elasticsearch_pages(monkeypatch):
+    monkeypatch.setattr('search_engines.engines.elasticsearch.ELASTICSEARCH_API_KEY', 'secret')
+    engine, results, requests = asyncio.run(search_stand_in('elasticsearch', 'doc', 5))
+    assert [res['link'] for res in results] == [doc['url'] for doc in DOCUMENTS]
+    assert results[0]['snippet'] == '<em>text</em> of' and results[1]['snippet'] == 'text of doc 1'
+    # the pages after the first are requested at once
+    assert sorted(req['from'] for req in requests) == [0, 10, 20, 30, 40]
+    assert requests[0]['query']['multi_match']['query'] == 'doc'
+
+
+def test_elasticsearch_refused():
+    engine, results, requests = asyncio.run(search_stand_in('elasticsearch', 'doc', 1))
+    assert results == [] and engine.is_banned is False and len(requests) == 1
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import io
+import json
+import os
+
+import bulk_search
+import web_search
+from search_engines import ratelimit
+from search_engines.query import cache_key
+
+
+class Browser(object):
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class Engine(object):
+    """Finds two results per query, and fails the queries of `failing`."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.searched = []
+        self.is_banned = False
+        self._persistent_browser = Browser()
+
+    async def search(self, query, max_pages=1):
+        self.searched.append(query)
+        if query in self.failing:
+            raise RuntimeError('navigation failed')
+        return [{'link': 'https://{}.com/{}'.format(query.replace(' ', '-'), i)} for i in range(2)]
+
+
+class Wsaio(object):
+    needs_browser = False
+    engines = {}
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def route_engine(self):
+        return self.engine
+
+
+def run_bulk(monkeypatch, tmp_path, engine):
+    monkeypatch.setattr(web_search, 'wsaio', Wsaio(engine))
+    monkeypatch.setattr(bulk_search, 'console', lambda *args, **kwargs: None)
+    args = argparse.Namespace(
+        queries=os.path.join(str(tmp_path), 'queries.txt'), output=os.path.join(str(tmp_path), 'results.jsonl'),
+        checkpoint=None, pages=1, concurrency=2, rate=None, burst=1, enhance=False, max_ban_rate=0.5,
+        min_queries=10, report_interval=60)
+    return asyncio.run(bulk_search.run(args)), args.output
+
+
+def write_queries(tmp_path, lines):
+    with io.open(os.path.join(str(tmp_path), 'queries.txt'), 'w', encoding='utf-8') as f:
+        f.write(u'\n'.join(lines))
+
+
+def read_results(path):
+    with io.open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_read_queries_skips_comments_and_duplicates(tmp_path):
+    write_queries(tmp_path, [u'# comment', u'python asyncio', u'', u'Asyncio  Python', u'rust'])
+    assert bulk_search.read_queries(os.path.join(str(tmp_path), 'queries.txt')) == [u'python asyncio', u'rust']
+
+
+def test_resume_searches_only_the_queries_not_done(monkeypatch, tmp_path):
+    write_queries(tmp_path, [u'python', u'rust', u'golang'])
+    remaining, path = run_bulk(monkeypatch, tmp_path, Engine(failing=['rust']))
+    assert remaining == 1 and len(read_results(path)) == 4
+
+    engine = Engine()
+    remaining, path = run_bulk(monkeypatch, tmp_path, engine)
+    assert remaining == 0 and engine.searched == [u'rust']
+    assert sorted({res['query'] for res in read_results(path)}) == [u'golang', u'python', u'rust']
+    assert len(read_results(path)) == 6
+
+
+def test_resume_truncates_the_results_of_an_interrupted_query(monkeypatch, tmp_path):
+    write_queries(tmp_path, [u'python', u'rust'])
+    remaining, path = run_bulk(monkeypatch, tmp_path, Engine(failing=['rust']))
+    written = os.path.getsize(path)
+    with io.open(path, 'a', encoding='utf-8') as f:
+        f.write(u'{"link": "https://rust.com/0", "query": "rust"}\n{"link": "https://ru')  # crashed while writing
+    with io.open(path + '.checkpoint', 'a', encoding='utf-8') as f:
+        f.write(u'{"key": "rust", "off')  # a record cut by the crash
+
+    checkpoint = bulk_search.Checkpoint(path + '.checkpoint')
+    assert checkpoint.done == {cache_key(u'python')} and checkpoint.offset == written
+
+    remaining, path = run_bulk(monkeypatch, tmp_path, Engine())
+    assert remaining == 0
+    assert [res['query'] for res in read_results(path)] == [u'python', u'python', u'rust', u'rust']
+
+
+def test_rate_limits_cover_the_fallback_engines(monkeypatch):
+    monkeypatch.setattr(web_search, 'WEB_SEARCH_ENGINE', 'bing')
+    monkeypatch.setattr(web_search, 'FALLBACK_ENGINES', {'bing': ['duckduckgo']})
+    monkeypatch.setattr(ratelimit, '_limiters', {})
+    bulk_search.set_rate_limits(web_search.WSAIO(), 0.5, 2)
+    assert set(ratelimit._limiters) == {'Bing', 'Duckduckgo'}
+    assert ratelimit._limiters['Duckduckgo'].rate == 0.5 and ratelimit._limiters['Duckduckgo'].burst == 2
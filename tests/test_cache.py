@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import threading
+
+from search_engines.cache import MemoryBackend, SQLiteBackend, TieredBackend, PageCache, SerpCache, make_backend
+
+
+class ThreadRecordingBackend(MemoryBackend):
+    """A far cache recording the threads it is called from."""
+
+    def __init__(self, max_size):
+        super(ThreadRecordingBackend, self).__init__(max_size)
+        self.threads = set()
+
+    def get(self, key):
+        self.threads.add(threading.get_ident())
+        return super(ThreadRecordingBackend, self).get(key)
+
+    def set(self, key, value, ttl, stored_at=None):
+        self.threads.add(threading.get_ident())
+        super(ThreadRecordingBackend, self).set(key, value, ttl, stored_at)
+
+
+def test_far_tier_runs_off_the_event_loop():
+    far = ThreadRecordingBackend(10)
+    backend = TieredBackend(MemoryBackend(10), far, near_ttl=30)
+
+    async def main():
+        await backend.set('key', {'a': 1}, 60)
+        backend.near.clear()
+        return await backend.get('key'), threading.get_ident()
+
+    entry, loop_thread = asyncio.run(main())
+    assert entry[1] == {'a': 1}
+    assert far.threads and loop_thread not in far.threads
+    assert backend.near.get('key')[1] == {'a': 1}
+
+
+def test_memory_backend_keeps_entries_for_their_ttl():
+    backend = make_backend('test', 10, backend='memory')
+
+    async def main():
+        await backend.set('key', 'value', 60)
+        return await backend.get('key')
+
+    assert asyncio.run(main())[1] == 'value'
+
+
+def test_sqlite_corrupt_entry_is_a_miss(tmp_path):
+    backend = SQLiteBackend('test', 10, path=os.path.join(str(tmp_path), 'data', 'cache.sqlite3'))
+    backend.set('key', 'x' * 1000, 60)
+    assert backend.get('key')[1] == 'x' * 1000
+    backend._conn.execute('UPDATE cache_test SET value = ? WHERE key = ?', (b'jZnot zlib', 'key'))
+    assert backend.get('key') is None
+
+
+def test_serp_and_page_caches():
+    serp_cache, page_cache = SerpCache(max_size=10), PageCache(max_size=10)
+
+    async def main():
+        await serp_cache.set('python asyncio', [{'link': 'https://a.com'}])
+        await page_cache.set('https://a.com', {'title': 'A'})
+        return await serp_cache.get('Python  asyncio'), await page_cache.get('https://a.com')
+
+    serp_hit, page_hit = asyncio.run(main())
+    assert serp_hit.value == [{'link': 'https://a.com'}] and not serp_hit.stale
+    assert page_hit.value == {'title': 'A'}
+
+
+def test_memory_backend_is_bounded_by_bytes():
+    backend = MemoryBackend(100, max_bytes=30000)
+    for i in range(5):
+        backend.set(i, {'title': str(i), 'snippet': 'x' * 10000}, 60)
+    assert len(backend) == 2 and backend.get(0) is None and backend.get(4) is not None
+    assert backend.bytes <= backend.max_bytes
+
+    backend.set('huge', {'snippet': 'x' * 100000}, 60)
+    assert backend.get('huge') is None and backend.bytes <= backend.max_bytes
+    backend.delete(4)
+    backend.clear()
+    assert backend.bytes == 0
+
+
+def test_page_cache_is_bounded_by_bytes():
+    page_cache = PageCache(max_size=100, max_bytes=50000)
+
+    async def main():
+        for i in range(10):
+            await page_cache.set(f'https://{i}.com', {'title': str(i), 'snippet': 'x' * 10000})
+        return await page_cache.get('https://0.com'), await page_cache.get('https://9.com')
+
+    oldest, newest = asyncio.run(main())
+    assert oldest is None and newest.value['title'] == '9'
+
+
+def test_near_duplicate_query_hit():
+    serp_cache = SerpCache(max_size=10, near_dup=True, threshold=0.85)
+
+    async def main():
+        await serp_cache.set('python asyncio event loop tutorial', [{'link': 'https://a.com'}])
+        return (await serp_cache.get('python asyncio event loop tutorials'), await serp_cache.get('rust ownership'),
+                await serp_cache.get('python asyncio event loop tutorials', pages=2))
+
+    near_dup, unrelated, other_pages = asyncio.run(main())
+    assert near_dup.near_dup and near_dup.value == [{'link': 'https://a.com'}] and not near_dup.stale
+    assert unrelated is None and other_pages is None
+
+
+def test_serp_is_stale_after_ttl_until_stale_ttl():
+    serp_cache = SerpCache(max_size=10, ttl=60, stale_ttl=3600)
+
+    async def main():
+        await serp_cache.set('python asyncio', [{'link': 'https://a.com'}])
+        fresh = await serp_cache.get('python asyncio')
+        key = serp_cache.key('python asyncio')
+        stored_at, value = serp_cache.backend.near.get(key)
+        serp_cache.backend.near.set(key, value, 3600 - 120, stored_at=stored_at - 120)
+        return fresh, await serp_cache.get('python asyncio'), await serp_cache.age(key)
+
+    fresh, stale, age = asyncio.run(main())
+    assert not fresh.stale and stale.stale and stale.value == [{'link': 'https://a.com'}]
+    assert 120 <= age < 130
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from search_engines import compression
+from search_engines.compression import CompressionMiddleware, accepted_encodings
+
+BODY = 'x' * 2000
+
+
+def client():
+    async def large(request):
+        return PlainTextResponse(BODY)
+
+    async def small(request):
+        return PlainTextResponse('small')
+
+    async def small_chunks(request):
+        return StreamingResponse(iter(['sm', 'all']), media_type='text/plain')
+
+    app = Starlette(routes=[Route('/large', large), Route('/small', small), Route('/small_chunks', small_chunks)])
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    return TestClient(app)
+
+
+def test_accepted_encodings():
+    assert accepted_encodings('gzip, br;q=0, deflate;q=0.5') == {'gzip', 'deflate'}
+    assert accepted_encodings('') == {''}
+
+
+def test_large_responses_are_gzipped(monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', None)
+    response = client().get('/large', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['content-encoding'] == 'gzip' and response.text == BODY
+
+
+def test_small_responses_are_not_compressed(monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', None)
+    for path in ('/small', '/small_chunks'):
+        response = client().get(path, headers={'Accept-Encoding': 'gzip'})
+        assert 'content-encoding' not in response.headers and response.text == 'small'
+
+
+def test_without_accepted_encoding():
+    response = client().get('/large', headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in response.headers and response.text == BODY
+
+
+def test_large_responses_are_brotli_compressed():
+    pytest.importorskip('brotli')
+    response = client().get('/large', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['content-encoding'] == 'br' and response.text == BODY
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from bs4 import BeautifulSoup
+
+from search_engines.engines import Bing
+
+CURRENT_MARKUP = u'''<ol id="b_results">
+<li class="b_algo"><h2><a href="https://a.com/1">Python asyncio</a></h2><p>The event loop</p></li>
+</ol>'''
+
+# markup without the li.b_algo class, matched by the second selector set
+CHANGED_MARKUP = u'''<ol id="b_results">
+<li><h2><a href="https://a.com/1">Python asyncio</a></h2><div class="b_caption"><p>The event loop</p></div></li>
+<li><h2><a href="https://b.com/2">Rust</a></h2><p>Ownership</p></li>
+<li class="ad">Sponsored</li>
+</ol>'''
+
+
+def test_first_matching_selector_set_is_used():
+    engine = Bing()
+    results = engine._filter_results(BeautifulSoup(CURRENT_MARKUP, features='lxml'))
+    assert engine._selector_version == 0
+    assert results == [{'host': 'a.com', 'link': 'https://a.com/1', 'title': 'Python asyncio',
+                        'snippet': 'The event loop'}]
+
+
+def test_fallback_selector_set_when_the_markup_changed():
+    engine = Bing()
+    results = engine._filter_results(BeautifulSoup(CHANGED_MARKUP, features='lxml'))
+    assert engine._selector_version == 1
+    assert [(res['link'], res['snippet']) for res in results] == [('https://a.com/1', 'The event loop'),
+                                                                   ('https://b.com/2', 'Ownership')]
+
+
+def test_no_selector_set_matches():
+    engine = Bing()
+    assert engine._filter_results(BeautifulSoup(u'<div>Nothing</div>', features='lxml')) == []
+    assert engine._selector_version is None
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from search_engines import fingerprints
+from search_engines.fingerprints import FingerprintRotator, chrome_major, sec_ch_ua
+
+
+@pytest.mark.parametrize('major, header', [
+    (114, '"Not.A/Brand";v="8", "Chromium";v="114", "Google Chrome";v="114"'),
+    (115, '"Not/A)Brand";v="99", "Google Chrome";v="115", "Chromium";v="115"'),
+    (116, '"Chromium";v="116", "Not)A;Brand";v="24", "Google Chrome";v="116"'),
+    (117, '"Google Chrome";v="117", "Not;A=Brand";v="8", "Chromium";v="117"'),
+    (130, '"Chromium";v="130", "Google Chrome";v="130", "Not?A_Brand";v="99"'),
+    (131, '"Google Chrome";v="131", "Chromium";v="131", "Not_A Brand";v="24"'),
+])
+def test_sec_ch_ua_of_chrome(major, header):
+    assert sec_ch_ua(major) == header
+
+
+def test_rotation_follows_the_launched_chrome(monkeypatch):
+    rotator = FingerprintRotator()
+    monkeypatch.setattr(fingerprints, '_rotator', rotator)
+    assert all('Chrome/117.0.0.0' in fp.user_agent for fp in rotator.fingerprints)
+
+    fingerprints.set_chrome_version('130.0.6723.58')
+    seen = [fingerprints.next_fingerprint() for _ in range(len(rotator.templates))]
+    assert len({fp.user_agent + fp.accept_language + str(fp.screen) for fp in seen}) == len(rotator.templates)
+    for fp in seen:
+        assert 'Chrome/130.0.0.0' in fp.user_agent and '{' not in fp.user_agent
+        assert fp.client_hints()['sec-ch-ua'] == sec_ch_ua(130)
+
+
+def test_chrome_major():
+    assert chrome_major('130.0.6723.58') == 130
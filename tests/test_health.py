@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from search_engines.health import EngineHealth
+
+
+def test_engine_is_degraded_after_consecutive_failures():
+    health = EngineHealth(max_failures=3, cooldown=60)
+    health.failed('Bing')
+    health.failed('Bing')
+    health.succeeded('Bing')  # a success resets the count
+    health.failed('Bing')
+    health.failed('Bing')
+    assert not health.is_degraded('Bing')
+    health.failed('Bing')
+    assert health.is_degraded('Bing') and not health.is_degraded('Google')
+
+
+def test_degraded_engine_is_probed_after_the_cooldown():
+    health = EngineHealth(max_failures=1, cooldown=0.05)
+    health.failed('Bing')
+    assert health.is_degraded('Bing')
+    time.sleep(0.06)
+    assert not health.is_degraded('Bing')  # the next search probes it
+    health.failed('Bing')
+    assert health.is_degraded('Bing')  # a failed probe degrades it again
+    time.sleep(0.06)
+    health.succeeded('Bing')  # a successful probe restores it
+    assert not health.is_degraded('Bing') and health._failures['Bing'] == 0
+
+
+def test_without_max_failures_engines_are_never_degraded():
+    health = EngineHealth(max_failures=0)
+    for _ in range(10):
+        health.failed('Bing')
+    assert not health.is_degraded('Bing')
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+
+from search_engines.cache import MemoryBackend, SQLiteBackend, TieredBackend
+from search_engines import jobs
+from search_engines.jobs import DONE, FAILED, JobQueue, JobStore
+
+
+def sqlite_store(directory):
+    """A job store on its own connection to a shared database, like the one of another worker process."""
+    far = SQLiteBackend('job', 100, path=os.path.join(str(directory), 'cache.sqlite3'))
+    return JobStore(backend=TieredBackend(MemoryBackend(0), far))
+
+
+async def search(job):
+    await job.update(results=['first'])
+    await asyncio.sleep(0.05)
+    await job.update(results=['first', 'second'])
+
+
+def test_job_runs_and_publishes_results(tmp_path):
+    async def main():
+        queue = JobQueue(workers=1, store=sqlite_store(tmp_path))
+        job = await queue.submit(search)
+        state = await queue.get(job.id, wait=0)
+        while state['status'] != DONE:
+            state = await queue.get(job.id, wait=1, version=state['version'])
+        await queue.stop()
+        return state
+
+    assert asyncio.run(main())['results'] == ['first', 'second']
+
+
+def test_job_polled_from_another_worker(tmp_path):
+    async def main():
+        running, polling = JobQueue(workers=1, store=sqlite_store(tmp_path)), JobQueue(store=sqlite_store(tmp_path))
+        job = await running.submit(search)
+        states = [await polling.get(job.id)]
+        while states[-1]['status'] != DONE:
+            states.append(await polling.get(job.id, wait=2, version=states[-1]['version']))
+        await running.stop()
+        return states
+
+    states = asyncio.run(asyncio.wait_for(main(), 5))
+    assert states[0]['id'] and states[-1]['results'] == ['first', 'second']
+    assert [state['version'] for state in states] == sorted({state['version'] for state in states})
+
+
+def test_failed_job(tmp_path):
+    async def fail(job):
+        raise ValueError('broken')
+
+    async def main():
+        queue = JobQueue(workers=1, store=sqlite_store(tmp_path))
+        job = await queue.submit(fail)
+        state = await queue.get(job.id, wait=1, version=0)
+        while state['status'] != FAILED:
+            state = await queue.get(job.id, wait=1, version=state['version'])
+        await queue.stop()
+        return state
+
+    state = asyncio.run(main())
+    assert state['error'] == 'broken'
+
+
+def test_unknown_job(tmp_path):
+    assert asyncio.run(JobQueue(store=sqlite_store(tmp_path)).get('missing')) is None
+
+
+def test_jobs_are_shared_with_caches_in_memory(monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_BACKEND', 'sqlite')
+    monkeypatch.setattr(jobs, 'make_backend', lambda *args, **kwargs: (args, kwargs))
+    store = JobStore()
+    assert store.backend == (('job', store.max_size), {'backend': 'sqlite', 'near_size': 0})
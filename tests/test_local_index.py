@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import threading
+import time
+
+import web_search
+from search_engines.local_index import LocalIndex
+
+
+def local_index(tmp_path):
+    return LocalIndex(os.path.join(str(tmp_path), 'data', 'local_index.sqlite3'))
+
+
+def test_search_ranks_and_reports_freshness(tmp_path):
+    index = local_index(tmp_path)
+    index.add('https://a.com/1', 'Python asyncio', 'Asyncio runs an event loop of tasks.')
+    index.add('https://b.com/2', 'Rust', 'Ownership and borrowing, no event loop.')
+    index.add('https://c.cn/3', u'机器学习', u'机器学习是人工智能的一个分支。')
+    results = index.search('asyncio event loop')
+    assert [res['link'] for res in results] == ['https://a.com/1', 'https://b.com/2']
+    assert results[0]['host'] == 'a.com' and results[0]['age'] >= 0 and results[0]['indexed_at'] > 0
+    assert [res['link'] for res in index.search(u'机器学习')] == ['https://c.cn/3']
+    assert index.search('"; DROP TABLE documents') == []
+
+
+def test_add_replaces_a_page(tmp_path):
+    index = local_index(tmp_path)
+    index.add('https://a.com/1', 'Old', 'old text')
+    index.add('https://a.com/1', 'New', 'new text')
+    assert len(index) == 1 and index.search('old') == []
+
+
+class SlowIndex(object):
+    """A local index whose writes take longer than the requests, recording their threads."""
+
+    def __init__(self):
+        self.added = []
+        self.threads = set()
+
+    def add(self, link, title, text):
+        self.threads.add(threading.get_ident())
+        threading.Event().wait(0.2)
+        self.added.append(link)
+
+
+def test_pages_are_indexed_in_the_background(monkeypatch):
+    monkeypatch.setattr(web_search, 'LOCAL_INDEX_QUEUE_SIZE', 2)
+    wsaio = web_search.WSAIO()
+    wsaio.local_index = SlowIndex()
+
+    async def main():
+        for i in range(4):
+            wsaio.index_page('https://a.com/{}'.format(i), {'title': 'A', 'snippet': 'text'})
+        queued = len(wsaio.local_index.added)
+        await wsaio._indexing.join()
+        await wsaio.stop_indexer()
+        return queued, threading.get_ident()
+
+    queued, loop_thread = asyncio.run(main())
+    assert queued == 0  # index_page returned before any write
+    assert wsaio.local_index.added == ['https://a.com/0', 'https://a.com/1']  # the others overflowed the queue
+    assert loop_thread not in wsaio.local_index.threads
+
+
+def test_results_of_the_index_are_not_fetched_again(monkeypatch):
+    wsaio = web_search.WSAIO()
+    fetched = []
+
+    async def extract_page(link, session):
+        fetched.append(link)
+        return {'title': 'Fetched', 'snippet': 'fetched text'}
+
+    wsaio.extract_page = extract_page
+    indexed = {'link': 'https://a.com/1', 'title': 'Indexed', 'snippet': 'passages', 'indexed_at': 1.0, 'age': 5.0}
+    live = {'link': 'https://b.com/2', 'title': 'Live', 'snippet': 'serp snippet'}
+    results = asyncio.run(wsaio.search_result_enhancement([dict(indexed), live], query='text'))
+    assert fetched == ['https://b.com/2']
+    assert results[0] == indexed and results[1]['title'] == 'Fetched'
+
+
+class SlowSearchIndex(object):
+    """A local index answering after a while."""
+
+    def search(self, query, limit):
+        threading.Event().wait(0.2)
+        return [{'link': 'https://a.com/1', 'title': 'Indexed', 'snippet': 'passages', 'indexed_at': 1.0}]
+
+
+def test_fusion_timeout_runs_from_the_start_of_the_live_search(monkeypatch):
+    monkeypatch.setattr(web_search, 'LOCAL_FUSION_TIMEOUT', 0.3)
+    wsaio = web_search.WSAIO()
+    wsaio.local_index = SlowSearchIndex()
+
+    async def search_live(query, pages):
+        await asyncio.sleep(0.45)
+        return [{'link': 'https://b.com/2'}], False
+
+    wsaio.search_live = search_live
+
+    async def main():
+        started = time.perf_counter()
+        results = await wsaio.search_with_local_index('python', 1)
+        elapsed = time.perf_counter() - started
+        await asyncio.gather(*wsaio._live_searches)
+        return results, elapsed
+
+    results, elapsed = asyncio.run(main())
+    assert [res['link'] for res in results] == ['https://a.com/1']
+    assert elapsed < 0.4
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from search_engines import matcher
+from search_engines.matcher import TermMatcher
+
+
+@pytest.fixture(params=['automaton', 'regex'])
+def matcher_kind(request, monkeypatch):
+    if request.param == 'regex':
+        monkeypatch.setattr(matcher, 'ahocorasick', None)
+    return request.param
+
+
+def test_counts_whole_words_case_insensitively(matcher_kind):
+    counts = TermMatcher(['python', 'loop']).count(u'Python loops, PYTHON event loop')
+    assert counts == {'python': 2, 'loop': 1}
+
+
+def test_spans_are_leftmost_longest(matcher_kind):
+    text = u'the event loop of asyncio'
+    assert TermMatcher(['event', 'event loop', 'loop']).spans(text) == [(4, 14)]
+
+
+def test_cjk_terms_match_anywhere(matcher_kind):
+    assert TermMatcher([u'学习']).spans(u'机器学习算法') == [(2, 4)]
+
+
+def test_offsets_refer_to_the_original_text(matcher_kind):
+    assert TermMatcher(['python']).spans(u'Ｐｙｔｈｏｎ tutorial') == [(0, 6)]
+    text = u'Die Straße und ﬁle'
+    assert [text[start:end] for start, end in TermMatcher(['strasse', 'file']).spans(text)] == [u'Straße', u'ﬁle']
+
+
+def test_empty_matcher():
+    assert not TermMatcher([u'']) and TermMatcher([]).spans(u'text') == []
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+from search_engines import metrics
+from search_engines.metrics import BROWSER_CONTEXTS_IN_USE, CACHE_HITS, STAGE_SECONDS
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def write_worker_snapshot(directory, pid, values):
+    with open(os.path.join(str(directory), '{}.json'.format(pid)), 'w') as f:
+        json.dump({'pid': pid, 'metrics': values}, f)
+
+
+def sample(text, line_start):
+    return float(next(line for line in text.splitlines() if line.startswith(line_start)).rsplit(' ', 1)[1])
+
+
+def test_render_all_sums_counters_and_labels_gauges_by_worker(tmp_path):
+    CACHE_HITS.labels('aggregation_test').inc(2)
+    STAGE_SECONDS.labels('aggregation_test').observe(0.2)
+    BROWSER_CONTEXTS_IN_USE.set(1)
+    buckets = [0] * (len(metrics.DEFAULT_BUCKETS) + 1)
+    buckets[5] = 3
+    live, exited = os.getppid(), exited_pid()
+    for pid in (live, exited):
+        write_worker_snapshot(tmp_path, pid, {
+            'wsaio_cache_hits_total': [[['aggregation_test'], 3.0]],
+            'wsaio_stage_duration_seconds': [[['aggregation_test'], [buckets, 0.3]]],
+            'wsaio_browser_contexts_in_use': [[[], 4.0]],
+        })
+
+    text = asyncio.run(metrics.render_all(str(tmp_path)))
+    assert sample(text, 'wsaio_cache_hits_total{cache="aggregation_test"}') == 8.0
+    assert sample(text, 'wsaio_stage_duration_seconds_count{stage="aggregation_test"}') == 7.0
+    assert sample(text, 'wsaio_stage_duration_seconds_sum{stage="aggregation_test"}') == 0.8
+    assert sample(text, 'wsaio_browser_contexts_in_use{{worker="{}"}}'.format(os.getpid())) == 1.0
+    assert sample(text, 'wsaio_browser_contexts_in_use{{worker="{}"}}'.format(live)) == 4.0
+    assert 'worker="{}"'.format(exited) not in text  # the gauges of an exited worker are dropped
+
+
+def test_write_snapshots(tmp_path):
+    async def main():
+        writer = asyncio.ensure_future(metrics.write_snapshots(str(tmp_path), 60))
+        await asyncio.sleep(0.1)
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+
+    asyncio.run(main())
+    with open(os.path.join(str(tmp_path), '{}.json'.format(os.getpid()))) as f:
+        data = json.load(f)
+    assert data['pid'] == os.getpid() and 'wsaio_cache_hits_total' in data['metrics']
+    assert os.listdir(str(tmp_path)) == ['{}.json'.format(os.getpid())]
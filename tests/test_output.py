@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import json
+import os
+import sys
+
+import pytest
+
+from search_engines import output
+from search_engines.output import Highlighter, iter_csv_rows, iter_jsonl_lines, iter_json_chunks, \
+    iter_html_chunks, create_json_data, write_report
+
+
+class Engine(object):
+    """The search state the reports read from an engine."""
+
+    def __init__(self, results, query=u'python asyncio', filters=()):
+        self._query = query
+        self._filters = list(filters)
+        self.results = results
+
+
+class Bing(Engine):
+    pass
+
+
+class Google(Engine):
+    pass
+
+
+RESULTS = [
+    {'host': 'a.com', 'link': 'https://a.com/1', 'title': u'Python asyncio', 'snippet': u'The event loop'},
+    {'host': 'b.com', 'link': 'https://b.com/2', 'title': u'<Rust>', 'text': u'Ownership & borrowing'},
+]
+
+
+def engines():
+    return [Bing(RESULTS, filters=['title', 'text']), Google(RESULTS[:1])]
+
+
+def test_highlighter_spans():
+    assert Highlighter('python').spans(u'Ｐｙｔｈｏｎ tutorial') == [(0, 6)]
+    text = u'Die Straße und C++ code'
+    assert [text[start:end] for start, end in Highlighter('STRASSE c++').spans(text)] == [u'Straße', u'C++']
+    assert Highlighter(u'"python asyncio"').spans(u'Python asyncio, python') == [(0, 14), (16, 22)]
+    assert Highlighter(u'机器学习').spans(u'机器学习') == [(0, 4)]
+
+
+def test_highlighter_markup_escapes():
+    assert Highlighter('rust').markup(u'<Rust> & co') == u'&lt;<b>Rust</b>&gt; &amp; co'
+
+
+def test_csv_rows():
+    rows = list(iter_csv_rows(engines()))
+    assert rows[0] == ['query', 'engine', 'domain', 'URL', 'title', 'text']
+    assert rows[2] == ['python asyncio', 'Bing', 'b.com', 'https://b.com/2', u'<Rust>', u'Ownership & borrowing']
+    assert len(rows) == 4
+
+
+def test_jsonl_lines():
+    lines = list(iter_jsonl_lines(engines()))
+    assert len(lines) == 3 and all(line.endswith(u'\n') for line in lines)
+    assert json.loads(lines[2]) == dict(RESULTS[0], query='python asyncio', engine='Google')
+
+
+def test_json_is_streamed_one_result_at_a_time():
+    chunks = list(iter_json_chunks(engines()))
+    assert len(chunks) == 2 + 2 * 2 + len(RESULTS) + 1
+    assert json.loads(create_json_data(engines())) == {
+        'query': 'python asyncio', 'results': {'Bing': RESULTS, 'Google': RESULTS[:1]}}
+    assert json.loads(create_json_data([])) == {'query': '', 'results': {}}
+
+
+def test_html_is_streamed_and_escaped():
+    chunks = list(iter_html_chunks(engines()))
+    report = u''.join(chunks)
+    assert len(chunks) == 1 + 2 + len(RESULTS) + 1 + 2 + 1
+    assert u'<b>Python asyncio</b>' in report
+    assert u'&lt;Rust&gt;' in report and u'<Rust>' not in report
+
+
+def test_write_report(tmp_path, monkeypatch):
+    monkeypatch.setattr(output, 'console', lambda *args, **kwargs: None)
+    path = os.path.join(str(tmp_path), 'report')
+    write_report(engines(), 'csv,json,jsonl,html', path)
+    with io.open(path + '.csv', encoding='utf-8', newline='') as f:
+        assert len(list(csv.reader(f))) == 4
+    with io.open(path + '.json', encoding='utf-8') as f:
+        assert json.load(f)['results']['Google'] == RESULTS[:1]
+    with io.open(path + '.jsonl', encoding='utf-8') as f:
+        assert len(f.readlines()) == 3
+    assert os.path.getsize(path + '.html') > 0
+
+
+def test_write_parquet_without_pyarrow(tmp_path, monkeypatch):
+    messages = []
+    monkeypatch.setattr(output, 'console', lambda msg, **kwargs: messages.append(msg))
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    output.write_parquet(engines(), os.path.join(str(tmp_path), 'report.parquet'))
+    assert 'pyarrow is required' in messages[0]
+    assert not os.path.exists(os.path.join(str(tmp_path), 'report.parquet'))
+
+
+def test_write_parquet(tmp_path, monkeypatch):
+    pq = pytest.importorskip('pyarrow.parquet')
+    monkeypatch.setattr(output, 'console', lambda *args, **kwargs: None)
+    path = os.path.join(str(tmp_path), 'report.parquet')
+    output.write_parquet(engines(), path, batch_size=2)
+    table = pq.read_table(path)
+    assert table.num_rows == 3 and table.column('snippet').to_pylist()[1] == u'Ownership & borrowing'
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from search_engines.cache import SerpCache
+from search_engines.engines import Bing, Google
+from search_engines.pagination import CursorCache, decode_cursor, encode_cursor
+
+ENGINES = {'Bing': Bing(), 'Google': Google()}
+
+
+def google_state(**kwargs):
+    state = {'id': 'abc', 'engine': 'Google', 'query': u'python asyncio', 'page': 2, 'current_page': 2,
+             'request': {'url': u'https://www.google.com/search?q=python+asyncio&start=10', 'data': None}}
+    state.update(kwargs)
+    return state
+
+
+def test_cursor_round_trip():
+    state = google_state()
+    assert decode_cursor(encode_cursor(state), ENGINES) == state
+
+
+@pytest.mark.parametrize('cursor, message', [
+    ('not a cursor', 'Malformed cursor'),
+    (encode_cursor(dict(google_state(), page='2')), 'Malformed cursor'),
+    (encode_cursor(google_state(engine='Yahoo')), 'Cursor of another search engine'),
+    (encode_cursor(google_state(request={'url': 'https://evil.com/search?q=python+asyncio'})),
+     'Cursor of another site'),
+    (encode_cursor(google_state(request={'url': 'https://www.google.com.evil.com/search?q=python'})),
+     'Cursor of another site'),
+    (encode_cursor(google_state(request={'url': 'https://www.google.com/search?q=casino&start=10'})),
+     'Cursor of another query'),
+    (encode_cursor(google_state(request={'url': 'https://www.google.com/search?start=10'})), 'Cursor of another query'),
+    (encode_cursor(google_state(page=1)), 'Cursor past the last page'),
+    (encode_cursor(google_state(page=10 ** 6)), 'Cursor past the last page'),
+])
+def test_invalid_cursors(cursor, message):
+    with pytest.raises(ValueError, match=message):
+        decode_cursor(cursor, ENGINES)
+
+
+def test_cursor_of_a_predictable_engine_is_rebuilt_from_its_query():
+    state = dict(google_state(engine='Bing'), request={'url': u'https://www.bing.com/search?q=other&first=11'})
+    assert decode_cursor(encode_cursor(state), ENGINES)['query'] == u'python asyncio'
+
+
+def test_cursor_cache():
+    cursors = CursorCache(max_size=10, ttl=60)
+
+    async def main():
+        await cursors.start('python#1', google_state(), ['https://a.com/1'])
+        state = await cursors.state('python#1')
+        missing = await cursors.page(state)
+        next_state = await cursors.set_page(state, [{'link': 'https://b.com/2'}], google_state(id='other', page=3))
+        return state, missing, next_state, await cursors.page(state), await cursors.links(state)
+
+    state, missing, next_state, page, links = asyncio.run(main())
+    assert state['id'] != 'abc' and missing is None
+    assert next_state['id'] == state['id'] and next_state['page'] == 3
+    assert page == ([{'link': 'https://b.com/2'}], next_state)
+    assert links == ['https://a.com/1', 'https://b.com/2']
+
+
+def test_cursors_live_as_long_as_the_cached_serps():
+    assert CursorCache(max_size=0).ttl >= SerpCache(max_size=0).stale_ttl
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from search_engines.passages import split_passages, select_passages
+from search_engines.query import estimate_tokens
+
+# paragraphs of about PASSAGE_SIZE / 2 tokens, one passage each
+TEXT = u'\n'.join(u' '.join([sentence] * 8) for sentence in [
+    u'Cookies help us deliver our services.',
+    u'Asyncio is a library to write concurrent code.',
+    u'The weather is nice today.',
+    u'The event loop of asyncio schedules callbacks.',
+])
+
+
+def test_split_passages_keeps_whole_sentences():
+    passages = split_passages(u'One two three. Four five six. Seven eight nine.', size=6)
+    assert passages == [u'One two three. Four five six.', u'Seven eight nine.']
+    assert split_passages(u'') == []
+
+
+def test_select_passages_keeps_the_relevant_ones_in_text_order():
+    selected = select_passages(u'asyncio event loop', TEXT, top_k=2, budget=200)
+    assert u'Cookies' not in selected and u'weather' not in selected
+    assert selected.index(u'concurrent code') < selected.index(u'schedules callbacks')
+    assert selected.count(u' ... ') == 1
+
+
+def test_select_passages_within_the_budget():
+    selected = select_passages(u'asyncio event loop', TEXT, top_k=3, budget=20)
+    assert 0 < estimate_tokens(selected) <= 20 and u'event loop' in selected
+
+
+def test_select_passages_without_match_returns_the_beginning():
+    assert select_passages(u'golang', TEXT, budget=5) == u'Cookies help us deliver our'
+    assert select_passages(u'asyncio', u'') == u''
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+from types import SimpleNamespace
+
+from search_engines.engines.bing import Bing
+from search_engines.persistent_browser import PersistentBrowser
+
+
+class FakePage(object):
+
+    def __init__(self, url, selectors=()):
+        self.url = url
+        self.selectors = set(selectors)
+
+    async def query_selector(self, selector):
+        return selector if any(part.strip() in self.selectors for part in selector.split(',')) else None
+
+
+def block_signature(page, status=200, block_selectors=(), block_urls=Bing._block_urls):
+    response = SimpleNamespace(status=status)
+    return asyncio.run(PersistentBrowser._block_signature(page, response, '#b_results',
+                                                          block_selectors, block_urls))
+
+
+def test_block_url_in_path():
+    page = FakePage('https://www.bing.com/challenge/verify?q=python')
+    assert block_signature(page) == '/challenge/'
+
+
+def test_block_url_in_query_string_is_not_a_ban():
+    page = FakePage('https://www.bing.com/search?q=how+to+fix+/captcha+errors+/challenge/&first=1')
+    assert block_signature(page) is None
+
+
+def test_refused_status():
+    assert block_signature(FakePage('https://www.bing.com/search?q=python'), status=429) == 'HTTP 429'
+
+
+def test_block_selector_without_content():
+    page = FakePage('https://www.bing.com/search?q=python', ['#captcha'])
+    assert block_signature(page, block_selectors=['#captcha'], block_urls=()) == '#captcha'
+
+
+class FakeChromium(object):
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.launches = 0
+
+    async def launch(self, **options):
+        self.launches += 1
+        await asyncio.sleep(0.05)
+        if self.fail:
+            raise RuntimeError('Chrome failed to launch')
+        return SimpleNamespace(version='130.0.6723.58')
+
+
+class FakePlaywright(object):
+
+    def __init__(self, chromium):
+        self.chromium = chromium
+        self.stopped = False
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        self.stopped = True
+
+
+def test_concurrent_starts_launch_one_browser(monkeypatch):
+    chromium = FakeChromium()
+    monkeypatch.setattr('playwright.async_api.async_playwright', lambda: FakePlaywright(chromium))
+    monkeypatch.setattr('search_engines.fingerprints._rotator', None)
+    browser = PersistentBrowser()
+
+    async def main():
+        await asyncio.gather(*[browser.start() for _ in range(5)])
+
+    asyncio.run(main())
+    assert chromium.launches == 1 and browser.browser is not None
+
+
+def test_failed_launch_stops_playwright(monkeypatch):
+    playwright = FakePlaywright(FakeChromium(fail=True))
+    monkeypatch.setattr('playwright.async_api.async_playwright', lambda: playwright)
+    browser = PersistentBrowser()
+    try:
+        asyncio.run(browser.start())
+    except RuntimeError:
+        pass
+    assert playwright.stopped and browser._playwright is None and browser.browser is None
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from search_engines.query import normalize_query, cache_key, tokenize, simhash, similarity
+
+
+def test_normalize_query():
+    assert normalize_query(u'  Ｐｙｔｈｏｎ   ASYNCIO!? ') == u'python asyncio'
+    assert normalize_query(u'"rust" -- ownership') == u'rust ownership'
+    assert normalize_query(None) == u''
+
+
+def test_cache_key_ignores_width_case_punctuation_spacing_and_order():
+    assert cache_key(u'Python asyncio') == cache_key(u'asyncio,  ＰＹＴＨＯＮ') == u'asyncio python'
+    assert cache_key(u'python asyncio') != cache_key(u'python threading')
+
+
+def test_tokenize_adds_cjk_bigrams():
+    assert tokenize(u'Python 机器学习') == [u'python', u'机', u'机器', u'器', u'器学', u'学', u'学习', u'习']
+
+
+def test_simhash_of_close_queries_are_close():
+    base = simhash(cache_key(u'python asyncio tutorial'))
+    assert similarity(base, simhash(cache_key(u'python asyncio tutorials'))) > \
+        similarity(base, simhash(cache_key(u'rust ownership borrowing')))
+    assert similarity(base, base) == 1.0
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from search_engines import registry
+from search_engines.engine import SearchEngine
+from search_engines.multiple_search_engines import AllSearchEngines
+
+
+class EntryPoint(object):
+    """An entry point of another package, counting its loads."""
+
+    def __init__(self, name, cls):
+        self.name = name
+        self.cls = cls
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return self.cls
+
+
+class Plugin(SearchEngine):
+    pass
+
+
+class BrokenEntryPoint(EntryPoint):
+    def load(self):
+        raise ImportError('missing dependency')
+
+
+@pytest.fixture
+def engines(monkeypatch):
+    monkeypatch.setattr(registry, '_engines', dict(registry._engines))
+    entry_point = EntryPoint('plugin', Plugin)
+    monkeypatch.setattr(registry, '_entry_points', {'plugin': entry_point})
+    return entry_point
+
+
+def test_register_names_the_engine(engines):
+    @registry.register('mine')
+    class Mine(SearchEngine):
+        needs_browser = False
+
+    assert Mine.name == 'mine' and registry.engine_class('MINE') is Mine
+    assert isinstance(registry.create_engine('mine'), Mine)
+    assert Mine.capabilities()['needs_browser'] is False
+
+
+def test_entry_points_are_loaded_on_first_use(engines):
+    assert 'plugin' in registry.engine_names() and engines.loads == 0
+    assert 'plugin' not in registry.registered_engines()
+    assert registry.engine_class('plugin') is Plugin and Plugin.name == 'plugin'
+    registry.engine_class('plugin')
+    assert engines.loads == 1
+
+
+def test_unknown_engine(engines):
+    with pytest.raises(ValueError):
+        registry.engine_class('altavista')
+
+
+def test_opt_in_engines_are_left_out_of_the_default_names(engines, monkeypatch):
+    monkeypatch.setitem(registry._entry_points, 'broken', BrokenEntryPoint('broken', None))
+    names = registry.engine_names(opt_in=False)
+    assert {'bing', 'duckduckgo', 'google', 'plugin'} <= set(names)
+    assert not {'searxng', 'elasticsearch', 'local', 'broken'} & set(names)
+    assert {'searxng', 'elasticsearch', 'local', 'broken'} <= set(registry.engine_names())
+
+
+def test_all_search_engines_search_the_default_engines():
+    assert [engine.name for engine in AllSearchEngines()._engines] == ['bing', 'duckduckgo', 'google']
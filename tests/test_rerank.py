@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from search_engines.rerank import BM25, rerank
+
+RESULTS = [
+    {'link': 'https://a.com', 'title': 'Rust ownership', 'snippet': 'Borrowing rules.'},
+    {'link': 'https://b.com', 'title': 'Python asyncio', 'snippet': 'Asyncio runs an event loop.'},
+    {'link': 'https://c.com', 'title': 'Python', 'snippet': 'A programming language.'},
+]
+
+
+def test_bm25_scores_rare_terms_higher():
+    bm25 = BM25.from_documents(['python asyncio asyncio', 'python threading', 'python'])
+    scores = bm25.scores('python asyncio')
+    assert scores[0] > scores[2] > scores[1] > 0  # the shorter document scores higher for the same term
+    assert bm25.idf('asyncio') > bm25.idf('python')
+    assert BM25.from_documents([]).scores('python') == []
+
+
+def test_rerank_orders_by_relevance_and_keeps_serp_order_on_ties():
+    ranked = rerank('python asyncio', RESULTS)
+    assert [res['link'] for res in ranked] == ['https://b.com', 'https://c.com', 'https://a.com']
+    assert [res['link'] for res in rerank('golang', RESULTS)] == [res['link'] for res in RESULTS]
+
+
+def test_rerank_prunes_by_top_k_and_min_score():
+    assert [res['link'] for res in rerank('python asyncio', RESULTS, top_k=1)] == ['https://b.com']
+    assert [res['link'] for res in rerank('python asyncio', RESULTS, min_score=0.01)] == \
+        ['https://b.com', 'https://c.com']
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+
+import pytest
+
+import web_search
+from search_engines.cache import SerpCache
+from search_engines.health import EngineHealth
+
+
+def wsaio_of(monkeypatch, engine, fallbacks):
+    monkeypatch.setattr(web_search, 'WEB_SEARCH_ENGINE', engine)
+    monkeypatch.setattr(web_search, 'FALLBACK_ENGINES', fallbacks)
+    return web_search.WSAIO()
+
+
+def test_api_engine_does_not_need_a_browser(monkeypatch):
+    wsaio = wsaio_of(monkeypatch, 'searxng', web_search.FALLBACK_ENGINES)
+    assert wsaio.fallback_engines == [] and not wsaio.needs_browser
+
+
+def test_api_engine_never_falls_back_to_a_browser_engine(monkeypatch):
+    wsaio = wsaio_of(monkeypatch, 'elasticsearch', {'elasticsearch': ['duckduckgo', 'searxng']})
+    assert [engine.name for engine in wsaio.fallback_engines] == ['searxng']
+    assert not wsaio.needs_browser
+
+
+def test_browser_engine_fallbacks_share_its_browser(monkeypatch):
+    wsaio = wsaio_of(monkeypatch, 'bing', {'bing': ['bing', 'duckduckgo']})
+    assert [engine.name for engine in wsaio.fallback_engines] == ['duckduckgo']
+    assert wsaio.fallback_engines[0]._persistent_browser is wsaio.engine._persistent_browser
+    assert wsaio.needs_browser
+
+
+class FlakyBrowser(object):
+    """A browser failing to launch a number of times, then warming up."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.launches = 0
+        self.stops = 0
+
+    async def warm(self):
+        self.launches += 1
+        if self.launches <= self.failures:
+            raise RuntimeError('Chrome failed to launch')
+
+    async def stop(self):
+        self.stops += 1
+
+
+def test_warm_up_retries_the_browser_with_backoff(monkeypatch):
+    monkeypatch.setattr(web_search, 'PREWARM_RETRY_DELAY', 0.01)
+    monkeypatch.setattr(web_search, 'PREWARM_MAX_RETRY_DELAY', 0.02)
+    wsaio = wsaio_of(monkeypatch, 'bing', {})
+    wsaio._goose = object()
+    wsaio.engine._persistent_browser = browser = FlakyBrowser(failures=2)
+
+    async def main():
+        await wsaio.warm_up()
+        not_ready_yet = not wsaio.ready
+        await asyncio.wait_for(wsaio._warm_up_retry, 1)
+        return not_ready_yet
+
+    assert asyncio.run(main())
+    assert wsaio.ready and browser.launches == 3 and browser.stops == 2
+
+
+def test_warm_up_without_browser(monkeypatch):
+    wsaio = wsaio_of(monkeypatch, 'searxng', {})
+    wsaio._goose = object()
+    asyncio.run(wsaio.warm_up())
+    assert wsaio.ready and wsaio._warm_up_retry is None
+
+
+def wsaio_with_serp(monkeypatch, results):
+    """A WSAIO whose live searches return results after a while, recording their queries."""
+    wsaio = wsaio_of(monkeypatch, 'bing', {})
+    wsaio.serp_cache = SerpCache(max_size=10, ttl=60, stale_ttl=3600)
+    wsaio.searched = []
+
+    async def search_serp(query, pages=1):
+        wsaio.searched.append(query)
+        await asyncio.sleep(0.01)
+        await wsaio.serp_cache.set(query, results, pages)
+        return results
+
+    wsaio.search_serp = search_serp
+    return wsaio
+
+
+async def backdate(serp_cache, query, seconds):
+    key = serp_cache.key(query)
+    stored_at, value = serp_cache.backend.near.get(key)
+    serp_cache.backend.near.set(key, value, serp_cache.stale_ttl - seconds, stored_at=stored_at - seconds)
+
+
+def test_stale_serp_is_served_and_refreshed_once(monkeypatch):
+    wsaio = wsaio_with_serp(monkeypatch, [{'link': 'https://new.com'}])
+
+    async def main():
+        await wsaio.serp_cache.set('python', [{'link': 'https://old.com'}])
+        await backdate(wsaio.serp_cache, 'python', 120)
+        served = await asyncio.gather(*[wsaio.engine_search('python') for _ in range(3)])
+        await asyncio.gather(*wsaio._refreshing.values())
+        return served, await wsaio.engine_search('python')
+
+    served, refreshed = asyncio.run(main())
+    assert all(results == [{'link': 'https://old.com'}] for results in served)
+    assert wsaio.searched == ['python'] and refreshed == [{'link': 'https://new.com'}]
+
+
+def test_hot_queries_are_refreshed_before_they_expire(monkeypatch):
+    monkeypatch.setattr(web_search, 'SERP_REFRESH_INTERVAL', 0.01)
+    monkeypatch.setattr(web_search, 'HOT_QUERY_MIN_HITS', 2)
+    wsaio = wsaio_with_serp(monkeypatch, [{'link': 'https://new.com'}])
+
+    async def main():
+        for query in ('python', 'rust'):
+            await wsaio.serp_cache.set(query, [{'link': 'https://old.com'}])
+            await backdate(wsaio.serp_cache, query, 55)  # fresh, past SERP_REFRESH_AHEAD of the ttl
+        for query in ('python', 'python', 'rust'):
+            assert not (await wsaio.serp_cache.get(query)).stale
+        refresher = asyncio.ensure_future(wsaio.refresh_hot_queries())
+        await asyncio.sleep(0.05)
+        refresher.cancel()
+        await asyncio.gather(refresher, *wsaio._refreshing.values(), return_exceptions=True)
+
+    asyncio.run(main())
+    assert wsaio.searched == ['python']
+
+
+def test_project_keeps_the_asked_fields():
+    results = [{'link': 'https://a.com', 'title': 'A', 'snippet': 'text'}]
+    assert web_search.project(results, ' link, title ,missing') == [{'link': 'https://a.com', 'title': 'A'}]
+    assert web_search.project(results, None) is results
+
+
+def test_render_json():
+    response = web_search.render({'code': 200, 'data': [{'title': u'机器学习'}]})
+    assert response.media_type == 'application/json'
+    assert json.loads(response.body) == {'code': 200, 'data': [{'title': u'机器学习'}]}
+
+
+def test_render_msgpack():
+    msgpack = pytest.importorskip('msgpack')
+    response = web_search.render({'data': [1, 2]}, web_search.MSGPACK_FORMAT)
+    assert response.media_type == 'application/msgpack' and msgpack.unpackb(response.body) == {'data': [1, 2]}
+
+
+def test_searches_are_routed_to_a_fallback_while_the_engine_is_degraded(monkeypatch):
+    monkeypatch.setattr(web_search, 'engine_health', EngineHealth(max_failures=1, cooldown=60))
+    wsaio = wsaio_of(monkeypatch, 'bing', {'bing': ['duckduckgo', 'google']})
+    assert wsaio.route_engine().name == 'bing'
+    web_search.engine_health.failed('Bing')
+    assert wsaio.route_engine().name == 'duckduckgo'
+    web_search.engine_health.failed('Duckduckgo')
+    assert wsaio.route_engine().name == 'google'
+    web_search.engine_health.failed('Google')
+    assert wsaio.route_engine().name == 'bing'  # all degraded, the engine is probed
+    assert wsaio.route_engine('Google').name == 'google'  # cursors keep their engine
+    assert wsaio.route_engine() is not wsaio.engine
@@ -1,29 +1,68 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import time
+
+# cold start is measured from here, before the imports below
+STARTED_AT = time.perf_counter()
+
 import argparse
 import asyncio
 import logging
 import socket
+from contextlib import asynccontextmanager
+from functools import partial
 from typing import Any
 
 import aiohttp
 import pydantic
 import uvicorn
-from fake_useragent import UserAgent
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from goose3 import Goose
-from goose3.text import StopWordsChinese
 from pydantic import BaseModel
-from starlette.responses import RedirectResponse
-
-from search_engines.config import OPEN_CROSS_DOMAIN, WEB_SEARCH_ENGINE
+from starlette.responses import JSONResponse, RedirectResponse, Response
+
+from search_engines.config import OPEN_CROSS_DOMAIN, WEB_SEARCH_ENGINE, BATCH_CONCURRENCY, BATCH_MAX_QUERIES, \
+    JOB_MAX_PAGES, JOB_POLL_TIMEOUT, PREWARM_BROWSER, PREWARM_IN_BACKGROUND, SEARCH_ENGINE_RESULTS_PAGES, \
+    RERANK_RESULTS, RERANK_TOP_K, RERANK_MIN_SCORE, PASSAGE_SELECTION, HOT_QUERY_MIN_HITS, SERP_REFRESH_INTERVAL, \
+    SERP_REFRESH_AHEAD, CACHE_REFRESH_CONCURRENCY, FALLBACK_ENGINES, LOCAL_INDEX, LOCAL_INDEX_RESULTS, \
+    LOCAL_FUSION_TIMEOUT, LOCAL_INDEX_QUEUE_SIZE, METRICS_DIR, METRICS_SNAPSHOT_INTERVAL, PREWARM_RETRY_DELAY, \
+    PREWARM_MAX_RETRY_DELAY
+from search_engines.cache import PageCache, SerpCache
+from search_engines.compression import CompressionMiddleware
 from search_engines.decorator import atimer
 from search_engines.engines import *
-
-ua = UserAgent()
-FAKE_USER_AGENT = ua.chrome
+from search_engines.jobs import JobQueue
+from search_engines.loop_monitor import LoopMonitor
+from search_engines import metrics, tracing
+from search_engines.metrics import CACHE_HITS, CACHE_MISSES, CACHE_REFRESHES, COLD_START, ENHANCEMENT_FETCH, EXTRACTION, PASSAGE_SCORING, RERANKING, SERIALIZATION, \
+    TIMEOUTS, LOCAL_INDEX_FALLBACKS, LOCAL_INDEX_DROPPED
+from search_engines.fingerprints import next_fingerprint
+from search_engines.health import engine_health
+from search_engines.http_pool import close_sessions
+from search_engines.local_index import shared_index
+from search_engines.persistent_browser import BLOCK_STATUSES
+from search_engines.proxies import proxy_pool, HTTP_SCHEMES
+from search_engines import registry
+from search_engines.output import Highlighter
+from search_engines.pagination import CursorCache, decode_cursor, encode_cursor
+from search_engines.passages import select_passages
+from search_engines.query import cache_key
+from search_engines.rerank import fuse, rerank
+from search_engines.tracing import span
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_FORMAT = "json"
+MSGPACK_FORMAT = "msgpack"
 
 
 def get_local_ip():
@@ -41,36 +80,225 @@ class WSAIO:
 
     def __init__(self):
         self.engine = None
+        self.fallback_engines = []
         self.loop = None
+        self.ready = False
+        self.jobs = JobQueue()
+        self.serp_cache = SerpCache()
+        self.page_cache = PageCache()
+        self.cursors = CursorCache()
+        self._paging = {}
+        '''(pagination id, page) -> task searching the page'''
+        self._refreshing = {}
+        '''(cache, key) -> background refresh task'''
+        self._refresh_slots = {}
+        self._warm_up_retry = None
+        self._live_searches = set()
+        '''live searches going on after the local index answered'''
+        self.local_index = shared_index() if LOCAL_INDEX else None
+        self._indexing = None
+        '''queue of the extracted pages waiting to be indexed'''
+        self._indexer = None
         self.select_search_engine()
-        self.goose = Goose(
-            {
-                "stopwords_class": StopWordsChinese, "browser_user_agent": FAKE_USER_AGENT
-            }
-        )
+        self._goose = None
+
+    @property
+    def goose(self):
+        """The Goose extractor, goose3 is imported on first use."""
+        if self._goose is None:
+            from goose3 import Goose
+            from goose3.text import StopWordsChinese
+
+            self._goose = Goose(
+                {
+                    "stopwords_class": StopWordsChinese, "browser_user_agent": next_fingerprint().user_agent
+                }
+            )
+        return self._goose
+
+    async def warm_up(self, browser: bool = True):
+        """
+        Loads the extractor in a thread while the browser is launched and primed, then marks the service ready.
+        A browser which fails to launch is tried again in the background, after PREWARM_RETRY_DELAY seconds
+        doubled by every failure up to PREWARM_MAX_RETRY_DELAY, and the service is marked ready once it is warm.
+        Cold start time, from the import of this module, is recorded in wsaio_cold_start_seconds.
+        """
+        COLD_START.labels('import').set(IMPORTED_AT - STARTED_AT)
+        warming = time.perf_counter()
+        extractor = asyncio.ensure_future(asyncio.to_thread(lambda: self.goose))
+        warm = await self.warm_browser() if browser and self.needs_browser else True
+        await extractor
+        if warm:
+            self.mark_ready(warming)
+        else:
+            self._warm_up_retry = asyncio.ensure_future(self.retry_warm_up(warming))
+
+    async def warm_browser(self):
+        """Launches and primes the browser, returns False when it failed, the browser then stopped."""
+        try:
+            await self.engine._persistent_browser.warm()
+            return True
+        except Exception as e:
+            logging.error(f"Error occurred when warming up the browser: {e}")
+        try:
+            await self.engine._persistent_browser.stop()
+        except Exception as e:
+            logging.error(f"Error occurred when stopping the browser which failed to warm up: {e}")
+        return False
+
+    async def retry_warm_up(self, warming):
+        delay = PREWARM_RETRY_DELAY
+        while True:
+            await asyncio.sleep(delay)
+            if await self.warm_browser():
+                break
+            delay = min(delay * 2, PREWARM_MAX_RETRY_DELAY)
+        self.mark_ready(warming)
+
+    async def stop_warm_up(self):
+        if self._warm_up_retry is not None:
+            self._warm_up_retry.cancel()
+            await asyncio.gather(self._warm_up_retry, return_exceptions=True)
+            self._warm_up_retry = None
+
+    def mark_ready(self, warming):
+        self.ready = True
+        now = time.perf_counter()
+        COLD_START.labels('warmup').set(now - warming)
+        COLD_START.labels('total').set(now - STARTED_AT)
+        logging.info(f"WebSearchAIO ready, cold start took {now - STARTED_AT:.2f}s")
 
     def select_search_engine(self):
-        match WEB_SEARCH_ENGINE:
-            case 'bing':
-                self.engine = Bing()
-            case 'google':
-                self.engine = Google()
-            case 'duckduckgo':
-                self.engine = Duckduckgo()
-            # add your case here
-
-    async def process_search_result(self, res, session):
+        """
+        Creates WEB_SEARCH_ENGINE and its FALLBACK_ENGINES from the registry, sharing one browser.
+        An engine without browser never falls back to an engine which needs one.
+        """
+        self.engine = registry.create_engine(WEB_SEARCH_ENGINE)
+        self.fallback_engines = []
+        for name in FALLBACK_ENGINES.get(self.engine.name, ()):
+            if name == self.engine.name:
+                continue
+            engine = registry.create_engine(name)
+            if engine.needs_browser and not self.engine.needs_browser:
+                logging.warning(f"{name} needs a browser, it is not a fallback engine of {self.engine.name}")
+                continue
+            engine._persistent_browser = self.engine._persistent_browser
+            self.fallback_engines.append(engine)
+
+    @property
+    def needs_browser(self):
+        return any(engine.needs_browser for engine in [self.engine] + self.fallback_engines)
+
+    @property
+    def engines(self):
+        """The engines which may be searched, by class name."""
+        return {engine.__class__.__name__: engine for engine in [self.engine] + self.fallback_engines}
+
+    def route_engine(self, name: str | None = None):
+        """
+        Returns a fork of the engine to search: the named one, or WEB_SEARCH_ENGINE unless it is degraded,
+        then the first fallback engine which is not. When all of them are degraded WEB_SEARCH_ENGINE is probed.
+        """
+        engine = self.engines.get(name)
+        if engine is None:
+            candidates = [self.engine] + self.fallback_engines
+            engine = next((engine for engine in candidates if not engine_health.is_degraded(engine.__class__.__name__)),
+                          self.engine)
+        engine = engine.fork()
+        engine.ignore_duplicate_urls = self.engine.ignore_duplicate_urls
+        engine.ignore_duplicate_domains = self.engine.ignore_duplicate_domains
+        return engine
+
+    def schedule_refresh(self, cache: str, key, refresh, trigger: str):
+        """
+        Runs the refresh coroutine function in the background, unless the key is already being refreshed.
+        At most CACHE_REFRESH_CONCURRENCY refreshes of each cache run at the same time.
+        """
+        if (cache, key) in self._refreshing:
+            return
+        CACHE_REFRESHES.labels(cache, trigger).inc()
+        if cache not in self._refresh_slots:
+            self._refresh_slots[cache] = asyncio.Semaphore(CACHE_REFRESH_CONCURRENCY)
+
+        async def run():
+            async with self._refresh_slots[cache]:
+                try:
+                    await refresh()
+                except Exception as e:
+                    logging.error(f"Error occurred when refreshing the {cache} cache: {e}")
+
+        task = self._refreshing[(cache, key)] = asyncio.ensure_future(run())
+        task.add_done_callback(lambda _: self._refreshing.pop((cache, key), None))
+
+    async def stop_refreshes(self):
+        tasks = list(self._refreshing.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def refresh_hot_queries(self):
+        """Refreshes the SERPs of frequently searched queries before they become stale."""
+        while True:
+            await asyncio.sleep(SERP_REFRESH_INTERVAL)
+            for key, (query, pages) in self.serp_cache.accesses.hot(HOT_QUERY_MIN_HITS):
+                age = await self.serp_cache.age(key)
+                if age is not None and age > self.serp_cache.ttl * SERP_REFRESH_AHEAD:
+                    self.schedule_refresh('serp', key, partial(self.search_serp, query, pages), 'hot')
+            self.serp_cache.accesses.decay()
+
+    async def extract_page(self, link, session):
+        """
+        Returns the fields extracted from a result page, from the cache when extracted recently.
+        A stale cached page is returned at once and fetched again in the background.
+        """
+        hit = await self.page_cache.get(link)
+        if hit is not None:
+            if hit.stale:
+                CACHE_HITS.labels('content_stale').inc()
+                self.schedule_refresh('content', link, partial(self.refresh_page, link), 'stale')
+            else:
+                CACHE_HITS.labels('content').inc()
+            return hit.value
+
+        CACHE_MISSES.labels('content').inc()
+        return await self.fetch_page(link, session)
+
+    async def refresh_page(self, link):
+        async with aiohttp.ClientSession() as session:
+            await self.fetch_page(link, session)
+
+    async def fetch_page(self, link, session):
+        """
+        Fetches a result page, through a proxy of the pool when PROXIES has http proxies,
+        and returns the fields extracted from it, caching them and queuing them for indexing when LOCAL_INDEX is set.
+        """
+        extracted = {}
+        proxy = proxy_pool.choose(HTTP_SCHEMES)
         try:
-            async with session.get(url=res["link"]) as response:
-                raw_html = await response.text(encoding=response.charset)
+            with ENHANCEMENT_FETCH.time(), span('enhancement_fetch'):
+                started = time.perf_counter()
+                async with session.get(url=link, headers=next_fingerprint().headers(), proxy=proxy) as response:
+                    raw_html = await response.text(encoding=response.charset)
+                if proxy is not None:
+                    if response.status in BLOCK_STATUSES:
+                        proxy_pool.failed(proxy, banned=True)
+                    else:
+                        proxy_pool.succeeded(proxy, time.perf_counter() - started)
+            with EXTRACTION.time(), span('extraction'):
                 extend_snippet = self.goose.extract(raw_html=raw_html)
                 if extend_snippet.title:
-                    res["title"] = extend_snippet.title
+                    extracted["title"] = extend_snippet.title
                 if extend_snippet.cleaned_text:
-                    abstract = extend_snippet.cleaned_text
-                    abstract = abstract.replace("\n", "")
-                    res["snippet"] = abstract
-
+                    extracted["snippet"] = extend_snippet.cleaned_text
+
+        except asyncio.TimeoutError:
+            TIMEOUTS.labels('enhancement_fetch').inc()
+            if proxy is not None:
+                proxy_pool.failed(proxy)
+            logging.error(f"Timeout occurred during HTTP request: {link}")
+        except aiohttp.ClientProxyConnectionError as proxy_error:
+            proxy_pool.failed(proxy)
+            logging.error(f"Proxy Error occurred during HTTP request: {proxy_error}")
         except aiohttp.ClientConnectionError as connect_error:
             logging.error(f"Connection Error occurred during HTTP request: {connect_error}")
         except aiohttp.ClientError as other_error:
@@ -82,51 +310,386 @@ class WSAIO:
         except Exception as e:
             logging.error(f"Unexceptional error occurred: {e}")
 
-        return res
+        if extracted:
+            await self.page_cache.set(link, extracted)
+            if self.local_index is not None and "snippet" in extracted:
+                self.index_page(link, extracted)
+        return extracted
+
+    def index_page(self, link, extracted):
+        """Queues an extracted page to be indexed in the background, unless LOCAL_INDEX_QUEUE_SIZE pages are waiting."""
+        if self._indexer is None:
+            self._indexing = asyncio.Queue(LOCAL_INDEX_QUEUE_SIZE)
+            self._indexer = asyncio.ensure_future(self.run_indexer())
+        try:
+            self._indexing.put_nowait((link, extracted.get("title", ""), extracted["snippet"]))
+        except asyncio.QueueFull:
+            LOCAL_INDEX_DROPPED.inc()
+
+    async def run_indexer(self):
+        """Adds the queued pages to the local index one at a time, in a thread, out of the request path."""
+        while True:
+            link, title, text = await self._indexing.get()
+            try:
+                await asyncio.to_thread(self.local_index.add, link, title, text)
+            except Exception as e:
+                logging.error(f"Error occurred when indexing {link}: {e}")
+            finally:
+                self._indexing.task_done()
+
+    async def stop_indexer(self):
+        if self._indexer is not None:
+            self._indexer.cancel()
+            await asyncio.gather(self._indexer, return_exceptions=True)
+            self._indexer = self._indexing = None
+
+    @staticmethod
+    def focus_snippet(query, text):
+        """Returns the passages of an extracted text relevant to the query, or the whole text on one line."""
+        if not PASSAGE_SELECTION or not query:
+            return text.replace("\n", "")
+        with PASSAGE_SCORING.time(), span('passage_selection', length=len(text)):
+            return select_passages(query, text)
+
+    async def process_search_result(self, res, session, pending=None, query=None):
+        """
+        Replaces the title and snippet of a result with the ones extracted from its page.
+        Results of the local index, with "indexed_at", already hold the passages of their extracted text.
+        :param pending: optional, link -> extraction task, shared to fetch every page only once
+        :param query: optional, keeps the passages of the extracted text relevant to it as snippet
+        """
+        if "indexed_at" in res:
+            return res
+        with span('process_search_result', host=res.get("host", ""), link=res["link"]):
+            if pending is None:
+                extracted = await self.extract_page(res["link"], session)
+            else:
+                task = pending.get(res["link"])
+                if task is None:
+                    task = pending[res["link"]] = asyncio.ensure_future(self.extract_page(res["link"], session))
+                else:
+                    CACHE_HITS.labels('page').inc()
+                extracted = await task
+
+            res.update(extracted)
+            if "snippet" in extracted:
+                res["snippet"] = self.focus_snippet(query, extracted["snippet"])
+            return res
+
+    async def search_result_enhancement(self, search_results, session=None, pending=None, query=None):
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await self.search_result_enhancement(search_results, session, pending, query)
+
+        pending = {} if pending is None else pending
+        coroutines = [self.process_search_result(res, session, pending, query) for res in search_results]
+        return await asyncio.gather(*coroutines)
+
+    async def engine_search(self, query: str, pages: int = SEARCH_ENGINE_RESULTS_PAGES):
+        """
+        Returns the SERP results of a query, from the cache when the normalized query,
+        or a near-duplicate one, was searched recently. Results are copies, safe to enhance in place.
+        Stale cached results are returned at once and searched again in the background.
+        """
+        hit = await self.serp_cache.get(query, pages)
+        if hit is not None:
+            if hit.stale:
+                CACHE_HITS.labels('serp_stale').inc()
+                self.schedule_refresh('serp', self.serp_cache.key(query, pages),
+                                      partial(self.search_serp, query, pages), 'stale')
+            else:
+                CACHE_HITS.labels('serp_near_dup' if hit.near_dup else 'serp').inc()
+            return [dict(res) for res in hit.value]
+
+        CACHE_MISSES.labels('serp').inc()
+        if self.local_index is not None and self.engine.name != 'local':
+            return await self.search_with_local_index(query, pages)
+        return await self.search_serp(query, pages)
+
+    async def search_serp(self, query: str, pages: int = SEARCH_ENGINE_RESULTS_PAGES):
+        search_results, _ = await self.search_live(query, pages)
+        return search_results
 
-    async def search_result_enhancement(self, search_results):
-        async with aiohttp.ClientSession() as session:
-            coroutines = [self.process_search_result(res, session) for res in search_results]
-            return await asyncio.gather(*coroutines)
+    async def search_live(self, query: str, pages: int = SEARCH_ENGINE_RESULTS_PAGES):
+        """
+        Searches the engine, or a fallback while it is degraded, and caches the results, unless banned.
+        Returns the results and whether the engine was banned.
+        """
+        engine = self.route_engine()
+        search_results = list(await engine.search(query, max_pages=pages))
+        if search_results and not engine.is_banned:
+            await self.serp_cache.set(query, [dict(res) for res in search_results], pages)
+            state = engine.pagination_state()
+            if state is not None:
+                await self.cursors.start(self.serp_cache.key(query, pages), state, [res['link'] for res in search_results])
+        return search_results, engine.is_banned
+
+    async def search_with_local_index(self, query: str, pages: int = SEARCH_ENGINE_RESULTS_PAGES):
+        """
+        Searches the engine and the local index at the same time. Returns the results of the engine, fused with
+        the ones of the index when the engine is banned, fails or finds nothing, or the results of the index when
+        the engine is slower than LOCAL_FUSION_TIMEOUT seconds, from the start of its search: it then goes on
+        to fill the cache.
+        """
+        started = time.perf_counter()
+        live = asyncio.ensure_future(self.search_live(query, pages))
+        with span('local_index_search'):
+            local_results = await asyncio.to_thread(self.local_index.search, query, LOCAL_INDEX_RESULTS)
+        if not local_results:
+            return (await live)[0]
+
+        try:
+            search_results, banned = await asyncio.wait_for(
+                asyncio.shield(live), max(0.0, LOCAL_FUSION_TIMEOUT - (time.perf_counter() - started)))
+        except asyncio.TimeoutError:
+            LOCAL_INDEX_FALLBACKS.labels('slow').inc()
+            self._live_searches.add(live)
+            live.add_done_callback(self._live_search_done)
+            return local_results
+        except Exception as e:
+            logging.error(f"Error occurred when searching the engine, answered by the local index: {e}")
+            LOCAL_INDEX_FALLBACKS.labels('error').inc()
+            return local_results
+
+        if banned or not search_results:
+            LOCAL_INDEX_FALLBACKS.labels('banned' if banned else 'empty').inc()
+            return fuse([search_results, local_results])
+        return search_results
+
+    def _live_search_done(self, task):
+        self._live_searches.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Error occurred when searching the engine in the background: {task.exception()}")
+
+    async def next_page(self, state):
+        """
+        Returns the results of the page of a pagination state, and the state of the page after it or None.
+        A page is searched with one navigation, once: cursors sent again, at once or later, share its results.
+        """
+        cached = await self.cursors.page(state)
+        if cached is not None:
+            CACHE_HITS.labels('cursor').inc()
+        else:
+            key = (state['id'], state['page'])
+            task = self._paging.get(key)
+            if task is None:
+                CACHE_MISSES.labels('cursor').inc()
+                task = self._paging[key] = asyncio.ensure_future(self.search_next_page(state))
+                task.add_done_callback(lambda _: self._paging.pop(key, None))
+            cached = await asyncio.shield(task)
+        search_results, next_state = cached
+        return [dict(res) for res in search_results], next_state
+
+    async def search_next_page(self, state):
+        """Searches the page of a pagination state and caches it, unless banned."""
+        engine = self.route_engine(state['engine'])
+        search_results = list(await engine.search_next(state, await self.cursors.links(state)))
+        if not search_results or engine.is_banned:
+            return search_results, None
+        return search_results, await self.cursors.set_page(state, [dict(res) for res in search_results],
+                                                           engine.pagination_state())
+
+    @staticmethod
+    def rerank_results(query: str, search_results, top_k: int = RERANK_TOP_K):
+        """Reorders the results by relevance to the query, keeping the top_k best ones."""
+        with RERANKING.time(), span('rerank', results=len(search_results)):
+            return rerank(query, search_results, top_k, RERANK_MIN_SCORE)
+
+    @staticmethod
+    def add_highlights(query: str, search_results):
+        """Adds the offsets of the query terms in the title and snippet of each result, as "highlights"."""
+        highlighter = Highlighter(query)
+        for res in search_results:
+            res["highlights"] = {field: highlighter.spans(res.get(field)) for field in ("title", "snippet")}
+        return search_results
 
     @atimer()
-    async def asearch(self, query: str, enhance: bool = True):
-        search_results = await self.engine.search(query)
+    async def asearch(self, query: str, enhance: bool = True, rerank: bool = RERANK_RESULTS,
+                      top_k: int = RERANK_TOP_K):
+        search_results = await self.engine_search(query)
         if enhance:
-            return await self.search_result_enhancement(search_results)
+            search_results = await self.search_result_enhancement(search_results, query=query)
+        if rerank:
+            search_results = self.rerank_results(query, search_results, top_k)
         return search_results
 
-    async def search(self, query: str = Query(..., description="Query", examples=["string"])):
+    @atimer()
+    async def asearch_page(self, state, enhance: bool = True, rerank: bool = RERANK_RESULTS,
+                           top_k: int = RERANK_TOP_K):
+        """Searches the page of a pagination state, returns its results and the state of the next page."""
+        search_results, next_state = await self.next_page(state)
+        if enhance:
+            search_results = await self.search_result_enhancement(search_results, query=state['query'])
+        if rerank:
+            search_results = self.rerank_results(state['query'], search_results, top_k)
+        return search_results, next_state
+
+    async def abatch_search(self, queries: list[str], enhance: bool = True, rerank: bool = RERANK_RESULTS,
+                            top_k: int = RERANK_TOP_K):
+        """
+        Searches several queries with a shared concurrency budget.
+        Queries with the same normalized form are searched once and every result page is fetched once per batch.
+        Returns a dict mapping each distinct query to its search results.
+        """
+        unique_queries = {}
+        for query in queries:
+            unique_queries.setdefault(cache_key(query), query)
+        CACHE_HITS.labels('query').inc(len(queries) - len(unique_queries))
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async with aiohttp.ClientSession() as session:
+            pending = {}
+
+            async def search_one(query):
+                with span('batch_query', query=query):
+                    try:
+                        async with semaphore:
+                            search_results = await self.engine_search(query)
+                    except Exception as e:
+                        logging.error(f"Error occurred when searching '{query}' in batch: {e}")
+                        return []
+                    if enhance:
+                        search_results = await self.search_result_enhancement(search_results, session, pending, query)
+                    if rerank:
+                        search_results = self.rerank_results(query, search_results, top_k)
+                    return search_results
+
+            results = dict(zip(unique_queries, await asyncio.gather(*map(search_one, unique_queries.values()))))
+
+        return {query: results[cache_key(query)] for query in queries}
+
+    async def run_search_job(self, job, query: str, pages: int, enhance: bool = True, rerank: bool = RERANK_RESULTS,
+                             top_k: int = RERANK_TOP_K):
+        """
+        Searches in the background, publishing the SERP results first and then every enhanced result.
+        Re-ranked results are published last.
+        """
+        search_results = await self.engine_search(query, pages)
+        await job.update(results=search_results)
+        if not search_results:
+            return
+
+        if enhance:
+            async with aiohttp.ClientSession() as session:
+                pending = {}
+                tasks = [self.process_search_result(res, session, pending, query) for res in search_results]
+                for task in asyncio.as_completed(tasks):
+                    await task
+                    await job.update(results=search_results)
+        if rerank:
+            await job.update(results=self.rerank_results(query, search_results, top_k))
+
+    async def search(self, query: str = Query(..., description="Query", examples=["string"]),
+                     rerank: bool = Query(RERANK_RESULTS, description="Reorder the results by relevance to the query"),
+                     top_k: int = Query(RERANK_TOP_K, ge=0, description="Results kept after re-ranking, 0 keeps all"),
+                     highlight: bool = Query(False, description="Add the offsets of the query terms in each result"),
+                     fields: str | None = Query(None, description="Comma separated result fields to return",
+                                                examples=["link,title"]),
+                     cursor: str | None = Query(None, description="Cursor of the next page, from a previous response"),
+                     response_format: str = Query(JSON_FORMAT, alias="format", pattern="^(json|msgpack)$",
+                                                  description="Response body format")):
         """
         Use a search engine to perform a search and return a list of search results.
-        Args: query: The search query string.
-        Returns: A list of search results, each containing “title”, “link”, and “snippet” fields.
+        Args: query: The search query string. rerank: Reorder by relevance. top_k: Results kept after re-ranking.
+              highlight: Add "highlights", the [start, end) offsets of the query terms in "title" and "snippet".
+              fields: Result fields to return, all by default. format: json, or msgpack.
+              cursor: The "cursor" of a previous response for the same query, to get the next page of results.
+        Returns: A list of search results, each containing “title”, “link”, and “snippet” fields,
+                 and the cursor of the next page, null on the last page.
         """
+        if response_format == MSGPACK_FORMAT and msgpack is None:
+            return error_response(406, "msgpack is not installed on this server, please use the json format.")
         if not query:
-            return ListResultResponse(
-                data=[{
-                    "snippet": "No input obtained, this may be caused by illegal characters in the question, please try other keywords.",
-                    "title": "The search engine is experiencing some glitches",
-                    "link": "https://www.bing.com",
-                }]
-            )
+            return render({"code": 200, "msg": "success", "data": project([{
+                "snippet": "No input obtained, this may be caused by illegal characters in the question, please try other keywords.",
+                "title": "The search engine is experiencing some glitches",
+                "link": "https://www.bing.com",
+            }], fields)}, response_format)
 
         self.engine.ignore_duplicate_urls = True  # avoid duplicate url results
-        print(query)
-        search_results = await self.asearch(query)
+        logging.info(f"Search: {query}")
+        if cursor:
+            try:
+                state = decode_cursor(cursor, self.engines)
+            except ValueError as e:
+                return error_response(400, f"{e}, please search again without it.")
+            if cache_key(state["query"]) != cache_key(query):
+                return error_response(400, "The cursor belongs to another query.")
+            search_results, next_state = await self.asearch_page(state, rerank=rerank, top_k=top_k)
+        else:
+            search_results = await self.asearch(query, rerank=rerank, top_k=top_k)
+            next_state = await self.cursors.state(self.serp_cache.key(query, SEARCH_ENGINE_RESULTS_PAGES))
 
         if not search_results:
-            return ListResultResponse(
-                data=[{
-                    "snippet": "No web search results obtained, please try other keywords and wait for a while before trying again",
-                    "title": "The search engine is experiencing some glitches",
-                    "link": "https://www.bing.com",
-                }]
-            )
+            return render({"code": 200, "msg": "success", "data": project([{
+                "snippet": "No web search results obtained, please try other keywords and wait for a while before trying again",
+                "title": "The search engine is experiencing some glitches",
+                "link": "https://www.bing.com",
+            }], fields)}, response_format)
         else:
-            return ListResultResponse(
-                data=search_results
-            )
+            if highlight:
+                self.add_highlights(query, search_results)
+            with SERIALIZATION.time(), span('serialization'):
+                return render({"code": 200, "msg": "success", "data": project(search_results, fields),
+                               "cursor": encode_cursor(next_state) if next_state else None}, response_format)
+
+    async def batch_search(self, request: "BatchSearchRequest",
+                           response_format: str = Query(JSON_FORMAT, alias="format", pattern="^(json|msgpack)$",
+                                                        description="Response body format")):
+        """
+        Search several queries in one call.
+        Args: request: The queries to search and whether to enhance their results. format: json, or msgpack.
+        Returns: One item per query, in request order, each containing "query" and "results" fields.
+        """
+        if response_format == MSGPACK_FORMAT and msgpack is None:
+            return error_response(406, "msgpack is not installed on this server, please use the json format.")
+        queries = [query.strip() for query in request.queries]
+        self.engine.ignore_duplicate_urls = True  # avoid duplicate url results
+        logging.info(f"Batch search submitted: {queries}")
+        search_results = await self.abatch_search([query for query in queries if query], request.enhance,
+                                                  request.rerank, request.top_k)
+        if request.highlight:
+            for query, results in search_results.items():
+                self.add_highlights(query, results)
+
+        with SERIALIZATION.time(), span('serialization'):
+            return render({"code": 200, "msg": "success", "data": [
+                {"query": query, "results": project(search_results.get(query, []), request.fields)}
+                for query in queries
+            ]}, response_format)
+
+    async def submit_job(self, request: "JobRequest"):
+        """
+        Start a search job, for deep searches which may outlast the client timeout.
+        Args: request: The query, the number of pages to search and whether to enhance the results.
+        Returns: The queued job, poll /jobs/{id} for its partial and final results.
+        """
+        query = request.query.strip()
+        if not query:
+            return error_response(400, "No input obtained, please try other keywords.")
+
+        self.engine.ignore_duplicate_urls = True  # avoid duplicate url results
+        logging.info(f"Search job submitted: {query}")
+        try:
+            job = await self.jobs.submit(lambda job: self.run_search_job(job, query, request.pages, request.enhance,
+                                                                        request.rerank, request.top_k))
+        except asyncio.QueueFull:
+            return error_response(503, "Too many search jobs are waiting, please try again later.")
+        return JobResponse(data=job.to_dict())
+
+    async def get_job(self, job_id: str,
+                      wait: float = Query(0, ge=0, le=JOB_POLL_TIMEOUT,
+                                          description="Seconds to wait for a change of the job (long-poll)"),
+                      version: int | None = Query(None, description="Job version already seen by the client")):
+        """
+        Poll a search job.
+        Args: job_id: The job id. wait: Seconds to wait for a newer version. version: The last version seen.
+        Returns: The job status with its partial or final results.
+        """
+        state = await self.jobs.get(job_id, wait, version)
+        if state is None:
+            return error_response(404, "Search job not found, it may have expired.")
+        return JobResponse(data=state)
 
 
 class BaseResponse(BaseModel):
@@ -142,8 +705,21 @@ class BaseResponse(BaseModel):
         }
 
 
+class SearchResult(BaseModel):
+    host: str = pydantic.Field("", description="Host of the result link")
+    link: str = pydantic.Field("", description="Result link")
+    title: str = pydantic.Field("", description="Title of the result")
+    snippet: str = pydantic.Field("", description="Text of the result, extracted from its page when enhanced")
+    highlights: dict[str, list[list[int]]] | None = pydantic.Field(
+        None, description="[start, end) offsets of the query terms in title and snippet, when asked")
+
+    class Config:
+        extra = "allow"
+
+
 class ListResultResponse(BaseResponse):
-    data: list[dict[str, Any]] = pydantic.Field(..., description="List of search results")
+    data: list[SearchResult] = pydantic.Field(..., description="List of search results")
+    cursor: str | None = pydantic.Field(None, description="Cursor of the next page, null on the last page")
 
     class Config:
         json_schema_extra = {
@@ -151,16 +727,212 @@ class ListResultResponse(BaseResponse):
                 "code": 200,
                 "msg": "success",
                 "data": [{'host': 'host', 'link': 'url', 'title': 'string', 'snippet': 'string'}],
+                "cursor": "string",
+            }
+        }
+
+
+class BatchSearchRequest(BaseModel):
+    queries: list[str] = pydantic.Field(..., min_length=1, max_length=BATCH_MAX_QUERIES,
+                                        description="Queries to search")
+    enhance: bool = pydantic.Field(True, description="Replace snippets with the text extracted from result pages")
+    rerank: bool = pydantic.Field(RERANK_RESULTS, description="Reorder the results by relevance to the query")
+    top_k: int = pydantic.Field(RERANK_TOP_K, ge=0, description="Results kept after re-ranking, 0 keeps all")
+    highlight: bool = pydantic.Field(False, description="Add the offsets of the query terms in each result")
+    fields: str | None = pydantic.Field(None, description="Comma separated result fields to return")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "queries": ["string", "string"],
+                "enhance": True,
+                "rerank": True,
+                "top_k": 5,
+                "highlight": False,
+                "fields": "link,title,snippet",
+            }
+        }
+
+
+class QueryResults(BaseModel):
+    query: str = pydantic.Field(..., description="Query")
+    results: list[SearchResult] = pydantic.Field(..., description="Search results of the query")
+
+
+class BatchResultResponse(BaseResponse):
+    data: list[QueryResults] = pydantic.Field(..., description="Search results of each query")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "code": 200,
+                "msg": "success",
+                "data": [{
+                    "query": "string",
+                    "results": [{'host': 'host', 'link': 'url', 'title': 'string', 'snippet': 'string'}],
+                }],
+            }
+        }
+
+
+class JobRequest(BaseModel):
+    query: str = pydantic.Field(..., description="Query")
+    pages: int = pydantic.Field(1, ge=1, le=JOB_MAX_PAGES, description="Number of result pages to search")
+    enhance: bool = pydantic.Field(True, description="Replace snippets with the text extracted from result pages")
+    rerank: bool = pydantic.Field(RERANK_RESULTS, description="Reorder the results by relevance to the query")
+    top_k: int = pydantic.Field(RERANK_TOP_K, ge=0, description="Results kept after re-ranking, 0 keeps all")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "query": "string",
+                "pages": 3,
+                "enhance": True,
+                "rerank": True,
+                "top_k": 10,
+            }
+        }
+
+
+class JobResponse(BaseResponse):
+    data: dict[str, Any] = pydantic.Field(..., description="Search job")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "code": 200,
+                "msg": "success",
+                "data": {
+                    "id": "string",
+                    "status": "running",
+                    "version": 2,
+                    "results": [{'host': 'host', 'link': 'url', 'title': 'string', 'snippet': 'string'}],
+                    "error": None,
+                    "created_at": 0.0,
+                    "finished_at": None,
+                },
             }
         }
 
 
+class EnginesResponse(BaseResponse):
+    data: list[dict[str, Any]] = pydantic.Field(..., description="Search engines with their capabilities")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "code": 200,
+                "msg": "success",
+                "data": [{"name": "bing", "needs_browser": True, "predictable_pagination": True, "rate_limit": None,
+                          "rate_burst": 3, "max_concurrency": 3, "opt_in": False, "block_selectors": ["#b_captcha"],
+                          "block_urls": ["/captcha"], "searched": True, "degraded": False}],
+            }
+        }
+
+
+def error_response(code: int, msg: str):
+    return JSONResponse(status_code=code, content=BaseResponse(code=code, msg=msg).model_dump())
+
+
+def project(search_results, fields: str | None):
+    """Keeps the comma separated fields of each result, all of them when fields is empty."""
+    keys = [key.strip() for key in (fields or "").split(",") if key.strip()]
+    if not keys:
+        return search_results
+    return [{key: res[key] for key in keys if key in res} for res in search_results]
+
+
+def render(payload, response_format: str = JSON_FORMAT):
+    """
+    Serializes a payload built from trusted dicts, skipping the validation of the response model,
+    with orjson when installed, or msgpack when asked.
+    """
+    if response_format == MSGPACK_FORMAT:
+        return Response(content=msgpack.packb(payload, use_bin_type=True), media_type="application/msgpack")
+    if orjson is not None:
+        return Response(content=orjson.dumps(payload), media_type="application/json")
+    return JSONResponse(content=payload)
+
+
 async def document():
     return RedirectResponse(url="/docs")
 
 
+async def readiness():
+    """Returns 200 once the browser is warmed up, 503 before."""
+    if not wsaio.ready:
+        return error_response(503, "warming up")
+    return BaseResponse(msg="ready")
+
+
+async def trace_middleware(request: Request, call_next):
+    """Traces the request when asked by ?trace=1, an X-Trace header or a sampled traceparent header."""
+    if not tracing.is_requested(request.query_params.get("trace"), request.headers):
+        return await call_next(request)
+
+    with tracing.start_trace(f"{request.method} {request.url.path}",
+                             request.headers.get("traceparent")) as trace:
+        response = await call_next(request)
+    response.headers["Server-Timing"] = trace.server_timing()
+    response.headers["traceparent"] = tracing.traceparent(trace)
+    tracing.export(trace)
+    return response
+
+
+async def engines_endpoint():
+    """Lists the engines which can be searched, with their capabilities and whether they are degraded."""
+    searched = wsaio.engines
+    data = []
+    for name in registry.engine_names():
+        try:
+            engine_class = registry.engine_class(name)
+        except Exception as e:
+            logging.error(f"Error occurred when loading the search engine {name}: {e}")
+            continue
+        data.append(dict(engine_class.capabilities(), name=name, searched=engine_class.__name__ in searched,
+                         degraded=engine_health.is_degraded(engine_class.__name__)))
+    return EnginesResponse(data=data)
+
+
+async def metrics_endpoint():
+    content = metrics.render() if METRICS_DIR is None else await metrics.render_all(METRICS_DIR)
+    return Response(content=content, media_type=metrics.CONTENT_TYPE)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await loop_monitor.start()
+    snapshots = None
+    if METRICS_DIR is not None:
+        snapshots = asyncio.ensure_future(metrics.write_snapshots(METRICS_DIR, METRICS_SNAPSHOT_INTERVAL))
+    refresher = asyncio.ensure_future(wsaio.refresh_hot_queries())
+    warming = None
+    if not PREWARM_BROWSER:
+        await wsaio.warm_up(browser=False)
+    elif PREWARM_IN_BACKGROUND:
+        warming = asyncio.ensure_future(wsaio.warm_up())
+    else:
+        await wsaio.warm_up()
+
+    yield
+
+    if warming is not None:
+        warming.cancel()
+    await wsaio.stop_warm_up()
+    refresher.cancel()
+    await wsaio.stop_refreshes()
+    await wsaio.jobs.stop()
+    await wsaio.stop_indexer()
+    await wsaio.engine._persistent_browser.stop()
+    await close_sessions()
+    await loop_monitor.stop()
+    if snapshots is not None:
+        snapshots.cancel()
+        await asyncio.gather(snapshots, return_exceptions=True)
+
+
 # init fastapi
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 if OPEN_CROSS_DOMAIN:
     app.add_middleware(
         CORSMiddleware,
@@ -168,14 +940,25 @@ if OPEN_CROSS_DOMAIN:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Server-Timing", "traceparent"],
     )
+app.middleware("http")(trace_middleware)
+app.add_middleware(CompressionMiddleware)
 
 # init engine
 wsaio = WSAIO()
+loop_monitor = LoopMonitor()
 
 # add route
 app.post('/search', response_model=ListResultResponse, summary='get search results')(wsaio.search)
+app.post('/search/batch', response_model=BatchResultResponse, summary='get search results of several queries')(
+    wsaio.batch_search)
+app.post('/jobs', response_model=JobResponse, summary='start a search job')(wsaio.submit_job)
+app.get('/jobs/{job_id}', response_model=JobResponse, summary='poll a search job')(wsaio.get_job)
 app.get("/", response_model=BaseResponse, summary="swagger Document")(document)
+app.get("/metrics", include_in_schema=False)(metrics_endpoint)
+app.get("/ready", response_model=BaseResponse, summary="readiness probe")(readiness)
+app.get("/engines", response_model=EnginesResponse, summary="list the search engines")(engines_endpoint)
 
 
 # launch api
@@ -187,6 +970,8 @@ def api_start(host, port, **kwargs):
         uvicorn.run(app, host=host, port=port)
 
 
+IMPORTED_AT = time.perf_counter()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Web Search Engine All in One')
     # parser.add_argument("--host", type=str, default=get_local_ip())